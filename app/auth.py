@@ -1,12 +1,30 @@
 # app/auth.py
 import os
 import time
-from datetime import datetime, timedelta, timezone
+import asyncio
+import hmac
+import hashlib
+import secrets
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
 
-from jose import jwt, JWTError
+import bcrypt
+import jwt  # PyJWT (OpenSSL-backed HMAC via cryptography)
+from jwt import InvalidTokenError as JWTError
 from passlib.context import CryptContext
 from dotenv import load_dotenv
 
+# Argon2id for new password hashes (optional; bcrypt otherwise)
+try:
+    from argon2 import PasswordHasher  # type: ignore
+    from argon2 import exceptions as argon2_exceptions  # type: ignore
+except Exception:
+    PasswordHasher = None  # type: ignore
+    argon2_exceptions = None  # type: ignore
+
 load_dotenv()
 
 # -------------------------------------------------------------------
@@ -15,29 +33,140 @@ load_dotenv()
 JWT_SECRET = os.getenv("JWT_SECRET", "devsecret")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 
+# Encode the secret once and reuse one PyJWT instance instead of the
+# module-level helpers (which re-encode the str key on every call).
+_JWT_SECRET_BYTES = JWT_SECRET.encode("utf-8")
+_JWT_ALGORITHMS = [JWT_ALGORITHM]
+_jwt = jwt.PyJWT()
+
 # Access token defaults to 8 hours
 ACCESS_TOKEN_EXPIRE_MINUTES = int(
     os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "480")
 )
 
-# Password hashing context
+# bcrypt cost factor (2^rounds key-schedule iterations)
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "10"))
+
+# Argon2id cost: 64 MiB, t=3, p=4 lands around 100-250 ms on typical server cores;
+# tune per host so one hash stays in that band.
+ARGON2_TIME_COST = int(os.getenv("ARGON2_TIME_COST", "3"))
+ARGON2_MEMORY_KIB = int(os.getenv("ARGON2_MEMORY_KIB", "65536"))
+ARGON2_PARALLELISM = int(os.getenv("ARGON2_PARALLELISM", "4"))
+
+_ARGON2 = (
+    PasswordHasher(
+        time_cost=ARGON2_TIME_COST,
+        memory_cost=ARGON2_MEMORY_KIB,
+        parallelism=ARGON2_PARALLELISM,
+    )
+    if PasswordHasher is not None
+    else None
+)
+
+# Legacy hashing context: only consulted for hashes bcrypt can't verify directly
 pwd_context = CryptContext(
     schemes=["bcrypt"],
-    deprecated="auto"
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
 )
 
+# Dedicated pool so hashing never runs on the event loop (bcrypt and argon2-cffi
+# release the GIL, so threads hash in parallel without process-pool pickling)
+_PWD_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="pwd")
+
 
 # -------------------------------------------------------------------
 # PASSWORD HASHING
 # -------------------------------------------------------------------
+_BCRYPT_PREFIXES = ("$2a$", "$2b$", "$2y$")
+_ARGON2_PREFIX = "$argon2"
+
+
+def _bcrypt_secret(password: str) -> bytes:
+    # bcrypt only uses the first 72 bytes; truncate explicitly like passlib did
+    return password.encode("utf-8")[:72]
+
+
 def hash_password(password: str) -> str:
-    """Hash password using bcrypt."""
-    return pwd_context.hash(password)
+    """Hash password using Argon2id (bcrypt when argon2-cffi isn't installed)."""
+    if _ARGON2 is not None:
+        return _ARGON2.hash(password)
+    return bcrypt.hashpw(_bcrypt_secret(password), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)).decode("utf-8")
+
+
+# Short-lived cache of *successful* verifications so repeat checks of the same
+# credential (e.g. step-up re-auth) skip bcrypt. Keys are HMACs under a
+# per-process random key, so no plaintext is retained. A password change
+# yields a new hash and therefore a new key; failures are never cached.
+_VERIFY_CACHE: "OrderedDict[bytes, float]" = OrderedDict()
+_VERIFY_CACHE_MAX = 256
+_VERIFY_CACHE_TTL = 60.0
+_VERIFY_CACHE_KEY = secrets.token_bytes(32)
+_VERIFY_CACHE_LOCK = threading.Lock()
+
+
+def _verify_cache_key(plain: str, hashed: str) -> bytes:
+    msg = plain.encode("utf-8") + b"\x00" + hashed.encode("utf-8")
+    return hmac.new(_VERIFY_CACHE_KEY, msg, hashlib.sha256).digest()
 
 
 def verify_password(plain: str, hashed: str) -> bool:
     """Verify password == hashed."""
-    return pwd_context.verify(plain, hashed)
+    if not hashed:
+        return False
+
+    key = _verify_cache_key(plain, hashed)
+    with _VERIFY_CACHE_LOCK:
+        expires = _VERIFY_CACHE.get(key)
+        if expires is not None:
+            if expires > time.monotonic():
+                _VERIFY_CACHE.move_to_end(key)
+                return True
+            del _VERIFY_CACHE[key]
+
+    try:
+        if hashed.startswith(_ARGON2_PREFIX):
+            if _ARGON2 is None:
+                return False
+            try:
+                ok = _ARGON2.verify(hashed, plain)
+            except argon2_exceptions.VerificationError:
+                ok = False
+        elif hashed.startswith(_BCRYPT_PREFIXES):
+            ok = bcrypt.checkpw(_bcrypt_secret(plain), hashed.encode("utf-8"))
+        else:
+            ok = pwd_context.verify(plain, hashed)
+    except ValueError:
+        # malformed / unrecognised hash
+        return False
+
+    if ok:
+        with _VERIFY_CACHE_LOCK:
+            _VERIFY_CACHE[key] = time.monotonic() + _VERIFY_CACHE_TTL
+            if len(_VERIFY_CACHE) > _VERIFY_CACHE_MAX:
+                _VERIFY_CACHE.popitem(last=False)
+    return ok
+
+
+@functools.cache
+def dummy_password_hash() -> str:
+    """
+    Hash (current scheme and cost) of a throwaway secret. Logins for unknown
+    accounts verify against it so they take as long as real ones.
+    """
+    return hash_password(secrets.token_urlsafe(16))
+
+
+async def hash_password_async(password: str) -> str:
+    """Hash password in the password thread pool (safe for async handlers)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_PWD_POOL, hash_password, password)
+
+
+async def verify_password_async(plain: str, hashed: str) -> bool:
+    """Verify password in the password thread pool (safe for async handlers)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_PWD_POOL, verify_password, plain, hashed)
 
 
 # -------------------------------------------------------------------
@@ -57,20 +186,21 @@ def create_access_token(
     if expires_delta is None:
         expires_delta = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
 
-    expire_at = datetime.now(timezone.utc) + expires_delta
-    expire_ts = int(expire_at.timestamp())
+    # exp/iat are UNIX timestamps: one clock read covers both
+    now_ts = int(time.time())
+    expire_ts = now_ts + int(expires_delta.total_seconds())
 
     payload = {
         "sub": str(subject),
         "exp": expire_ts,
-        "iat": int(time.time()),
+        "iat": now_ts,
         "type": "access",
     }
 
     if additional_claims:
         payload.update(additional_claims)
 
-    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    return _jwt.encode(payload, _JWT_SECRET_BYTES, algorithm=JWT_ALGORITHM)
 
 
 # -------------------------------------------------------------------
@@ -80,16 +210,57 @@ def create_refresh_token(subject: str) -> str:
     """Long-lived refresh token (default 30 days)."""
 
     expires = timedelta(days=30)
-    expire_at = datetime.now(timezone.utc) + expires
+    now_ts = int(time.time())
 
     payload = {
         "sub": str(subject),
-        "exp": int(expire_at.timestamp()),
-        "iat": int(time.time()),
+        "exp": now_ts + int(expires.total_seconds()),
+        "iat": now_ts,
         "type": "refresh",
     }
 
-    return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALGORITHM)
+    return _jwt.encode(payload, _JWT_SECRET_BYTES, algorithm=JWT_ALGORITHM)
+
+
+# -------------------------------------------------------------------
+# VERIFIED PAYLOAD CACHE
+# -------------------------------------------------------------------
+# Small in-process LRU of already-verified tokens so repeated calls for the
+# same bearer token skip the HMAC check + JSON parse. Keys are BLAKE2b digests
+# of the raw token; on a hit only `exp` is re-checked.
+_TOKEN_CACHE: "OrderedDict[bytes, tuple[dict, int]]" = OrderedDict()
+_CACHE_MAX = 4096
+_TOKEN_CACHE_LOCK = threading.Lock()
+
+
+def _verified_payload(token: str) -> dict | None:
+    """
+    Return the verified payload for token, or None if invalid/expired.
+    """
+    key = hashlib.blake2b(token.encode("utf-8"), digest_size=16).digest()
+
+    with _TOKEN_CACHE_LOCK:
+        hit = _TOKEN_CACHE.get(key)
+        if hit is not None:
+            payload, exp = hit
+            if exp > time.time():
+                _TOKEN_CACHE.move_to_end(key)
+                return payload
+            del _TOKEN_CACHE[key]
+
+    try:
+        payload = _jwt.decode(token, _JWT_SECRET_BYTES, algorithms=_JWT_ALGORITHMS)
+    except JWTError:
+        return None
+
+    exp = payload.get("exp")
+    if isinstance(exp, (int, float)):
+        with _TOKEN_CACHE_LOCK:
+            _TOKEN_CACHE[key] = (payload, int(exp))
+            _TOKEN_CACHE.move_to_end(key)
+            if len(_TOKEN_CACHE) > _CACHE_MAX:
+                _TOKEN_CACHE.popitem(last=False)
+    return payload
 
 
 # -------------------------------------------------------------------
@@ -100,22 +271,20 @@ def decode_access_token(token: str) -> str | None:
     Validates and decodes token.
     Returns user_id (subject) or None if invalid.
     """
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload.get("sub")
-    except JWTError:
+    payload = _verified_payload(token)
+    if payload is None:
         return None
+    return payload.get("sub")
 
 
 def validate_token_type(token: str, token_type: str) -> bool:
     """
     Enforce 'access' or 'refresh' type.
     """
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-        return payload.get("type") == token_type
-    except JWTError:
+    payload = _verified_payload(token)
+    if payload is None:
         return False
+    return payload.get("type") == token_type
 
 
 # -------------------------------------------------------------------
@@ -125,7 +294,7 @@ def decode_token_full(token: str) -> dict | None:
     """
     Return entire payload dict (sub, exp, type etc.)
     """
-    try:
-        return jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-    except JWTError:
+    payload = _verified_payload(token)
+    if payload is None:
         return None
+    return dict(payload)
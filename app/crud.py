@@ -8,18 +8,40 @@ or plain Python dicts/lists where appropriate.
 
 This file is framework-agnostic (works for Quart/async Flask) and avoids any
 web-specific behavior. Add more functions as you need.
+
+Writes don't `refresh()` after commit: sessions use expire_on_commit=False, and
+everything the database fills in (autoincrement PKs, the server-default created_at /
+generated_at) comes back from INSERT ... RETURNING via the models' eager_defaults.
+A new server-side default needs eager_defaults on its model, or a refresh() here.
 """
 from __future__ import annotations
-from typing import Optional, List, Dict, Any, Tuple
+from typing import Optional, List, Dict, Any, Tuple, AsyncIterator
 from uuid import uuid4
-from datetime import datetime, timezone
-
-from sqlalchemy import select, update, delete, func
+import os
+import json
+import time
+import secrets
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import select, insert, update, delete, func, bindparam, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from . import models
 
 
+# -----------------------
+# Prebuilt statements (hot lookups)
+# -----------------------
+# Built once at import so each call skips constructing the select() and
+# always hits SQLAlchemy's compiled-statement cache.
+_GET_AGENT_BY_EMAIL = select(models.Agent).where(func.lower(models.Agent.email) == bindparam("email"))
+_GET_BOOKING_BY_REF = select(models.Booking).where(models.Booking.booking_ref == bindparam("booking_ref"))
+_GET_SUMMARY_BY_CACHE_KEY = select(models.Summary).where(models.Summary.cache_key == bindparam("cache_key"))
+
+
 # -----------------------
 # Agents
 # -----------------------
@@ -33,20 +55,18 @@ async def create_agent(
     a = models.Agent(agent_id=agent_id, email=email.lower(), password_hash=password_hash, name=name)
     session.add(a)
     await session.commit()
-    await session.refresh(a)
     return a
 
 
 async def get_agent_by_email(session: AsyncSession, email: str) -> Optional[models.Agent]:
-    q = select(models.Agent).where(models.Agent.email == email.lower())
-    r = await session.execute(q)
+    # lower(email) matches the ix_agent_email_lower functional index
+    r = await session.execute(_GET_AGENT_BY_EMAIL, {"email": email.lower()})
     return r.scalars().first()
 
 
 async def get_agent_by_id(session: AsyncSession, agent_id: str) -> Optional[models.Agent]:
-    q = select(models.Agent).where(models.Agent.agent_id == agent_id)
-    r = await session.execute(q)
-    return r.scalars().first()
+    # PK lookup: served from the identity map when already loaded in this session
+    return await session.get(models.Agent, agent_id)
 
 
 # -----------------------
@@ -72,19 +92,15 @@ async def create_or_update_customer(
             existing.phone = phone
         session.add(existing)
         await session.commit()
-        await session.refresh(existing)
         return existing
     c = models.Customer(customer_id=customer_id, name=name, email=email, phone=phone)
     session.add(c)
     await session.commit()
-    await session.refresh(c)
     return c
 
 
 async def get_customer_by_id(session: AsyncSession, customer_id: str) -> Optional[models.Customer]:
-    q = select(models.Customer).where(models.Customer.customer_id == customer_id)
-    r = await session.execute(q)
-    return r.scalars().first()
+    return await session.get(models.Customer, customer_id)
 
 
 # -----------------------
@@ -105,8 +121,7 @@ async def save_message(
     """
     if message_id is None:
         message_id = str(uuid4())
-    if created_at is None:
-        created_at = datetime.now(timezone.utc)
+    # created_at=None -> DEFAULT now() in the INSERT (returned via eager_defaults)
     m = models.Message(
         message_id=message_id,
         customer_id=customer_id,
@@ -118,19 +133,110 @@ async def save_message(
     )
     session.add(m)
     await session.commit()
-    await session.refresh(m)
+    _forget_agent_customers(agent_id)
     return m
 
 
-async def get_messages(
-    session: AsyncSession,
+async def save_messages_bulk(session: AsyncSession, rows: List[Dict[str, Any]]) -> List[str]:
+    """
+    Insert many messages with one multi-row INSERT and a single commit.
+    Each row needs customer_id, sender and message; message_id, created_at,
+    agent_id and meta are filled in when missing. Returns the message_ids in order.
+    """
+    if not rows:
+        return []
+    now = datetime.now(timezone.utc)
+    values = [_message_values(row, now) for row in rows]
+    await session.execute(insert(models.Message), values)
+    await session.commit()
+    _forget_agent_customers(*(v["agent_id"] for v in values))
+    return [v["message_id"] for v in values]
+
+
+def _message_values(row: Dict[str, Any], created_default: Any) -> Dict[str, Any]:
+    return {
+        "message_id": row.get("message_id") or str(uuid4()),
+        "customer_id": row["customer_id"],
+        "agent_id": row.get("agent_id"),
+        "sender": row["sender"],
+        "message": row["message"],
+        "meta": row.get("meta") or {},
+        "created_at": row.get("created_at") or created_default,
+    }
+
+
+_INGEST_CHUNK = 1000
+
+
+async def ingest_messages(session: AsyncSession, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Idempotent ingestion for webhooks/retries: one INSERT ... ON CONFLICT (message_id)
+    DO NOTHING for all rows, so duplicates are dropped by the database instead of a
+    SELECT per message. Rows take the same keys as save_messages_bulk; a missing
+    created_at becomes now() in the statement. Returns only the rows actually inserted.
+    """
+    inserted: List[Dict[str, Any]] = []
+    # chunked to stay well under the 32767 bind-parameter limit per statement
+    for i in range(0, len(rows), _INGEST_CHUNK):
+        stmt = (
+            pg_insert(models.Message)
+            .values([_message_values(row, func.now()) for row in rows[i:i + _INGEST_CHUNK]])
+            .on_conflict_do_nothing(index_elements=["message_id"])
+            .returning(*models.Message.__table__.columns)
+        )
+        r = await session.execute(stmt)
+        inserted.extend(dict(m) for m in r.mappings().all())
+    if rows:
+        await session.commit()
+        _forget_agent_customers(*(m["agent_id"] for m in inserted))
+    return inserted
+
+
+_MESSAGE_COPY_COLUMNS = ["message_id", "customer_id", "agent_id", "sender", "message", "meta", "created_at"]
+
+
+async def bulk_copy_messages(session: AsyncSession, rows: List[Dict[str, Any]]) -> int:
+    """
+    Backfill/import path: stream rows into the message table with asyncpg's
+    binary COPY. Much faster than INSERT for large imports, but bypasses ORM
+    events and model validation, so callers must pass clean rows (same keys as
+    save_messages_bulk). Requires the asyncpg driver. Returns rows copied.
+    """
+    if not rows:
+        return 0
+    now = datetime.now(timezone.utc)
+    records = [
+        (
+            row.get("message_id") or str(uuid4()),
+            row["customer_id"],
+            row.get("agent_id"),
+            row["sender"],
+            row["message"],
+            json.dumps(row.get("meta") or {}),
+            row.get("created_at") or now,
+        )
+        for row in rows
+    ]
+    conn = await session.connection()
+    raw = await conn.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(
+        models.Message.__tablename__,
+        records=records,
+        columns=_MESSAGE_COPY_COLUMNS,
+    )
+    await session.commit()
+    _forget_agent_customers(*(rec[2] for rec in records))
+    return len(records)
+
+
+def _messages_query(
     customer_id: str,
     agent_id: Optional[str] = None,
     start: Optional[datetime] = None,
     end: Optional[datetime] = None,
     limit: Optional[int] = None,
     offset: Optional[int] = None,
-) -> List[models.Message]:
+):
     q = select(models.Message).where(models.Message.customer_id == customer_id)
     if agent_id is not None:
         q = q.where(models.Message.agent_id == agent_id)
@@ -143,10 +249,101 @@ async def get_messages(
         q = q.limit(limit)
     if offset:
         q = q.offset(offset)
+    return q
+
+
+async def get_messages(
+    session: AsyncSession,
+    customer_id: str,
+    agent_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: Optional[int] = None,
+    offset: Optional[int] = None,
+) -> List[models.Message]:
+    q = _messages_query(customer_id, agent_id, start, end, limit, offset)
     r = await session.execute(q)
     return r.scalars().all()
 
 
+async def iter_message_rows(
+    session: AsyncSession,
+    customer_id: str,
+    agent_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: Optional[int] = None,
+    offset: Optional[int] = None,
+    yield_per: int = 500,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Same filters as get_messages, streamed from a server-side cursor as plain column
+    dicts (created_at as an ISO string) for JSON responses — no ORM objects, and
+    never the whole result in memory.
+    """
+    q = _messages_query(customer_id, agent_id, start, end, limit, offset).with_only_columns(
+        *models.Message.__table__.columns
+    )
+    result = await session.stream(q.execution_options(yield_per=yield_per))
+    async for row in result.mappings():
+        d = dict(row)
+        d["created_at"] = d["created_at"].isoformat()
+        yield d
+
+
+async def stream_messages(
+    session: AsyncSession,
+    customer_id: str,
+    agent_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: Optional[int] = None,
+    offset: Optional[int] = None,
+    yield_per: int = 100,
+) -> AsyncIterator[models.Message]:
+    """
+    Same filters as get_messages, but rows stream from a server-side cursor
+    `yield_per` at a time instead of being materialized up front.
+    """
+    q = _messages_query(customer_id, agent_id, start, end, limit, offset)
+    result = await session.stream(q.execution_options(yield_per=yield_per))
+    async for m in result.scalars():
+        yield m
+
+
+_TRANSCRIPT_COLUMNS = (
+    models.Message.message_id,
+    models.Message.sender,
+    models.Message.message,
+    models.Message.created_at,
+)
+
+
+async def stream_message_rows(
+    session: AsyncSession,
+    customer_id: str,
+    agent_id: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    yield_per: int = 500,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Transcript rows for summaries/exports: plain dicts with only message_id, sender,
+    message and created_at, where created_at is already an ISO string. Normalizing
+    here keeps per-message type checks out of the text-building loops and skips
+    ORM object construction.
+    """
+    q = _messages_query(customer_id, agent_id, start, end).with_only_columns(*_TRANSCRIPT_COLUMNS)
+    result = await session.stream(q.execution_options(yield_per=yield_per))
+    async for message_id, sender, message, created_at in result:
+        yield {
+            "message_id": message_id,
+            "sender": sender,
+            "message": message,
+            "created_at": created_at.isoformat(),
+        }
+
+
 async def get_last_message(session: AsyncSession, customer_id: str, agent_id: Optional[str] = None) -> Optional[models.Message]:
     q = select(models.Message).where(models.Message.customer_id == customer_id)
     if agent_id is not None:
@@ -177,7 +374,6 @@ async def open_or_get_conversation(
     conv = models.Conversation(customer_id=customer_id, agent_id=agent_id, mode="agent" if agent_id else "bot", bot_assist=True)
     session.add(conv)
     await session.commit()
-    await session.refresh(conv)
     return conv
 
 
@@ -188,25 +384,28 @@ async def set_conversation_mode(
     bot_assist: Optional[bool] = None,
     agent_online: Optional[bool] = None,
 ) -> Optional[models.Conversation]:
-    conv = await get_conversation_by_id(session, conv_id)
-    if not conv:
-        return None
-    if mode is not None:
-        conv.mode = mode
-    if bot_assist is not None:
-        conv.bot_assist = bot_assist
-    if agent_online is not None:
-        conv.agent_online = agent_online
-    session.add(conv)
+    values = {
+        k: v
+        for k, v in (("mode", mode), ("bot_assist", bot_assist), ("agent_online", agent_online))
+        if v is not None
+    }
+    if not values:
+        return await get_conversation_by_id(session, conv_id)
+    # single UPDATE ... RETURNING instead of SELECT + UPDATE + refresh
+    stmt = (
+        update(models.Conversation)
+        .where(models.Conversation.id == conv_id)
+        .values(**values)
+        .returning(models.Conversation)
+    )
+    r = await session.execute(stmt)
+    conv = r.scalars().one_or_none()
     await session.commit()
-    await session.refresh(conv)
     return conv
 
 
 async def get_conversation_by_id(session: AsyncSession, conv_id: int) -> Optional[models.Conversation]:
-    q = select(models.Conversation).where(models.Conversation.id == conv_id)
-    r = await session.execute(q)
-    return r.scalars().first()
+    return await session.get(models.Conversation, conv_id)
 
 
 # -----------------------
@@ -227,7 +426,7 @@ async def create_booking(
     paid: bool = False,
 ) -> models.Booking:
     if booking_ref is None:
-        booking_ref = "BK-" + uuid4().hex[:12]
+        booking_ref = "BK-" + secrets.token_hex(6)
     b = models.Booking(
         booking_ref=booking_ref,
         idempotency_key=idempotency_key,
@@ -243,51 +442,87 @@ async def create_booking(
     )
     session.add(b)
     await session.commit()
-    await session.refresh(b)
+    _forget_agent_customers(agent_id)
     return b
 
 
 async def get_booking_by_ref(session: AsyncSession, booking_ref: str) -> Optional[models.Booking]:
-    q = select(models.Booking).where(models.Booking.booking_ref == booking_ref)
-    r = await session.execute(q)
+    r = await session.execute(_GET_BOOKING_BY_REF, {"booking_ref": booking_ref})
     return r.scalars().first()
 
 
-async def list_bookings_for_customer(session: AsyncSession, customer_id: str, upcoming_only: bool = True) -> List[models.Booking]:
+async def list_bookings_for_customer(
+    session: AsyncSession,
+    customer_id: str,
+    upcoming_only: bool = True,
+    limit: Optional[int] = None,
+    after: Optional[Tuple[datetime, int]] = None,
+) -> List[models.Booking]:
+    """
+    Bookings ordered by (start, id). Pass limit for a page and after=(start, id) of the
+    previous page's last row for the next one (keyset: no OFFSET scan).
+    """
     q = select(models.Booking).where(models.Booking.customer_id == customer_id)
     if upcoming_only:
-        q = q.where(models.Booking.end >= datetime.now(timezone.utc))
-    q = q.order_by(models.Booking.start)
+        # matches the partial ix_booking_customer_end index (cancelled rows excluded)
+        now_utc = datetime.now(timezone.utc)
+        q = q.where(models.Booking.end >= now_utc, models.Booking.status != "cancelled")
+    # pending rows are /book requests still waiting on the calendar (or abandoned)
+    q = q.where(models.Booking.status != "pending")
+    if after is not None:
+        q = q.where(tuple_(models.Booking.start, models.Booking.id) > tuple_(*after))
+    q = q.order_by(models.Booking.start, models.Booking.id)
+    if limit is not None:
+        q = q.limit(limit)
     r = await session.execute(q)
     return r.scalars().all()
 
 
-async def update_booking_status(session: AsyncSession, booking_ref: str, status: str) -> Optional[models.Booking]:
-    b = await get_booking_by_ref(session, booking_ref)
-    if not b:
-        return None
-    b.status = status
-    b.updated_at = datetime.now(timezone.utc)
-    session.add(b)
+async def _update_booking_returning(session: AsyncSession, booking_ref: str, **values: Any) -> Optional[models.Booking]:
+    stmt = (
+        update(models.Booking)
+        .where(models.Booking.booking_ref == booking_ref)
+        .values(updated_at=datetime.now(timezone.utc), **values)
+        .returning(models.Booking)
+    )
+    r = await session.execute(stmt)
+    b = r.scalars().one_or_none()
     await session.commit()
-    await session.refresh(b)
     return b
 
 
+async def update_booking_status(session: AsyncSession, booking_ref: str, status: str) -> Optional[models.Booking]:
+    return await _update_booking_returning(session, booking_ref, status=status)
+
+
+async def set_booking_event(session: AsyncSession, booking_ref: str, event_id: str, status: str = "confirmed") -> Optional[models.Booking]:
+    """Attach the calendar event to a pending booking and set its status in one UPDATE."""
+    return await _update_booking_returning(session, booking_ref, event_id=event_id, status=status)
+
+
+# A pending row older than this was left by a /book that died before confirming it.
+PENDING_BOOKING_TTL = float(os.getenv("PENDING_BOOKING_TTL", "120"))
+
+
+async def delete_pending_booking(session: AsyncSession, booking_ref: str, stale_only: bool = False) -> bool:
+    """
+    Remove a tentative booking whose calendar event never got attached; confirmed rows are
+    left alone. stale_only: only when it is older than PENDING_BOOKING_TTL (DB clock).
+    """
+    q = delete(models.Booking).where(
+        models.Booking.booking_ref == booking_ref, models.Booking.status == "pending"
+    )
+    if stale_only:
+        q = q.where(models.Booking.created_at < func.now() - timedelta(seconds=PENDING_BOOKING_TTL))
+    r = await session.execute(q)
+    await session.commit()
+    return bool(r.rowcount)
+
+
 async def reschedule_booking(
     session: AsyncSession, booking_ref: str, new_start: datetime, new_end: datetime
 ) -> Optional[models.Booking]:
-    b = await get_booking_by_ref(session, booking_ref)
-    if not b:
-        return None
-    b.start = new_start
-    b.end = new_end
-    b.status = "rescheduled"
-    b.updated_at = datetime.now(timezone.utc)
-    session.add(b)
-    await session.commit()
-    await session.refresh(b)
-    return b
+    return await _update_booking_returning(session, booking_ref, start=new_start, end=new_end, status="rescheduled")
 
 
 async def cancel_booking(session: AsyncSession, booking_ref: str) -> Optional[models.Booking]:
@@ -298,21 +533,36 @@ async def cancel_booking(session: AsyncSession, booking_ref: str) -> Optional[mo
 # OTP
 # -----------------------
 async def create_otp(session: AsyncSession, phone: str, code: str, valid_for_seconds: int = 300) -> models.OTP:
-    valid_until = datetime.now(timezone.utc) + "timedelta"(seconds=valid_for_seconds)
-    otp = models.OTP(phone=phone, code=code, valid_until=valid_until, used=False)
-    session.add(otp)
+    """
+    Upsert the OTP for phone: one row per phone, re-armed on every request.
+    """
+    now = datetime.now(timezone.utc)
+    valid_until = now + timedelta(seconds=valid_for_seconds)
+    stmt = (
+        pg_insert(models.OTP)
+        .values(phone=phone, code=code, valid_until=valid_until, used=False, created_at=now)
+        .on_conflict_do_update(
+            index_elements=[models.OTP.phone],
+            set_={"code": code, "valid_until": valid_until, "used": False, "created_at": now},
+        )
+        .returning(models.OTP)
+    )
+    r = await session.execute(stmt)
+    otp = r.scalars().one()
     await session.commit()
-    await session.refresh(otp)
     return otp
 
 
 async def verify_otp_code(session: AsyncSession, phone: str, code: str) -> bool:
-    q = select(models.OTP).where(models.OTP.phone == phone, models.OTP.code == code, models.OTP.used == False)
+    q = select(models.OTP).where(models.OTP.phone == phone)
     r = await session.execute(q)
     otp = r.scalars().first()
-    if not otp:
+    if not otp or otp.used or otp.code != code:
         return False
-    if otp.valid_until < datetime.now(timezone.utc):
+    valid_until = otp.valid_until
+    if valid_until.tzinfo is None:
+        valid_until = valid_until.replace(tzinfo=timezone.utc)
+    if valid_until < datetime.now(timezone.utc):
         return False
     # mark used
     otp.used = True
@@ -339,7 +589,7 @@ async def save_summary(
     source_hash: Optional[str] = None,
 ) -> models.Summary:
     if cache_key is None:
-        cache_key = "sum-" + uuid4().hex[:12]
+        cache_key = "sum-" + secrets.token_hex(6)
     s = models.Summary(
         customer_id=customer_id,
         agent_id=agent_id,
@@ -350,19 +600,16 @@ async def save_summary(
         sentiment=sentiment,
         message_count=message_count,
         model_meta=model_meta or {},
-        generated_at=datetime.now(timezone.utc),
         cache_key=cache_key,
         source_hash=source_hash,
     )
     session.add(s)
     await session.commit()
-    await session.refresh(s)
     return s
 
 
 async def get_summary_by_cache_key(session: AsyncSession, cache_key: str) -> Optional[models.Summary]:
-    q = select(models.Summary).where(models.Summary.cache_key == cache_key)
-    r = await session.execute(q)
+    r = await session.execute(_GET_SUMMARY_BY_CACHE_KEY, {"cache_key": cache_key})
     return r.scalars().first()
 
 
@@ -375,20 +622,48 @@ async def list_summaries_for_customer(session: AsyncSession, customer_id: str) -
 # -----------------------
 # Utility
 # -----------------------
+# Agent dashboards poll list_customers_for_agent; keep results briefly per process.
+# Writes through this module drop the agent's entry; other workers catch up within the TTL.
+AGENT_CUSTOMERS_TTL = float(os.getenv("AGENT_CUSTOMERS_TTL", "20"))
+_AGENT_CUSTOMERS_MAX = 1024
+_AGENT_CUSTOMERS: "OrderedDict[str, Tuple[List[str], float]]" = OrderedDict()
+_AGENT_CUSTOMERS_LOCK = threading.Lock()
+
+
+def _forget_agent_customers(*agent_ids: Optional[str]) -> None:
+    with _AGENT_CUSTOMERS_LOCK:
+        for agent_id in agent_ids:
+            if agent_id:
+                _AGENT_CUSTOMERS.pop(agent_id, None)
+
+
 async def list_customers_for_agent(session: AsyncSession, agent_id: str) -> List[str]:
     """
     Return unique customer_ids this agent has talked with (via messages or bookings).
+    Cached per agent for AGENT_CUSTOMERS_TTL seconds.
     """
-    # from messages
-    q = select(func.distinct(models.Message.customer_id)).where(models.Message.agent_id == agent_id)
+    with _AGENT_CUSTOMERS_LOCK:
+        hit = _AGENT_CUSTOMERS.get(agent_id)
+        if hit is not None:
+            customers, expires = hit
+            if expires > time.monotonic():
+                _AGENT_CUSTOMERS.move_to_end(agent_id)
+                return list(customers)
+            del _AGENT_CUSTOMERS[agent_id]
+
+    # messages UNION bookings in one round-trip; UNION dedupes server-side
+    q = select(models.Message.customer_id).where(models.Message.agent_id == agent_id).union(
+        select(models.Booking.customer_id).where(
+            models.Booking.agent_id == agent_id,
+            models.Booking.customer_id.isnot(None),
+        )
+    )
     r = await session.execute(q)
-    from_msgs = [row[0] for row in r.fetchall()]
-
-    # from bookings
-    q2 = select(func.distinct(models.Booking.customer_id)).where(models.Booking.agent_id == agent_id)
-    r2 = await session.execute(q2)
-    from_bookings = [row[0] for row in r2.fetchall() if row[0] is not None]
-
-    # union (preserve order: messages first then bookings)
-    combined = list(dict.fromkeys(from_msgs + from_bookings))
-    return combined
+    customers = [row[0] for row in r.fetchall()]
+    if AGENT_CUSTOMERS_TTL > 0:
+        with _AGENT_CUSTOMERS_LOCK:
+            _AGENT_CUSTOMERS[agent_id] = (customers, time.monotonic() + AGENT_CUSTOMERS_TTL)
+            _AGENT_CUSTOMERS.move_to_end(agent_id)
+            if len(_AGENT_CUSTOMERS) > _AGENT_CUSTOMERS_MAX:
+                _AGENT_CUSTOMERS.popitem(last=False)
+    return list(customers)
@@ -18,7 +18,7 @@ Usage (sync, e.g. Flask/scripts):
 from __future__ import annotations
 
 import os
-import inspect
+import hashlib
 from typing import AsyncGenerator, Generator
 from contextlib import asynccontextmanager, contextmanager
 
@@ -29,10 +29,11 @@ load_dotenv()
 
 from sqlmodel import SQLModel
 from sqlmodel.ext.asyncio.session import AsyncSession
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
 
 # -------------------------------------------------
 # Database URL (env override, Railway default)
@@ -52,6 +53,16 @@ else:
 
 SQL_ECHO = os.getenv("SQL_ECHO", "false").lower() in ("1", "true", "yes")
 
+# Pool tuning. pre_ping + recycle keep us from handing out connections the
+# Railway proxy has already reaped while idle.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_POOL_OVERFLOW = int(os.getenv("DB_POOL_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "10"))
+# Compiled-SQL cache entries per engine (SQLAlchemy default 500). Multi-row INSERTs key
+# on their row count, so bulk ingests can crowd out the hot single-row statements.
+DB_QUERY_CACHE_SIZE = int(os.getenv("DB_QUERY_CACHE_SIZE", "2048"))
+
 # -------------------------
 # Async engine & session
 # -------------------------
@@ -59,10 +70,21 @@ async_engine: AsyncEngine = create_async_engine(
     ASYNC_DATABASE_URL,
     echo=SQL_ECHO,
     future=True,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_POOL_OVERFLOW,
+    pool_pre_ping=True,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_timeout=DB_POOL_TIMEOUT,
+    query_cache_size=DB_QUERY_CACHE_SIZE,
+    connect_args={
+        # short OLTP queries never benefit from JIT; asyncpg caches prepared statements
+        "server_settings": {"jit": "off"},
+        "statement_cache_size": 1024,
+    },
 )
 
-AsyncSessionLocal = sessionmaker(
-    bind=async_engine,
+AsyncSessionLocal = async_sessionmaker(
+    async_engine,
     class_=AsyncSession,
     expire_on_commit=False,
 )
@@ -74,6 +96,9 @@ sync_engine: Engine = create_engine(
     RAW_DATABASE_URL,
     echo=SQL_ECHO,
     future=True,
+    pool_pre_ping=True,
+    pool_recycle=DB_POOL_RECYCLE,
+    query_cache_size=DB_QUERY_CACHE_SIZE,
 )
 
 SyncSessionLocal = sessionmaker(
@@ -83,20 +108,137 @@ SyncSessionLocal = sessionmaker(
     class_=Session,
 )
 
+# -----------------------
+# Extra indexes
+# -----------------------
+# Indexes SQLModel can't express on the Field() itself (functional/composite).
+# Applied after create_all; IF NOT EXISTS keeps them safe on existing databases.
+EXTRA_INDEX_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_agent_email_lower ON agent (lower(email))",
+    "CREATE INDEX IF NOT EXISTS ix_customer_email_lower ON customer (lower(email))",
+    # get_last_message / get_messages: ORDER BY created_at with LIMIT becomes an index scan
+    "CREATE INDEX IF NOT EXISTS ix_messages_customer_created_desc ON message (customer_id, created_at DESC)",
+    "CREATE INDEX IF NOT EXISTS ix_messages_customer_agent_created_desc ON message (customer_id, agent_id, created_at DESC)",
+    # agent-scoped message ranges without a customer filter
+    "CREATE INDEX IF NOT EXISTS ix_messages_agent_created ON message (agent_id, created_at)",
+    # summary lookups by customer + date range
+    "CREATE INDEX IF NOT EXISTS ix_summary_customer_range ON summary (customer_id, range_start, range_end)",
+    # a customer's bookings by start time
+    "CREATE INDEX IF NOT EXISTS ix_booking_customer_start ON booking (customer_id, start)",
+    # list_bookings_for_customer(upcoming_only=True)
+    "CREATE INDEX IF NOT EXISTS ix_booking_customer_end ON booking (customer_id, \"end\") WHERE status <> 'cancelled'",
+]
+
+# Timestamps are filled by the database (models._server_now). create_all only sets
+# DEFAULT on new tables, so make sure tables created before that have it too.
+SERVER_DEFAULT_DDL = [
+    f"ALTER TABLE {table} ALTER COLUMN {column} SET DEFAULT now()"
+    for table, column in (
+        ("message", "created_at"),
+        ("agent", "created_at"),
+        ("customer", "created_at"),
+        ("booking", "created_at"),
+        ("otp", "created_at"),
+        ("summary", "generated_at"),
+        ("conversation", "created_at"),
+    )
+]
+
+# -----------------------
+# One-off data migrations
+# -----------------------
+# Each step checks its own guard and does nothing once applied, so re-running the extra
+# DDL after an unrelated schema change never touches data again.
+#
+# crud.create_otp upserts ON CONFLICT (phone), which needs a unique index; create_all
+# keeps an older non-unique ix_otp_phone as-is. Only when neither ux_otp_phone nor a
+# unique ix_otp_phone (fresh databases) exists: delete duplicate phones (newest row
+# wins), then create ux_otp_phone.
+OTP_UNIQUE_PHONE_MIGRATION = """
+DO $$
+BEGIN
+    IF to_regclass('ux_otp_phone') IS NULL AND NOT EXISTS (
+        SELECT 1 FROM pg_index WHERE indexrelid = to_regclass('ix_otp_phone') AND indisunique
+    ) THEN
+        DELETE FROM otp a USING otp b WHERE a.phone = b.phone AND a.id < b.id;
+        CREATE UNIQUE INDEX ux_otp_phone ON otp (phone);
+    END IF;
+END
+$$
+"""
+
+MIGRATION_DDL = [OTP_UNIQUE_PHONE_MIGRATION]
+
+_EXTRA_DDL = EXTRA_INDEX_DDL + SERVER_DEFAULT_DDL + MIGRATION_DDL
+
+
+# -----------------------
+# Schema version gate
+# -----------------------
+# create_all probes every table on each startup. Instead we record a
+# fingerprint of the models + extra DDL and skip the whole scan when the
+# database already matches (one round-trip on a warm start).
+SCHEMA_VERSION_DDL = "CREATE TABLE IF NOT EXISTS schema_version (id INTEGER PRIMARY KEY, version TEXT NOT NULL)"
+_SCHEMA_VERSION_SELECT = text("SELECT version FROM schema_version WHERE id = 1")
+_SCHEMA_VERSION_UPSERT = text(
+    "INSERT INTO schema_version (id, version) VALUES (1, :version) "
+    "ON CONFLICT (id) DO UPDATE SET version = EXCLUDED.version"
+)
+
+
+def _schema_fingerprint() -> str:
+    """Stable digest of table/column/index definitions plus the extra DDL."""
+    parts = []
+    for table in SQLModel.metadata.sorted_tables:
+        cols = ",".join(f"{c.name}:{c.type!r}" for c in table.columns)
+        idx = ",".join(sorted(i.name or "" for i in table.indexes))
+        parts.append(f"{table.name}({cols})[{idx}]")
+    parts.extend(_EXTRA_DDL)
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()[:16]
+
+
 # -----------------------
 # Initialization helpers
 # -----------------------
 async def init_db() -> None:
-    """Create tables using the async engine."""
+    """Create tables using the async engine (no-op when schema_version matches)."""
+    version = _schema_fingerprint()
+    async with async_engine.connect() as conn:
+        try:
+            current = (await conn.execute(_SCHEMA_VERSION_SELECT)).scalar()
+        except DBAPIError:
+            current = None  # fresh database: no schema_version table yet
+    if current == version:
+        return
+
     async with async_engine.begin() as conn:
         await conn.run_sync(SQLModel.metadata.create_all)
+        for ddl in _EXTRA_DDL:
+            await conn.execute(text(ddl))
+        await conn.execute(text(SCHEMA_VERSION_DDL))
+        await conn.execute(_SCHEMA_VERSION_UPSERT, {"version": version})
 
 
 def init_db_sync(drop_first: bool = False) -> None:
-    """Create tables using the sync engine."""
+    """Create tables using the sync engine (no-op when schema_version matches)."""
+    version = _schema_fingerprint()
     if drop_first:
         SQLModel.metadata.drop_all(bind=sync_engine)
+    else:
+        with sync_engine.connect() as conn:
+            try:
+                current = conn.execute(_SCHEMA_VERSION_SELECT).scalar()
+            except DBAPIError:
+                current = None
+        if current == version:
+            return
+
     SQLModel.metadata.create_all(bind=sync_engine)
+    with sync_engine.begin() as conn:
+        for ddl in _EXTRA_DDL:
+            conn.execute(text(ddl))
+        conn.execute(text(SCHEMA_VERSION_DDL))
+        conn.execute(_SCHEMA_VERSION_UPSERT, {"version": version})
 
 # -----------------------
 # Session providers
@@ -131,12 +273,7 @@ def get_sync_engine() -> Engine:
 async def dispose_engines() -> None:
     """Dispose both async and sync engines (useful on shutdown)."""
     try:
-        dispose_fn = getattr(async_engine, "dispose", None)
-        if dispose_fn is not None:
-            if inspect.iscoroutinefunction(dispose_fn):
-                await dispose_fn()  # type: ignore[arg-type]
-            else:
-                dispose_fn()
+        await async_engine.dispose()
     except Exception:
         try:
             if hasattr(async_engine, "sync_engine"):
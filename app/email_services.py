@@ -3,9 +3,11 @@
 Email utilities for the Service Chatbot project.
 
 Features:
- - Send emails via SendGrid (if SENDGRID_API_KEY is set and `sendgrid` package installed)
- - Fallback to SMTP using standard library (SMTP_TLS_HOST, SMTP_TLS_PORT, SMTP_USER, SMTP_PASS)
- - Async wrappers that run the blocking send in a thread (`asyncio.to_thread`)
+ - Send emails via SendGrid (if SENDGRID_API_KEY is set): async sends POST the v3 API over a
+   shared HTTP/2 keep-alive httpx client; sync sends use the `sendgrid` package if installed
+ - Fallback to SMTP (SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS); async sends reuse a small pool
+   of keep-alive aiosmtplib connections, sync sends use smtplib
+ - Async wrappers that run blocking sends in a thread (`asyncio.to_thread`)
  - Helpers for booking confirmation and generic templated emails
 
 Environment variables:
@@ -14,20 +16,29 @@ Environment variables:
  - SMTP_PORT                  (default 587)
  - SMTP_USER
  - SMTP_PASS
+ - SMTP_POOL_SIZE             max concurrent pooled SMTP connections (default 4)
  - EMAIL_FROM                 default from address if not provided
  - ADMIN_EMAIL                fallback admin email
+ - SENDGRID_ASM_GROUP_ID      (optional) SendGrid unsubscribe group attached to every SendGrid send
+ - EMAIL_OUTBOX_WORKERS       background send workers for enqueue() (default 4)
+ - EMAIL_OUTBOX_MAX           queued sends before enqueue() starts dropping (default 10000)
 """
 from __future__ import annotations
 
 import os
+import functools
 import json
 import logging
 import asyncio
-from typing import Optional, Dict
+import threading
+from dataclasses import dataclass
+from itertools import islice
+from typing import Optional, Dict, List, Any
 
 from email.message import EmailMessage
 import smtplib
 from dotenv import load_dotenv
+from jinja2 import Environment
 
 load_dotenv()
 logger = logging.getLogger("email")
@@ -40,34 +51,94 @@ SMTP_USER = os.getenv("SMTP_USER", "")
 SMTP_PASS = os.getenv("SMTP_PASS", "")
 EMAIL_FROM = os.getenv("EMAIL_FROM", f"no-reply@{os.getenv('DOMAIN','example.com')}")
 ADMIN_EMAIL = os.getenv("ADMIN_EMAIL", EMAIL_FROM)
-
-
-# Try to import sendgrid client lazily if available
-_sendgrid_client = None
-if SENDGRID_API_KEY:
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", "4"))
+EMAIL_OUTBOX_WORKERS = int(os.getenv("EMAIL_OUTBOX_WORKERS", "4"))
+EMAIL_OUTBOX_MAX = int(os.getenv("EMAIL_OUTBOX_MAX", "10000"))
+
+
+@dataclass(frozen=True, slots=True)
+class _SmtpCfg:
+    """SMTP account settings, resolved once at import (also the pool key)."""
+    host: str
+    port: int
+    user: str
+    password: str
+    pool_size: int
+    use_tls: bool      # implicit TLS (465)
+    start_tls: bool    # STARTTLS upgrade (587 / 25)
+
+
+_SMTP_CFG = _SmtpCfg(
+    host=SMTP_HOST,
+    port=SMTP_PORT,
+    user=SMTP_USER,
+    password=SMTP_PASS,
+    pool_size=SMTP_POOL_SIZE,
+    use_tls=SMTP_PORT == 465,
+    start_tls=SMTP_PORT in (587, 25),
+)
+
+# Async SMTP client (optional); without it SMTP sends fall back to smtplib in a thread
+try:
+    import aiosmtplib  # type: ignore
+except Exception:
+    aiosmtplib = None  # type: ignore
+
+# Async HTTP client for the SendGrid v3 API (optional)
+try:
+    import httpx  # type: ignore
+except Exception:
+    httpx = None  # type: ignore
+
+# Fast JSON encoder for SendGrid payloads (optional)
+try:
+    import orjson  # type: ignore
+except Exception:
+    orjson = None  # type: ignore
+
+SENDGRID_API_BASE = "https://api.sendgrid.com"
+# personalizations per /v3/mail/send call (SendGrid caps at 1000)
+SENDGRID_BATCH_SIZE = 500
+# Unsubscribe group (Advanced Suppression Manager); SendGrid then handles opt-outs itself
+SENDGRID_ASM_GROUP_ID = int(os.getenv("SENDGRID_ASM_GROUP_ID") or 0) or None
+
+
+@functools.cache
+def _sendgrid_sdk():
+    """
+    (SendGridAPIClient, Mail) from the `sendgrid` package, imported on first use so its
+    dependency tree stays out of worker start-up. None if unconfigured or not installed.
+    """
+    if not SENDGRID_API_KEY:
+        return None
     try:
         from sendgrid import SendGridAPIClient  # type: ignore
         from sendgrid.helpers.mail import Mail  # type: ignore
-        _sendgrid_client = SendGridAPIClient(SENDGRID_API_KEY)
+        return SendGridAPIClient(SENDGRID_API_KEY), Mail
     except Exception:
         logger.info("SendGrid package not available or failed to init — will use SMTP fallback.")
+        return None
 
 
 # -------------------------
 # Low level senders
 # -------------------------
-def _send_via_sendgrid_sync(subject: str, to_email: str, html: str, plain: Optional[str] = None, from_email: Optional[str] = None) -> dict:
+def _send_via_sendgrid_sync(subject: str, to_email: str, html: str, plain: Optional[str] = None, from_email: Optional[str] = None, bcc: Optional[List[str]] = None) -> dict:
     """
     Synchronous SendGrid send. Returns a dict with status info.
     """
-    if _sendgrid_client is None:
+    sdk = _sendgrid_sdk()
+    if sdk is None:
         raise RuntimeError("SendGrid client not configured or package not installed")
+    sendgrid_client, Mail = sdk
 
     from_email = from_email or EMAIL_FROM
     content_plain = plain or ""
     mail = Mail(from_email=from_email, to_emails=to_email, subject=subject, html_content=html, plain_text_content=content_plain)
+    for addr in bcc or []:
+        mail.add_bcc(addr)
     try:
-        resp = _sendgrid_client.send(mail)
+        resp = sendgrid_client.send(mail)
         logger.info("SendGrid sent mail to %s status=%s", to_email, resp.status_code)
         return {"ok": True, "provider": "sendgrid", "status_code": resp.status_code}
     except Exception as e:
@@ -75,51 +146,298 @@ def _send_via_sendgrid_sync(subject: str, to_email: str, html: str, plain: Optio
         return {"ok": False, "error": str(e), "provider": "sendgrid"}
 
 
-def _send_via_smtp_sync(subject: str, to_email: str, html: str, plain: Optional[str] = None, from_email: Optional[str] = None) -> dict:
-    """
-    Synchronous SMTP send using smtplib (STARTTLS). Returns dict with status.
-    """
-    if not SMTP_HOST:
-        raise RuntimeError("SMTP_HOST not configured")
-
-    from_email = from_email or EMAIL_FROM
+def _build_message(subject: str, to_email: str, html: str, plain: Optional[str] = None, from_email: Optional[str] = None, bcc: Optional[List[str]] = None) -> EmailMessage:
     msg = EmailMessage()
     msg["Subject"] = subject
-    msg["From"] = from_email
+    msg["From"] = from_email or EMAIL_FROM
     msg["To"] = to_email
+    if bcc:
+        # smtplib/aiosmtplib send_message add these to the envelope and strip the header
+        msg["Bcc"] = ", ".join(bcc)
     if plain:
         msg.set_content(plain)
         msg.add_alternative(html, subtype="html")
     else:
         msg.set_content(html, subtype="html")
+    return msg
+
+
+_sendgrid_http = None
+_sendgrid_http_loop = None
+
 
+def _ensure_sendgrid_http():
+    """
+    Shared keep-alive client for the SendGrid API. Connections are bound to the
+    event loop, so the client is rebuilt if we're now running on a different one.
+    """
+    global _sendgrid_http, _sendgrid_http_loop
+    loop = asyncio.get_running_loop()
+    if _sendgrid_http is None or _sendgrid_http.is_closed or _sendgrid_http_loop is not loop:
+        _sendgrid_http = httpx.AsyncClient(
+            base_url=SENDGRID_API_BASE,
+            headers={"Authorization": f"Bearer {SENDGRID_API_KEY}"},
+            timeout=15,
+            # retries cover connect-time failures only (DNS/TCP), never a sent request
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=2,
+                limits=httpx.Limits(max_keepalive_connections=32),
+            ),
+        )
+        _sendgrid_http_loop = loop
+    return _sendgrid_http
+
+
+async def warmup() -> None:
+    """
+    Open the SendGrid connection (DNS + TCP + TLS) ahead of the first real send.
+    Call once the serving event loop is running; failures are ignored.
+    """
+    if not _sendgrid_async_enabled():
+        return
     try:
-        with smtplib.SMTP(SMTP_HOST, SMTP_PORT, timeout=15) as server:
-            server.ehlo()
-            if SMTP_PORT in (587, 25):
-                server.starttls()
-                server.ehlo()
-            if SMTP_USER and SMTP_PASS:
-                server.login(SMTP_USER, SMTP_PASS)
-            server.send_message(msg)
-        logger.info("SMTP email sent to %s via %s:%s", to_email, SMTP_HOST, SMTP_PORT)
+        await _ensure_sendgrid_http().head("/")
+    except Exception as e:
+        logger.debug("SendGrid warmup failed: %s", e)
+
+
+@functools.lru_cache(maxsize=64)
+def _sendgrid_from(from_email: str) -> Dict[str, str]:
+    # One shared (never mutated) "from" block per sender address
+    return {"email": from_email}
+
+
+def _sendgrid_payload(subject: str, to_email: str, html: str, plain: Optional[str] = None, from_email: Optional[str] = None, bcc: Optional[List[str]] = None, send_at: Optional[int] = None) -> dict:
+    """
+    v3 mail/send body. send_at (unix seconds, up to 72h ahead) lets SendGrid
+    schedule delivery instead of us holding the mail.
+    """
+    content = []
+    if plain:
+        content.append({"type": "text/plain", "value": plain})
+    content.append({"type": "text/html", "value": html})
+    personalization: Dict[str, Any] = {"to": [{"email": to_email}]}
+    if bcc:
+        personalization["bcc"] = [{"email": addr} for addr in bcc]
+    if send_at:
+        personalization["send_at"] = int(send_at)
+    payload = {
+        "personalizations": [personalization],
+        "from": _sendgrid_from(from_email or EMAIL_FROM),
+        "subject": subject,
+        "content": content,
+    }
+    if SENDGRID_ASM_GROUP_ID:
+        payload["asm"] = {"group_id": SENDGRID_ASM_GROUP_ID}
+    return payload
+
+
+def _dumps_payload(payload: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, separators=(",", ":")).encode("utf-8")
+
+
+def _sendgrid_async_enabled() -> bool:
+    return bool(SENDGRID_API_KEY) and httpx is not None
+
+
+async def _post_sendgrid(payload: dict, log_to: str) -> dict:
+    try:
+        resp = await _ensure_sendgrid_http().post(
+            "/v3/mail/send",
+            content=_dumps_payload(payload),
+            headers={"Content-Type": "application/json"},
+        )
+        resp.raise_for_status()
+        logger.info("SendGrid sent mail to %s status=%s", log_to, resp.status_code)
+        return {"ok": True, "provider": "sendgrid", "status_code": resp.status_code}
+    except Exception as e:
+        logger.exception("SendGrid send failed: %s", e)
+        return {"ok": False, "error": str(e), "provider": "sendgrid"}
+
+
+async def _send_via_sendgrid(subject: str, to_email: str, html: str, plain: Optional[str] = None, from_email: Optional[str] = None, bcc: Optional[List[str]] = None, send_at: Optional[int] = None) -> dict:
+    """
+    Async SendGrid send via POST /v3/mail/send. Returns a dict with status info.
+    """
+    payload = _sendgrid_payload(subject, to_email, html, plain, from_email, bcc, send_at)
+    return await _post_sendgrid(payload, to_email)
+
+
+# Sync path: one kept-alive smtplib connection per thread (an SMTP session is not
+# thread-safe, and thread-local ownership means no lock is needed).
+_SMTP_TLS = threading.local()
+
+
+def _smtp_sync_connect(cfg: _SmtpCfg) -> smtplib.SMTP:
+    server = smtplib.SMTP_SSL(cfg.host, cfg.port, timeout=15) if cfg.use_tls else smtplib.SMTP(cfg.host, cfg.port, timeout=15)
+    server.ehlo()
+    if cfg.start_tls:
+        server.starttls()
+        server.ehlo()
+    if cfg.user and cfg.password:
+        server.login(cfg.user, cfg.password)
+    return server
+
+
+def _smtp_sync_conn(cfg: _SmtpCfg) -> smtplib.SMTP:
+    """This thread's connection for cfg, NOOP-probed and reopened if it went away."""
+    conns = getattr(_SMTP_TLS, "conns", None)
+    if conns is None:
+        conns = _SMTP_TLS.conns = {}
+    server = conns.get(cfg)
+    if server is not None:
+        try:
+            if server.noop()[0] == 250:
+                return server
+        except (smtplib.SMTPException, OSError):
+            pass
+        _smtp_sync_drop(cfg)
+    server = conns[cfg] = _smtp_sync_connect(cfg)
+    return server
+
+
+def _smtp_sync_drop(cfg: _SmtpCfg) -> None:
+    server = getattr(_SMTP_TLS, "conns", {}).pop(cfg, None)
+    if server is not None:
+        try:
+            server.close()
+        except Exception:
+            pass
+
+
+def _send_via_smtp_sync(subject: str, to_email: str, html: str, plain: Optional[str] = None, from_email: Optional[str] = None, bcc: Optional[List[str]] = None) -> dict:
+    """
+    Synchronous SMTP send using smtplib (STARTTLS) over this thread's kept-alive
+    connection. Returns dict with status.
+    """
+    cfg = _SMTP_CFG
+    if not cfg.host:
+        raise RuntimeError("SMTP_HOST not configured")
+
+    msg = _build_message(subject, to_email, html, plain, from_email, bcc)
+
+    try:
+        _smtp_sync_conn(cfg).send_message(msg)
+        logger.info("SMTP email sent to %s via %s:%s", to_email, cfg.host, cfg.port)
         return {"ok": True, "provider": "smtp"}
     except Exception as e:
+        # don't reuse a connection left in an unknown state
+        _smtp_sync_drop(cfg)
         logger.exception("SMTP send failed: %s", e)
         return {"ok": False, "error": str(e), "provider": "smtp"}
 
 
+class _SmtpPool:
+    """
+    Keep-alive aiosmtplib connections for one SMTP account (_SmtpCfg).
+
+    SMTP is strictly sequential per connection, so a connection is checked out
+    by exactly one sender at a time. The semaphore caps how many connections
+    we hold open so bursts queue here instead of overwhelming the server.
+    Idle connections are probed with NOOP before reuse and replaced if dead.
+    """
+
+    def __init__(self, cfg: _SmtpCfg):
+        self.cfg = cfg
+        self.loop = asyncio.get_running_loop()
+        self._idle: "asyncio.Queue[aiosmtplib.SMTP]" = asyncio.Queue()
+        self._sem = asyncio.Semaphore(max(1, cfg.pool_size))
+
+    async def _connect(self) -> "aiosmtplib.SMTP":
+        cfg = self.cfg
+        conn = aiosmtplib.SMTP(
+            hostname=cfg.host,
+            port=cfg.port,
+            timeout=15,
+            use_tls=cfg.use_tls,
+            start_tls=cfg.start_tls,
+        )
+        await conn.connect()
+        if cfg.user and cfg.password:
+            await conn.login(cfg.user, cfg.password)
+        return conn
+
+    async def acquire(self) -> "aiosmtplib.SMTP":
+        await self._sem.acquire()
+        try:
+            while not self._idle.empty():
+                conn = self._idle.get_nowait()
+                try:
+                    await conn.noop()
+                    return conn
+                except Exception:
+                    conn.close()
+            return await self._connect()
+        except BaseException:
+            self._sem.release()
+            raise
+
+    def release(self, conn: "aiosmtplib.SMTP", healthy: bool = True) -> None:
+        if healthy and conn.is_connected:
+            self._idle.put_nowait(conn)
+        else:
+            conn.close()
+        self._sem.release()
+
+    def close_idle(self) -> None:
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+
+_SMTP_POOLS: Dict[_SmtpCfg, _SmtpPool] = {}
+
+
+def _get_smtp_pool() -> _SmtpPool:
+    """Pool for the configured SMTP account, rebuilt if the event loop changed."""
+    pool = _SMTP_POOLS.get(_SMTP_CFG)
+    if pool is None or pool.loop is not asyncio.get_running_loop():
+        pool = _SmtpPool(_SMTP_CFG)
+        _SMTP_POOLS[_SMTP_CFG] = pool
+    return pool
+
+
+async def _send_via_smtp(subject: str, to_email: str, html: str, plain: Optional[str] = None, from_email: Optional[str] = None, bcc: Optional[List[str]] = None) -> dict:
+    """
+    Async SMTP send over a pooled aiosmtplib connection. Returns dict with status.
+    """
+    if not _SMTP_CFG.host:
+        raise RuntimeError("SMTP_HOST not configured")
+
+    msg = _build_message(subject, to_email, html, plain, from_email, bcc)
+    pool = _get_smtp_pool()
+    try:
+        conn = await pool.acquire()
+    except Exception as e:
+        logger.exception("SMTP connect failed: %s", e)
+        return {"ok": False, "error": str(e), "provider": "smtp"}
+
+    healthy = False
+    try:
+        await conn.send_message(msg)
+        healthy = True
+        logger.info("SMTP email sent to %s via %s:%s", to_email, _SMTP_CFG.host, _SMTP_CFG.port)
+        return {"ok": True, "provider": "smtp"}
+    except Exception as e:
+        logger.exception("SMTP send failed: %s", e)
+        return {"ok": False, "error": str(e), "provider": "smtp"}
+    finally:
+        pool.release(conn, healthy)
+
+
 # -------------------------
 # Public send wrapper
 # -------------------------
-def send_email_sync(subject: str, to_email: str, html: str, plain: Optional[str] = None, from_email: Optional[str] = None) -> dict:
+def send_email_sync(subject: str, to_email: str, html: str, plain: Optional[str] = None, from_email: Optional[str] = None, bcc: Optional[List[str]] = None) -> dict:
     """
     Choose SendGrid if available, otherwise SMTP.
     """
     # prefer SendGrid if configured and client available
-    if _sendgrid_client is not None:
+    if _sendgrid_sdk() is not None:
         try:
-            res = _send_via_sendgrid_sync(subject, to_email, html, plain, from_email)
+            res = _send_via_sendgrid_sync(subject, to_email, html, plain, from_email, bcc)
             if res.get("ok"):
                 return res
             # else fall through to SMTP fallback
@@ -128,68 +446,155 @@ def send_email_sync(subject: str, to_email: str, html: str, plain: Optional[str]
             logger.exception("SendGrid attempt raised, falling back to SMTP: %s", e)
 
     # fallback to SMTP
-    return _send_via_smtp_sync(subject, to_email, html, plain, from_email)
+    return _send_via_smtp_sync(subject, to_email, html, plain, from_email, bcc)
+
+
+async def send_email(subject: str, to_email: str, html: str, plain: Optional[str] = None, from_email: Optional[str] = None, bcc: Optional[List[str]] = None, send_at: Optional[int] = None) -> dict:
+    """
+    Async counterpart of send_email_sync. Both SendGrid (httpx) and SMTP
+    (aiosmtplib pool) run on the event loop when their clients are installed.
+    send_at (unix seconds) schedules delivery on the SendGrid REST path; the
+    SDK and SMTP fallbacks send immediately.
+    """
+    if SENDGRID_API_KEY and (httpx is not None or _sendgrid_sdk() is not None):
+        try:
+            if httpx is not None:
+                res = await _send_via_sendgrid(subject, to_email, html, plain, from_email, bcc, send_at)
+            else:
+                res = await asyncio.to_thread(_send_via_sendgrid_sync, subject, to_email, html, plain, from_email, bcc)
+            if res.get("ok"):
+                return res
+            logger.info("SendGrid failed, trying SMTP fallback")
+        except Exception as e:
+            logger.exception("SendGrid attempt raised, falling back to SMTP: %s", e)
+
+    return await _send_smtp_any(subject, to_email, html, plain, from_email, bcc)
 
 
-async def send_email(subject: str, to_email: str, html: str, plain: Optional[str] = None, from_email: Optional[str] = None) -> dict:
+async def _send_smtp_any(subject: str, to_email: str, html: str, plain: Optional[str] = None, from_email: Optional[str] = None, bcc: Optional[List[str]] = None) -> dict:
+    if aiosmtplib is None:
+        return await asyncio.to_thread(_send_via_smtp_sync, subject, to_email, html, plain, from_email, bcc)
+    return await _send_via_smtp(subject, to_email, html, plain, from_email, bcc)
+
+
+async def send_email_batch(
+    subject: str,
+    html: str,
+    plain: Optional[str],
+    recipients: List[Dict[str, Any]],
+    from_email: Optional[str] = None,
+    send_at: Optional[int] = None,
+    template_id: Optional[str] = None,
+) -> dict:
     """
-    Async wrapper for send_email_sync.
+    Send one rendered email to many recipients.
+    recipients: [{"email": "...", "subject": optional override, "vars": optional template data,
+                  "send_at": optional per-recipient unix time}, ...]
+    send_at: default scheduled delivery time (SendGrid only; SMTP sends immediately).
+    template_id: SendGrid dynamic template rendered with each recipient's "vars". Without
+    it (and on the SMTP paths) vars are ignored and everyone gets html/plain as given.
+
+    With SendGrid this is one /v3/mail/send per SENDGRID_BATCH_SIZE recipients
+    (one personalization each). A failed chunk is retried per recipient over
+    SMTP if configured. Without SendGrid every recipient goes through send_email
+    concurrently.
     """
-    return await asyncio.to_thread(send_email_sync, subject, to_email, html, plain, from_email)
+    if not recipients:
+        return {"ok": True, "results": []}
+
+    if not _sendgrid_async_enabled():
+        results = await asyncio.gather(*[
+            send_email(r.get("subject") or subject, r["email"], html, plain, from_email, send_at=r.get("send_at") or send_at) for r in recipients
+        ])
+        return {"ok": all(r.get("ok") for r in results), "results": list(results)}
+
+    base = _sendgrid_payload(subject, "", html, plain, from_email)
+    if template_id:
+        # the template supplies the body
+        base["template_id"] = template_id
+        base.pop("content", None)
+    results: List[dict] = []
+    it = iter(recipients)
+    while chunk := list(islice(it, SENDGRID_BATCH_SIZE)):
+        personalizations = []
+        for r in chunk:
+            p: Dict[str, Any] = {"to": [{"email": r["email"]}]}
+            if r.get("subject"):
+                p["subject"] = r["subject"]
+            if template_id and r.get("vars"):
+                p["dynamic_template_data"] = r["vars"]
+            if r.get("send_at") or send_at:
+                p["send_at"] = int(r.get("send_at") or send_at)
+            personalizations.append(p)
+        res = await _post_sendgrid({**base, "personalizations": personalizations}, f"{len(chunk)} recipients")
+        if not res.get("ok") and SMTP_HOST:
+            logger.info("SendGrid batch failed, retrying %d recipients via SMTP", len(chunk))
+            smtp_results = await asyncio.gather(*[
+                _send_smtp_any(r.get("subject") or subject, r["email"], html, plain, from_email) for r in chunk
+            ])
+            res = {"ok": all(r.get("ok") for r in smtp_results), "provider": "smtp", "results": list(smtp_results)}
+        results.append(res)
+    return {"ok": all(r.get("ok") for r in results), "provider": "sendgrid", "results": results}
 
 
 # -------------------------
 # Templates / helpers
 # -------------------------
-def render_booking_confirmation_html(booking: Dict, customer: Dict) -> str:
-    """
-    Simple HTML template for booking confirmation.
-    booking: dict with keys booking_ref, service_id, start, end, calendar_id, event_id
-    customer: dict with keys name, email, phone, customer_id
-    """
-    start = booking.get("start")
-    end = booking.get("end")
-    service = booking.get("service_id", "Service")
-    booking_ref = booking.get("booking_ref", "")
-    html = f"""
+# Compiled once at import; HTML is autoescaped so customer-supplied values
+# (name, service, ...) can't inject markup. Plain text is never escaped.
+_HTML_ENV = Environment(autoescape=True)
+_PLAIN_ENV = Environment(autoescape=False, keep_trailing_newline=True)
+
+_BOOKING_HTML_TMPL = _HTML_ENV.from_string("""
     <html>
       <body>
-        <h2>Booking Confirmed — {service}</h2>
-        <p>Hi {customer.get('name') or customer.get('customer_id')},</p>
-        <p>Your booking <strong>{booking_ref}</strong> is confirmed.</p>
+        <h2>Booking Confirmed — {{ service }}</h2>
+        <p>Hi {{ customer.get('name') or customer.get('customer_id') }},</p>
+        <p>Your booking <strong>{{ booking.get('booking_ref', '') }}</strong> is confirmed.</p>
         <ul>
-          <li>Service: {service}</li>
-          <li>When: {start} to {end}</li>
-          <li>Calendar: {booking.get('calendar_id')}</li>
-          <li>Event ID: {booking.get('event_id')}</li>
+          <li>Service: {{ service }}</li>
+          <li>When: {{ booking.get('start') }} to {{ booking.get('end') }}</li>
+          <li>Calendar: {{ booking.get('calendar_id') }}</li>
+          <li>Event ID: {{ booking.get('event_id') }}</li>
         </ul>
         <p>If you need to reschedule or cancel, reply to this email or use the support portal.</p>
         <p>Thanks,<br/>Support Team</p>
       </body>
     </html>
+    """)
+
+_BOOKING_PLAIN_TMPL = _PLAIN_ENV.from_string(
+    "Booking Confirmed — {{ service }}\n\n"
+    "Hi {{ customer.get('name') or customer.get('customer_id') }},\n\n"
+    "Your booking {{ booking.get('booking_ref') }} is confirmed.\n"
+    "When: {{ booking.get('start') }} to {{ booking.get('end') }}\n"
+    "Calendar: {{ booking.get('calendar_id') }}\n"
+    "Event ID: {{ booking.get('event_id') }}\n\n"
+    "If you need to reschedule or cancel, reply to this email or use the support portal.\n\n"
+    "Thanks,\nSupport Team\n"
+)
+
+
+def render_booking_confirmation_html(booking: Dict, customer: Dict) -> str:
+    """
+    Simple HTML template for booking confirmation.
+    booking: dict with keys booking_ref, service_id, start, end, calendar_id, event_id
+    customer: dict with keys name, email, phone, customer_id
     """
-    return html
+    return _BOOKING_HTML_TMPL.render(booking=booking, customer=customer, service=booking.get("service_id", "Service"))
 
 
 def render_booking_confirmation_plain(booking: Dict, customer: Dict) -> str:
-    return (
-        f"Booking Confirmed — {booking.get('service_id', 'Service')}\n\n"
-        f"Hi {customer.get('name') or customer.get('customer_id')},\n\n"
-        f"Your booking {booking.get('booking_ref')} is confirmed.\n"
-        f"When: {booking.get('start')} to {booking.get('end')}\n"
-        f"Calendar: {booking.get('calendar_id')}\n"
-        f"Event ID: {booking.get('event_id')}\n\n"
-        "If you need to reschedule or cancel, reply to this email or use the support portal.\n\n"
-        "Thanks,\nSupport Team\n"
-    )
+    return _BOOKING_PLAIN_TMPL.render(booking=booking, customer=customer, service=booking.get("service_id", "Service"))
 
 
 # -------------------------
 # High-level helpers
 # -------------------------
-async def send_booking_confirmation_email(customer_email: str, booking: Dict, customer: Dict, subject: Optional[str] = None) -> dict:
+async def send_booking_confirmation_email(customer_email: str, booking: Dict, customer: Dict, subject: Optional[str] = None, send_at: Optional[int] = None) -> dict:
     """
     Send booking confirmation to the customer and BCC admin.
+    send_at: optional unix time to have SendGrid deliver it later (e.g. a reminder).
     """
     if not customer_email:
         logger.warning("No customer email provided for booking confirmation: %s", booking.get("booking_ref"))
@@ -199,23 +604,93 @@ async def send_booking_confirmation_email(customer_email: str, booking: Dict, cu
     html = render_booking_confirmation_html(booking, customer)
     plain = render_booking_confirmation_plain(booking, customer)
 
-    res = await send_email(subject, customer_email, html, plain, from_email=EMAIL_FROM)
-
-    # Optionally send copy to admin
-    try:
-        if ADMIN_EMAIL and ADMIN_EMAIL != customer_email:
-            admin_subject = f"[COPY] {subject}"
-            await send_email(admin_subject, ADMIN_EMAIL, html, plain, from_email=EMAIL_FROM)
-    except Exception:
-        logger.exception("Failed to send admin copy for booking %s", booking.get("booking_ref"))
-
-    return res
+    # One message (one SMTP DATA / one SendGrid call) reaches both customer and admin
+    bcc = [ADMIN_EMAIL] if ADMIN_EMAIL and ADMIN_EMAIL != customer_email else None
+    return await send_email(subject, customer_email, html, plain, from_email=EMAIL_FROM, bcc=bcc, send_at=send_at)
 
 
 async def send_generic_email(to_email: str, subject: str, body_html: str, body_plain: Optional[str] = None, from_email: Optional[str] = None) -> dict:
     return await send_email(subject, to_email, body_html, body_plain, from_email)
 
 
+# -------------------------
+# Background outbox (bounded fire-and-forget)
+# -------------------------
+_outbox: Optional[asyncio.Queue] = None
+_outbox_workers: List[asyncio.Task] = []
+_outbox_dropped = 0
+
+
+async def _outbox_worker() -> None:
+    while True:
+        send, args, kwargs = await _outbox.get()
+        try:
+            await send(*args, **kwargs)
+        except Exception:
+            logger.exception("Queued email send failed (%s)", getattr(send, "__name__", send))
+        finally:
+            _outbox.task_done()
+
+
+def start_outbox() -> None:
+    """Start the outbox workers on the running loop (idempotent)."""
+    global _outbox, _outbox_workers
+    if _outbox_workers and not all(t.done() for t in _outbox_workers):
+        return
+    _outbox = asyncio.Queue(maxsize=EMAIL_OUTBOX_MAX)
+    _outbox_workers = [asyncio.create_task(_outbox_worker()) for _ in range(max(1, EMAIL_OUTBOX_WORKERS))]
+
+
+def enqueue(send, *args, **kwargs) -> bool:
+    """
+    Queue `await send(*args, **kwargs)` (e.g. send_booking_confirmation_email) for the
+    outbox workers instead of spawning a task per email. A fixed number of workers bounds
+    concurrent sends; when the queue is full the email is dropped and logged (False).
+    """
+    global _outbox_dropped
+    start_outbox()
+    try:
+        _outbox.put_nowait((send, args, kwargs))
+        return True
+    except asyncio.QueueFull:
+        _outbox_dropped += 1
+        logger.error("Email outbox full (%d queued); dropped %s (%d dropped so far)", _outbox.qsize(), getattr(send, "__name__", send), _outbox_dropped)
+        return False
+
+
+async def _stop_outbox(timeout: float = 10.0) -> None:
+    global _outbox_workers
+    if not _outbox_workers:
+        return
+    try:
+        # give queued mail a chance to go out before the workers are cancelled
+        await asyncio.wait_for(_outbox.join(), timeout)
+    except asyncio.TimeoutError:
+        logger.warning("Email outbox shutdown: %d sends not delivered", _outbox.qsize())
+    for t in _outbox_workers:
+        t.cancel()
+    await asyncio.gather(*_outbox_workers, return_exceptions=True)
+    _outbox_workers = []
+
+
+# -------------------------
+# Shutdown
+# -------------------------
+async def close_connections() -> None:
+    """Drain the outbox, then close the shared SendGrid client and idle pooled SMTP connections (useful on shutdown)."""
+    global _sendgrid_http
+    await _stop_outbox()
+    if _sendgrid_http is not None and not _sendgrid_http.is_closed:
+        try:
+            await _sendgrid_http.aclose()
+        except Exception:
+            pass
+    _sendgrid_http = None
+    for pool in list(_SMTP_POOLS.values()):
+        pool.close_idle()
+    _SMTP_POOLS.clear()
+
+
 # -------------------------
 # Convenience demo function
 # -------------------------
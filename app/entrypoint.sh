@@ -36,10 +36,10 @@ except Exception as e:
 PY
 
 if [ "${FLASK_ENV:-production}" = "development" ]; then
-  export FLASK_APP=app.main
-  flask run --host="${FLASK_RUN_HOST:-0.0.0.0}" --port="${FLASK_RUN_PORT:-4000}"
+  export QUART_APP=app.main
+  quart run --host="${FLASK_RUN_HOST:-0.0.0.0}" --port="${FLASK_RUN_PORT:-4000}"
 else
-  exec gunicorn --bind "${FLASK_RUN_HOST:-0.0.0.0}:${FLASK_RUN_PORT:-4000}" "app.main:app" --workers 3 --threads 4 --log-level info
+  exec hypercorn --bind "${FLASK_RUN_HOST:-0.0.0.0}:${FLASK_RUN_PORT:-4000}" "app.main:app" --workers "${WEB_CONCURRENCY:-4}" --worker-class "${HYPERCORN_WORKER_CLASS:-uvloop}" --log-level info
 fi
 ENTRY
 
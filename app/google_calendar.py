@@ -1,39 +1,52 @@
 # app/google_calendar.py
 """
-Google Calendar helpers (sync) with optional impersonation using a service account.
+Google Calendar helpers (async) with optional impersonation using a service account.
 
-This module uses the google-api-python-client (sync) because the official client is blocking.
-It is written so you can call it from synchronous Flask endpoints or wrap calls with
-asyncio.to_thread() if you are using async endpoints (Quart/async Flask).
+Calls go straight to the Calendar v3 REST API over a shared keep-alive
+httpx.AsyncClient, so async endpoints (Quart/async Flask) await them directly
+instead of parking a worker thread per call. google-auth is only used to mint
+the bearer token, which is cached until it expires.
 
 Environment variables:
  - GOOGLE_SERVICE_ACCOUNT_JSON_PATH  -> path to service account JSON
  - GOOGLE_IMPERSONATED_USER          -> optional user to impersonate (domain-wide delegation)
  - GOOGLE_CALENDAR_DEFAULT_ID        -> optional default calendar id (e.g. primary)
+ - GOOGLE_CALENDAR_BATCH_WINDOW      -> seconds to coalesce concurrent freebusy/event calls into
+                                        one batch POST (default 0.02; 0 sends each call directly)
+ - GOOGLE_FREEBUSY_CACHE_TTL         -> seconds a day's freebusy answer is reused by freebusy_for_day
+                                        (default 30; 0 disables the cache)
 
-Usage (sync):
+Usage (async):
     from app.google_calendar import freebusy, create_event
-    fb = freebusy(["primary"], "2025-12-01T00:00:00Z", "2025-12-01T23:59:59Z")
-    ev = create_event("primary", {...})
+    fb = await freebusy(["primary"], "2025-12-01T00:00:00Z", "2025-12-01T23:59:59Z")
+    ev = await create_event("primary", {...})
 
-Usage (async within async app):
-    from asyncio import to_thread
-    fb = await to_thread(freebusy, ["primary"], time_min, time_max)
+Usage (sync scripts):
+    import asyncio
+    fb = asyncio.run(freebusy(["primary"], time_min, time_max))
 
 Notes:
- - This module does not attempt to cache credentials; it creates a service object per call.
- - For high-throughput systems, reuse the service object or implement a small pool.
+ - The service account JSON is read once; credentials are cached per impersonated subject.
+ - Failed API calls raise httpx.HTTPStatusError (logged here first).
 """
 from __future__ import annotations
 import os
 import json
+import time
+import calendar
+import asyncio
 import logging
-from typing import List, Dict, Any, Optional
+import threading
+import secrets
+import functools
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Tuple, Iterable, Iterator
+from urllib.parse import quote, urlencode
 
+import httpx
 from dotenv import load_dotenv
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
 
 load_dotenv()
 logger = logging.getLogger("google_calendar")
@@ -42,196 +55,574 @@ SERVICE_ACCOUNT_PATH = os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON_PATH")
 IMPERSONATE = os.getenv("GOOGLE_IMPERSONATED_USER")  # optional
 DEFAULT_CALENDAR_ID = os.getenv("GOOGLE_CALENDAR_DEFAULT_ID", "primary")
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
+CALENDAR_API_BASE = "https://www.googleapis.com/calendar/v3"
+CALENDAR_BATCH_URL = "https://www.googleapis.com/batch/calendar/v3"
+CALENDAR_BATCH_MAX = 50  # Google's per-batch sub-request limit
+CALENDAR_BATCH_WINDOW = float(os.getenv("GOOGLE_CALENDAR_BATCH_WINDOW", "0.02"))
+FREEBUSY_CACHE_TTL = float(os.getenv("GOOGLE_FREEBUSY_CACHE_TTL", "30"))
+FREEBUSY_CACHE_MAX = 1024
 
+_SA_INFO: Optional[Dict[str, Any]] = None
 if not SERVICE_ACCOUNT_PATH:
     logger.warning("GOOGLE_SERVICE_ACCOUNT_JSON_PATH not set. Google Calendar functions will fail until set.")
+else:
+    try:
+        with open(SERVICE_ACCOUNT_PATH) as fh:
+            _SA_INFO = json.load(fh)
+    except Exception:
+        logger.exception("Could not read service account JSON at %s", SERVICE_ACCOUNT_PATH)
+
+@functools.cache
+def _google_auth():
+    """
+    google-auth pieces, imported on first use: the transport pulls in `requests`,
+    which only token minting needs.
+    """
+    from google.oauth2 import service_account
+    from google.auth.transport.requests import Request
+    return service_account, Request
+
+
+_CREDS_CACHE: Dict[Optional[str], Any] = {}
+_CREDS_LOCK = threading.Lock()
 
 
 def _get_credentials(impersonate: Optional[str] = None):
     """
-    Load service account credentials and optionally impersonate a user.
-    Raises RuntimeError if SERVICE_ACCOUNT_PATH is not set.
+    Return (cached) service account credentials, optionally impersonating a user.
+    Raises RuntimeError if the service account JSON is not configured/readable.
     """
-    if not SERVICE_ACCOUNT_PATH:
+    if _SA_INFO is None:
         raise RuntimeError("GOOGLE_SERVICE_ACCOUNT_JSON_PATH is not configured")
-    credentials = service_account.Credentials.from_service_account_file(SERVICE_ACCOUNT_PATH, scopes=SCOPES)
     subject = impersonate or IMPERSONATE
-    if subject:
-        credentials = credentials.with_subject(subject)
+    with _CREDS_LOCK:
+        credentials = _CREDS_CACHE.get(subject)
+        if credentials is None:
+            service_account, _ = _google_auth()
+            credentials = service_account.Credentials.from_service_account_info(_SA_INFO, scopes=SCOPES)
+            if subject:
+                credentials = credentials.with_subject(subject)
+            _CREDS_CACHE[subject] = credentials
     return credentials
 
 
-def _get_service(impersonate: Optional[str] = None):
+async def _token(impersonate: Optional[str] = None) -> str:
     """
-    Build a google calendar service object.
-    Keep discovery cache disabled (cache_discovery=False) to avoid filesystem writes in some environments.
+    Bearer token for the subject. google-auth's refresh is blocking, so it runs in a
+    thread, and only when the cached token is missing or about to expire.
     """
     creds = _get_credentials(impersonate)
-    return build("calendar", "v3", credentials=creds, cache_discovery=False)
+    if not creds.valid:
+        _, Request = _google_auth()
+        await asyncio.to_thread(creds.refresh, Request())
+    return creds.token
+
+
+async def _auth_headers(impersonate: Optional[str] = None) -> Dict[str, str]:
+    return {"Authorization": f"Bearer {await _token(impersonate)}"}
+
+
+_cal_http = None
+_cal_http_loop = None
+
+
+def _ensure_cal_http():
+    """
+    Shared keep-alive client for the Calendar API, rebuilt if the event loop changed.
+    """
+    global _cal_http, _cal_http_loop
+    loop = asyncio.get_running_loop()
+    if _cal_http is None or _cal_http.is_closed or _cal_http_loop is not loop:
+        _cal_http = httpx.AsyncClient(
+            base_url=CALENDAR_API_BASE,
+            timeout=30,
+            # retries cover connect-time failures only (DNS/TCP), never a sent request
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=2,
+                limits=httpx.Limits(max_keepalive_connections=32),
+            ),
+        )
+        _cal_http_loop = loop
+    return _cal_http
+
+
+async def _call(what: str, method: str, path: str, impersonate: Optional[str] = None, params: Optional[Dict[str, Any]] = None, body: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Perform one Calendar API request and return the decoded JSON ({} for empty bodies).
+    """
+    if params:
+        params = {k: v for k, v in params.items() if v is not None}
+    try:
+        resp = await _ensure_cal_http().request(method, path, params=params, json=body, headers=await _auth_headers(impersonate))
+        resp.raise_for_status()
+    except httpx.HTTPStatusError as e:
+        logger.exception("Google %s HTTP error: %s %s", what, e.response.status_code, e.response.text)
+        raise
+    if not resp.content:
+        return {}
+    return resp.json()
+
+
+def _events_path(calendar_id: str, event_id: Optional[str] = None) -> str:
+    path = f"/calendars/{quote(calendar_id, safe='')}/events"
+    if event_id is not None:
+        path += f"/{quote(event_id, safe='')}"
+    return path
+
+
+async def warmup() -> None:
+    """
+    Open the Calendar API connection (DNS + TCP + TLS) and mint the bearer token
+    ahead of the first real call. Call once the serving event loop is running;
+    failures are ignored.
+    """
+    try:
+        await _ensure_cal_http().head("/")
+        if _SA_INFO is not None:
+            await _token()
+    except Exception as e:
+        logger.debug("Google Calendar warmup failed: %s", e)
+
+
+async def close_connections() -> None:
+    """Close the shared Calendar API client (useful on shutdown)."""
+    global _cal_http
+    await _BATCHER.close()
+    if _cal_http is not None and not _cal_http.is_closed:
+        try:
+            await _cal_http.aclose()
+        except Exception:
+            pass
+    _cal_http = None
 
 
 # -------------------------
 # Freebusy (availability)
 # -------------------------
-def freebusy(calendar_ids: List[str], time_min: str, time_max: str, impersonate: Optional[str] = None) -> Dict[str, Any]:
+async def freebusy(calendar_ids: List[str], time_min: str, time_max: str, impersonate: Optional[str] = None) -> Dict[str, Any]:
     """
     Query free/busy for a list of calendar IDs between time_min and time_max (RFC3339 strings).
     Returns the raw API response.
     """
-    svc = _get_service(impersonate)
     body = {
         "timeMin": time_min,
         "timeMax": time_max,
         "items": [{"id": cid} for cid in calendar_ids],
     }
-    try:
-        resp = svc.freebusy().query(body=body).execute()
-        return resp
-    except HttpError as e:
-        logger.exception("Google freebusy HttpError: %s", e)
-        raise
+    return await _submit("freebusy", CalOp("POST", "/freeBusy", body=body), impersonate)
+
+
+# (sorted calendar ids, day) -> (expires_at, freebusy response); LRU, event-loop only
+_FreebusyKey = Tuple[Tuple[str, ...], str]
+_FB_CACHE: "OrderedDict[_FreebusyKey, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_FB_INFLIGHT: Dict[_FreebusyKey, "asyncio.Task[Dict[str, Any]]"] = {}
+
+
+def _forget_freebusy(calendar_id: str) -> None:
+    """Drop cached and in-flight freebusy answers that cover calendar_id."""
+    for key in [k for k in _FB_CACHE if calendar_id in k[0]]:
+        del _FB_CACHE[key]
+    for key in [k for k in _FB_INFLIGHT if calendar_id in k[0]]:
+        # the fetch still answers its waiters, it just isn't stored
+        del _FB_INFLIGHT[key]
+
+
+def _store_freebusy(key: _FreebusyKey, task: "asyncio.Task[Dict[str, Any]]") -> None:
+    if _FB_INFLIGHT.get(key) is not task:
+        return
+    del _FB_INFLIGHT[key]
+    if task.cancelled() or task.exception() is not None:
+        return
+    _FB_CACHE[key] = (time.monotonic() + FREEBUSY_CACHE_TTL, task.result())
+    _FB_CACHE.move_to_end(key)
+    while len(_FB_CACHE) > FREEBUSY_CACHE_MAX:
+        _FB_CACHE.popitem(last=False)
+
+
+async def freebusy_for_day(calendar_ids: List[str], date: str, impersonate: Optional[str] = None) -> Dict[str, Any]:
+    """
+    freebusy() over the UTC day `date` (YYYY-MM-DD), reused for FREEBUSY_CACHE_TTL seconds.
+    Concurrent callers for the same (calendars, day) share one API call. Event writes made
+    through this module drop the affected calendars' entries, so our own bookings show up
+    immediately; changes made elsewhere may take up to the TTL.
+    """
+    ids = tuple(sorted(set(calendar_ids)))
+    time_min, time_max = f"{date}T00:00:00Z", f"{date}T23:59:59Z"
+    if FREEBUSY_CACHE_TTL <= 0 or impersonate is not None:
+        return await freebusy(list(ids), time_min, time_max, impersonate)
+
+    key = (ids, date)
+    hit = _FB_CACHE.get(key)
+    if hit is not None:
+        if hit[0] > time.monotonic():
+            _FB_CACHE.move_to_end(key)
+            return hit[1]
+        del _FB_CACHE[key]
+
+    task = _FB_INFLIGHT.get(key)
+    if task is None:
+        task = asyncio.ensure_future(freebusy(list(ids), time_min, time_max))
+        _FB_INFLIGHT[key] = task
+        task.add_done_callback(functools.partial(_store_freebusy, key))
+    # shield: one waiter going away must not cancel the fetch for the others
+    return await asyncio.shield(task)
 
 
 # -------------------------
 # Create event
 # -------------------------
-def create_event(calendar_id: str, event_body: Dict[str, Any], impersonate: Optional[str] = None, send_updates: str = "all") -> Dict[str, Any]:
+async def create_event(calendar_id: str, event_body: Dict[str, Any], impersonate: Optional[str] = None, send_updates: str = "all") -> Dict[str, Any]:
     """
     Create an event in calendar_id. event_body follows Google Calendar API event structure.
     send_updates: 'all'|'externalOnly'|'none'
     Returns the created event resource.
     """
-    svc = _get_service(impersonate)
-    try:
-        event = svc.events().insert(calendarId=calendar_id, body=event_body, sendUpdates=send_updates).execute()
-        return event
-    except HttpError as e:
-        logger.exception("Google create_event HttpError: %s", e)
-        raise
+    return await _submit_write("create_event", calendar_id, CalOp("POST", _events_path(calendar_id), params={"sendUpdates": send_updates}, body=event_body), impersonate)
 
 
 # -------------------------
 # Update (patch) event
 # -------------------------
-def update_event(calendar_id: str, event_id: str, event_body: Dict[str, Any], impersonate: Optional[str] = None, send_updates: str = "all") -> Dict[str, Any]:
+async def update_event(calendar_id: str, event_id: str, event_body: Dict[str, Any], impersonate: Optional[str] = None, send_updates: str = "all") -> Dict[str, Any]:
     """
     Patch/update an existing event. Returns the updated event resource.
     """
-    svc = _get_service(impersonate)
-    try:
-        event = svc.events().patch(calendarId=calendar_id, eventId=event_id, body=event_body, sendUpdates=send_updates).execute()
-        return event
-    except HttpError as e:
-        logger.exception("Google update_event HttpError: %s", e)
-        raise
+    return await _submit_write("update_event", calendar_id, CalOp("PATCH", _events_path(calendar_id, event_id), params={"sendUpdates": send_updates}, body=event_body), impersonate)
 
 
 # -------------------------
 # Delete event
 # -------------------------
-def delete_event(calendar_id: str, event_id: str, impersonate: Optional[str] = None, send_updates: str = "all") -> Dict[str, Any]:
+async def delete_event(calendar_id: str, event_id: str, impersonate: Optional[str] = None, send_updates: str = "all") -> Dict[str, Any]:
     """
     Delete an event. Returns an empty response on success.
     """
-    svc = _get_service(impersonate)
-    try:
-        resp = svc.events().delete(calendarId=calendar_id, eventId=event_id, sendUpdates=send_updates).execute()
-        return resp or {}
-    except HttpError as e:
-        logger.exception("Google delete_event HttpError: %s", e)
-        raise
+    return await _submit_write("delete_event", calendar_id, CalOp("DELETE", _events_path(calendar_id, event_id), params={"sendUpdates": send_updates}), impersonate)
 
 
 # -------------------------
 # List events (simple wrapper)
 # -------------------------
-def list_events(calendar_id: str, time_min: Optional[str] = None, time_max: Optional[str] = None, max_results: int = 50, q: Optional[str] = None, order_by: str = "startTime", single_events: bool = True, impersonate: Optional[str] = None) -> Dict[str, Any]:
+async def list_events(calendar_id: str, time_min: Optional[str] = None, time_max: Optional[str] = None, max_results: int = 50, q: Optional[str] = None, order_by: str = "startTime", single_events: bool = True, impersonate: Optional[str] = None) -> Dict[str, Any]:
     """
     List events from a calendar. time_min/time_max are RFC3339 strings.
     Returns API response with 'items' list.
     """
-    svc = _get_service(impersonate)
-    try:
-        req = svc.events().list(
-            calendarId=calendar_id,
-            timeMin=time_min,
-            timeMax=time_max,
-            maxResults=max_results,
-            q=q,
-            orderBy=order_by,
-            singleEvents=single_events,
-        )
-        resp = req.execute()
-        return resp
-    except HttpError as e:
-        logger.exception("Google list_events HttpError: %s", e)
-        raise
+    params = {
+        "timeMin": time_min,
+        "timeMax": time_max,
+        "maxResults": max_results,
+        "q": q,
+        "orderBy": order_by,
+        "singleEvents": "true" if single_events else "false",
+    }
+    return await _call("list_events", "GET", _events_path(calendar_id), impersonate, params=params)
 
 
 # -------------------------
-# Convenience: compute available slots from freebusy response
+# Batch (several calls, one HTTP round-trip)
 # -------------------------
-from datetime import datetime, timedelta
+@dataclass
+class CalOp:
+    """
+    One Calendar API call for batch_calendar(). path is relative to /calendar/v3,
+    e.g. CalOp("POST", "/freeBusy", body={...}) or
+    CalOp("POST", _events_path("primary"), params={"sendUpdates": "none"}, body=event).
+    """
+    method: str
+    path: str
+    params: Optional[Dict[str, Any]] = None
+    body: Optional[Dict[str, Any]] = None
 
 
-def compute_free_slots_from_freebusy(freebusy_resp: Dict[str, Any], date_str: str, duration_minutes: int = 30, work_start: int = 9, work_end: int = 17, timezone_str: str = "UTC") -> List[Dict[str, str]]:
+class CalendarBatchError(Exception):
+    """A single sub-request of a batch failed; returned in place of its result."""
+
+    def __init__(self, status: int, body: Any):
+        super().__init__(f"calendar batch item failed with HTTP {status}")
+        self.status = status
+        self.body = body
+
+
+def _batch_body(ops: List[CalOp], boundary: str) -> bytes:
+    parts: List[str] = []
+    for i, op in enumerate(ops):
+        url = "/calendar/v3" + op.path
+        params = {k: v for k, v in (op.params or {}).items() if v is not None}
+        if params:
+            url += "?" + urlencode(params)
+        lines = [
+            f"--{boundary}",
+            "Content-Type: application/http",
+            f"Content-ID: <item{i}>",
+            "",
+            f"{op.method} {url} HTTP/1.1",
+        ]
+        if op.body is not None:
+            lines += ["Content-Type: application/json", "", json.dumps(op.body)]
+        else:
+            lines += [""]
+        parts.append("\r\n".join(lines))
+    parts.append(f"--{boundary}--")
+    return ("\r\n".join(parts) + "\r\n").encode("utf-8")
+
+
+def _parse_batch_response(resp: httpx.Response, count: int) -> List[Any]:
     """
-    Given a freebusy API response (as returned by freebusy()) and a date string 'YYYY-MM-DD',
-    compute possible free slots of length duration_minutes within working hours (work_start..work_end).
-    Returns list of {"start": RFC3339, "end": RFC3339}
+    Split a multipart/mixed batch response back into per-op results, ordered like the
+    request (matched by Content-ID, since Google may reorder parts).
+    """
+    ctype = resp.headers.get("content-type", "")
+    boundary = ctype.split("boundary=", 1)[-1].strip().strip('"')
+    results: List[Any] = [CalendarBatchError(0, "missing from batch response")] * count
+    for part in resp.text.split(f"--{boundary}"):
+        part = part.strip()
+        if not part or part == "--":
+            continue
+        # part headers / embedded HTTP response (status line + headers) / body
+        outer, _, inner = part.replace("\r\n", "\n").partition("\n\n")
+        idx = None
+        for line in outer.split("\n"):
+            if line.lower().startswith("content-id:") and "item" in line:
+                try:
+                    idx = int(line.rsplit("item", 1)[1].strip(" >"))
+                except ValueError:
+                    idx = None
+        if idx is None or not 0 <= idx < count:
+            continue
+        head, _, body = inner.partition("\n\n")
+        try:
+            status = int(head.split(None, 2)[1])
+        except (IndexError, ValueError):
+            status = 0
+        body = body.strip()
+        try:
+            data = json.loads(body) if body else {}
+        except ValueError:
+            data = body
+        results[idx] = data if 200 <= status < 300 else CalendarBatchError(status, data)
+    return results
+
+
+async def batch_calendar(ops: List[CalOp], impersonate: Optional[str] = None) -> List[Any]:
+    """
+    Run several Calendar API calls in one multipart POST to the batch endpoint
+    (chunked at 50 sub-requests). Returns one entry per op, in order: the decoded
+    JSON on success, or a CalendarBatchError instance for a failed sub-request.
+
+    Sub-requests are not ordered or transactional on Google's side, so don't batch
+    calls that depend on each other's result (e.g. freebusy gating an insert).
+    """
+    results: List[Any] = []
+    for i in range(0, len(ops), CALENDAR_BATCH_MAX):
+        chunk = ops[i:i + CALENDAR_BATCH_MAX]
+        boundary = "batch_" + secrets.token_hex(8)
+        headers = await _auth_headers(impersonate)
+        headers["Content-Type"] = f"multipart/mixed; boundary={boundary}"
+        try:
+            resp = await _ensure_cal_http().post(CALENDAR_BATCH_URL, content=_batch_body(chunk, boundary), headers=headers)
+            resp.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            logger.exception("Google batch HTTP error: %s %s", e.response.status_code, e.response.text)
+            raise
+        results.extend(_parse_batch_response(resp, len(chunk)))
+    return results
+
+
+class CalendarBatcher:
+    """
+    Coalesces Calendar calls from concurrent requests into batch_calendar() POSTs.
+
+    The worker waits `window` seconds after the first queued call, then sends everything
+    that arrived: one batch per impersonated subject (batch_calendar chunks at 50), or a
+    plain request when a call is alone. Each caller gets its own result, or its own
+    exception (CalendarBatchError for a failed sub-request).
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+        self._inflight: set = set()
+
+    async def submit(self, what: str, op: CalOp, impersonate: Optional[str] = None) -> Any:
+        if self._worker is None or self._worker.done():
+            # keep an existing queue: calls already waiting on it must reach the new worker
+            if self._queue is None:
+                self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+        fut = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((what, op, impersonate, fut))
+        return await fut
+
+    async def close(self) -> None:
+        """Stop collecting, fail calls not yet sent and let already-dispatched batches finish."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        if self._queue is not None:
+            leftover = []
+            while not self._queue.empty():
+                leftover.append(self._queue.get_nowait())
+            self._fail(leftover, RuntimeError("calendar batcher closed"))
+            self._queue = None
+        if self._inflight:
+            await asyncio.gather(*self._inflight, return_exceptions=True)
+
+    async def _run(self) -> None:
+        pending: List[Tuple[str, CalOp, Optional[str], asyncio.Future]] = []
+        try:
+            while True:
+                pending = [await self._queue.get()]
+                await asyncio.sleep(self.window)
+                while not self._queue.empty():
+                    pending.append(self._queue.get_nowait())
+                groups: Dict[Optional[str], List[Tuple[str, CalOp, Optional[str], asyncio.Future]]] = {}
+                for item in pending:
+                    groups.setdefault(item[2], []).append(item)
+                for impersonate, items in groups.items():
+                    task = asyncio.create_task(self._flush(impersonate, items))
+                    self._inflight.add(task)
+                    task.add_done_callback(self._inflight.discard)
+                pending = []
+        except asyncio.CancelledError:
+            # cancelled mid-window: the calls being collected were never sent
+            self._fail(pending, RuntimeError("calendar batcher closed"))
+            raise
+
+    @staticmethod
+    def _fail(items: List[Tuple[str, CalOp, Optional[str], asyncio.Future]], exc: BaseException) -> None:
+        for _, _, _, fut in items:
+            if not fut.done():
+                fut.set_exception(exc)
+
+    async def _flush(self, impersonate: Optional[str], items: List[Tuple[str, CalOp, Optional[str], asyncio.Future]]) -> None:
+        try:
+            if len(items) == 1:
+                what, op, _, _ = items[0]
+                results = [await _call(what, op.method, op.path, impersonate, params=op.params, body=op.body)]
+            else:
+                results = await batch_calendar([op for _, op, _, _ in items], impersonate)
+        except Exception as e:
+            self._fail(items, e)
+            return
+        for (what, _, _, fut), res in zip(items, results):
+            # a request that went away cancels its future; skip it
+            if fut.done():
+                continue
+            if isinstance(res, CalendarBatchError):
+                logger.error("Google %s failed in batch: %s %s", what, res.status, res.body)
+                fut.set_exception(res)
+            else:
+                fut.set_result(res)
+
+
+_BATCHER = CalendarBatcher(CALENDAR_BATCH_WINDOW)
+
+
+async def _submit(what: str, op: CalOp, impersonate: Optional[str] = None) -> Dict[str, Any]:
+    if CALENDAR_BATCH_WINDOW <= 0:
+        return await _call(what, op.method, op.path, impersonate, params=op.params, body=op.body)
+    return await _BATCHER.submit(what, op, impersonate)
+
+
+async def _submit_write(what: str, calendar_id: str, op: CalOp, impersonate: Optional[str] = None) -> Dict[str, Any]:
+    # Drop cached freebusy for the calendar before and after: a fetch that overlaps the
+    # write may still see the old state and must not be kept.
+    _forget_freebusy(calendar_id)
+    try:
+        return await _submit(what, op, impersonate)
+    finally:
+        _forget_freebusy(calendar_id)
+
+
+# -------------------------
+# Convenience: compute available slots from freebusy response
+# -------------------------
+def _parse_rfc3339_z(ts: str) -> int:
     """
-    # Build day start/end in UTC or using timezone_str if you later integrate tz handling.
-    date = datetime.fromisoformat(date_str)
-    start_dt = datetime(date.year, date.month, date.day, work_start)
-    end_dt = datetime(date.year, date.month, date.day, work_end)
+    Fast path for Google's fixed 'YYYY-MM-DDTHH:MM:SSZ' layout -> UTC epoch seconds.
+    Raises ValueError for anything else.
+    """
+    if len(ts) != 20 or ts[19] != "Z" or ts[10] != "T":
+        raise ValueError(ts)
+    return calendar.timegm((int(ts[0:4]), int(ts[5:7]), int(ts[8:10]), int(ts[11:13]), int(ts[14:16]), int(ts[17:19]), 0, 0, 0))
+
+
+def _busy_utc(ts: str) -> int:
+    # RFC3339 -> UTC epoch seconds (naive values are taken as UTC)
+    try:
+        return _parse_rfc3339_z(ts)
+    except ValueError:
+        pass
+    dt = datetime.fromisoformat(ts.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp())
 
-    # Aggregate busy intervals from all calendars
-    busy_intervals: List[tuple] = []
+
+def _rfc3339(ts: int) -> str:
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(ts))
+
+
+def _iter_busy_ints(freebusy_resp: Dict[str, Any]) -> Iterator[Tuple[int, int]]:
+    """Stream every calendar's busy intervals as (start, end) UTC epoch-second pairs."""
     calendars = freebusy_resp.get("calendars", {}) or {}
     for cal_id, cal_data in calendars.items():
         for b in cal_data.get("busy", []):
             try:
-                bstart = datetime.fromisoformat(b["start"].replace("Z", "+00:00")) if b.get("start") else None
-                bend = datetime.fromisoformat(b["end"].replace("Z", "+00:00")) if b.get("end") else None
-                if bstart and bend:
-                    busy_intervals.append((bstart, bend))
+                if b.get("start") and b.get("end"):
+                    yield _busy_utc(b["start"]), _busy_utc(b["end"])
             except Exception:
                 # skip unparsable
                 logger.debug("Skipping unparsable busy interval: %s", b)
 
-    # Merge overlapping busy intervals
-    busy_intervals.sort(key=lambda x: x[0])
-    merged: List[tuple] = []
-    for interval in busy_intervals:
-        if not merged:
-            merged.append(interval)
-            continue
-        last = merged[-1]
-        if interval[0] <= last[1]:
-            # overlap -> merge
-            merged[-1] = (last[0], max(last[1], interval[1]))
-        else:
-            merged.append(interval)
-
-    # Walk through the day to find free slots
-    slots: List[Dict[str, str]] = []
-    current = start_dt
-    for bstart, bend in merged:
-        if bstart > current:
-            t = current
-            while t + timedelta(minutes=duration_minutes) <= bstart:
-                slots.append({
-                    "start": t.isoformat() + "Z",
-                    "end": (t + timedelta(minutes=duration_minutes)).isoformat() + "Z"
-                })
-                t = t + timedelta(minutes=duration_minutes)
-        current = max(current, bend)
-    # after last busy
-    t = current
-    while t + timedelta(minutes=duration_minutes) <= end_dt:
-        slots.append({
-            "start": t.isoformat() + "Z",
-            "end": (t + timedelta(minutes=duration_minutes)).isoformat() + "Z"
-        })
-        t = t + timedelta(minutes=duration_minutes)
-    return slots
+
+def _slots_from_ints(busy: Iterable[Tuple[int, int]], start_s: int, end_s: int, step: int) -> List[int]:
+    """
+    Integer-only kernel: start times (epoch seconds) of the free step-sized grid slots in
+    [start_s, end_s). Bit i of busy_mask set <=> slot i overlaps a busy interval;
+    overlapping intervals just OR together, so busy can arrive in any order (no
+    sort/merge pass, and no need to materialise it).
+    """
+    day_slots = max(0, (end_s - start_s) // step)
+    busy_mask = 0
+    for bs, be in busy:
+        lo = max(0, (bs - start_s) // step)
+        hi = min(day_slots, -((start_s - be) // step))
+        if hi > lo:
+            busy_mask |= ((1 << hi) - 1) ^ ((1 << lo) - 1)
+
+    # Walk the free bits lowest-first
+    free = ~busy_mask & ((1 << day_slots) - 1)
+    starts: List[int] = []
+    while free:
+        low = free & -free
+        starts.append(start_s + (low.bit_length() - 1) * step)
+        free ^= low
+    return starts
+
+
+def compute_free_slots_from_freebusy(freebusy_resp: Dict[str, Any], date_str: str, duration_minutes: int = 30, work_start: int = 9, work_end: int = 17, timezone_str: str = "UTC") -> List[Dict[str, str]]:
+    """
+    Given a freebusy API response (as returned by freebusy()) and a date string 'YYYY-MM-DD',
+    compute possible free slots of length duration_minutes within working hours (work_start..work_end).
+    Slots are on a fixed duration_minutes grid starting at work_start (UTC).
+    Returns list of {"start": RFC3339, "end": RFC3339}
+    """
+    step = duration_minutes * 60
+    if step <= 0:
+        return []
+
+    # Day bounds in UTC epoch seconds (timezone_str kept for when tz handling is integrated).
+    year, month, day = (int(x) for x in date_str[:10].split("-"))
+    start_s = calendar.timegm((year, month, day, work_start, 0, 0))
+    end_s = calendar.timegm((year, month, day, work_end, 0, 0))
+
+    starts = _slots_from_ints(_iter_busy_ints(freebusy_resp), start_s, end_s, step)
+    return [{"start": _rfc3339(t), "end": _rfc3339(t + step)} for t in starts]
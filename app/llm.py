@@ -7,7 +7,8 @@ Fallback: OpenAI (if OPENAI_API_KEY configured)
 
 Design goals:
  - Minimal assumptions about the exact SalesIQ HTTP contract (make it easy to adapt)
- - Async-friendly (wrap blocking calls with asyncio.to_thread)
+ - Async-friendly: SalesIQ calls go over a shared keep-alive httpx.AsyncClient; blocking
+   SDK calls (OpenAI) are wrapped with asyncio.to_thread
  - Provide the same convenient helpers used across the app:
      - call_chat(messages, ...)
      - embed_texts(texts, ...)
@@ -16,6 +17,8 @@ Design goals:
      - simple_chunk_and_summarize(text, ...)
      - summarize_messages_for_range(messages, n_sentences)
  - Graceful fallbacks and safe defaults for hackathon/demo usage.
+ - Chat responses and embeddings are cached in memory (and in Redis when REDIS_URL is set);
+   LLM_SEMANTIC_CACHE=1 adds a cosine-similarity cache over the user turn.
 """
 
 from __future__ import annotations
@@ -23,13 +26,25 @@ import os
 import json
 import time
 import math
+import operator
 import asyncio
-from typing import List, Tuple, Dict, Any, Optional
+import hashlib
+import functools
+import threading
+import itertools
+from collections import Counter, OrderedDict, deque
+from typing import List, Tuple, Dict, Any, Optional, AsyncIterator
 from asyncio import to_thread
 from dotenv import load_dotenv
 import logging
 import requests
 
+# Async HTTP client for SalesIQ calls (optional); without it calls run requests in a thread
+try:
+    import httpx  # type: ignore
+except Exception:
+    httpx = None  # type: ignore
+
 load_dotenv()
 logger = logging.getLogger("llm")
 logger.setLevel(logging.INFO)
@@ -46,6 +61,37 @@ OPENAI_CHAT_MODEL = os.getenv("OPENAI_CHAT_MODEL", "gpt-4o-mini")
 OPENAI_EMBEDDING_MODEL = os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-large")
 DEFAULT_TEMPERATURE = float(os.getenv("OPENAI_TEMPERATURE", "0.2"))
 
+# Response/embedding caches
+LLM_CACHE_MAX = int(os.getenv("LLM_CACHE_MAX", "1024"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "3600"))
+EMBED_CACHE_MAX = int(os.getenv("EMBED_CACHE_MAX", "8192"))
+LLM_SEMANTIC_CACHE = os.getenv("LLM_SEMANTIC_CACHE", "0").lower() in ("1", "true", "yes")
+LLM_SEMANTIC_THRESHOLD = float(os.getenv("LLM_SEMANTIC_THRESHOLD", "0.95"))
+REDIS_URL = os.getenv("REDIS_URL")
+# Mark the system message cacheable ("cache_control": ephemeral) in SalesIQ payloads;
+# only enable for gateways that honor it — others may reject the extra key.
+LLM_PROMPT_CACHE_CONTROL = os.getenv("LLM_PROMPT_CACHE_CONTROL", "0").lower() in ("1", "true", "yes")
+# Max in-flight LLM calls when fanning out (provider rate limits)
+LLM_CONCURRENCY = int(os.getenv("LLM_CONCURRENCY", "8"))
+
+# Vector math for similarity lookups (optional; pure-Python fallback otherwise)
+try:
+    import numpy as np  # type: ignore
+except Exception:
+    np = None  # type: ignore
+
+# Fast JSON for wire payloads / cache keys (optional; stdlib json fallback)
+try:
+    import orjson  # type: ignore
+except Exception:
+    orjson = None  # type: ignore
+
+# Optional shared cache tier (only used when REDIS_URL is set)
+try:
+    import redis.asyncio as aioredis  # type: ignore
+except Exception:
+    aioredis = None  # type: ignore
+
 # If openai is available, import it; we won't require it if SalesIQ is configured and used exclusively
 try:
     import openai  # type: ignore
@@ -57,11 +103,20 @@ except Exception:
 # -------------------------
 # HTTP helpers for SalesIQ
 # -------------------------
-def _call_salesiq_api_sync(payload: Dict[str, Any], url: Optional[str] = None, api_key: Optional[str] = None, timeout: int = 30) -> Dict[str, Any]:
-    """
-    Generic synchronous POST to SalesIQ API.
-    Expect JSON response. This function is intentionally generic — adapt to your exact SalesIQ contract.
-    """
+def _dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def _loads(raw: Any) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
+
+
+def _salesiq_request(url: Optional[str], api_key: Optional[str]) -> Tuple[str, Dict[str, str]]:
+    """Resolve the target URL and headers for a SalesIQ call."""
     if not (url or SALESIQ_API_URL):
         raise RuntimeError("SalesIQ API URL not configured (SALESIQ_API_URL)")
     if not (api_key or SALESIQ_API_KEY):
@@ -72,25 +127,302 @@ def _call_salesiq_api_sync(payload: Dict[str, Any], url: Optional[str] = None, a
     }
     if api_key or SALESIQ_API_KEY:
         headers["Authorization"] = f"Bearer {api_key or SALESIQ_API_KEY}"
+    return url or SALESIQ_API_URL, headers
+
 
-    final_url = url or SALESIQ_API_URL
+def _call_salesiq_api_sync(payload: Dict[str, Any], url: Optional[str] = None, api_key: Optional[str] = None, timeout: int = 30) -> Dict[str, Any]:
+    """
+    Generic synchronous POST to SalesIQ API.
+    Expect JSON response. This function is intentionally generic — adapt to your exact SalesIQ contract.
+    """
+    final_url, headers = _salesiq_request(url, api_key)
     try:
-        resp = requests.post(final_url, json=payload, headers=headers, timeout=timeout)
+        resp = requests.post(final_url, data=_dumps(payload), headers=headers, timeout=timeout)
         resp.raise_for_status()
-        return resp.json()
+        return _loads(resp.content)
     except Exception as e:
         logger.exception("SalesIQ API call failed: %s", e)
         raise
 
+_salesiq_http = None
+_salesiq_http_loop = None
+
+
+def _ensure_salesiq_http():
+    """
+    Shared keep-alive client for SalesIQ/embedding endpoints. Connections are bound to
+    the event loop, so the client is rebuilt if we're now running on a different one.
+    """
+    global _salesiq_http, _salesiq_http_loop
+    loop = asyncio.get_running_loop()
+    if _salesiq_http is None or _salesiq_http.is_closed or _salesiq_http_loop is not loop:
+        _salesiq_http = httpx.AsyncClient(
+            timeout=30,
+            transport=httpx.AsyncHTTPTransport(
+                retries=2,
+                limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+            ),
+        )
+        _salesiq_http_loop = loop
+    return _salesiq_http
+
+
 async def _call_salesiq_api(payload: Dict[str, Any], url: Optional[str] = None, api_key: Optional[str] = None, timeout: int = 30) -> Dict[str, Any]:
-    return await to_thread(_call_salesiq_api_sync, payload, url, api_key, timeout)
+    """
+    Async POST to SalesIQ over the shared client (no thread hop, connections reused).
+    """
+    if httpx is None:
+        return await to_thread(_call_salesiq_api_sync, payload, url, api_key, timeout)
+    final_url, headers = _salesiq_request(url, api_key)
+    try:
+        resp = await _ensure_salesiq_http().post(final_url, content=_dumps(payload), headers=headers, timeout=timeout)
+        resp.raise_for_status()
+        return _loads(resp.content)
+    except Exception as e:
+        logger.exception("SalesIQ API call failed: %s", e)
+        raise
+
+
+async def close_connections() -> None:
+    """Close the shared SalesIQ client (useful on shutdown)."""
+    global _salesiq_http
+    if _salesiq_http is not None and not _salesiq_http.is_closed:
+        try:
+            await _salesiq_http.aclose()
+        except Exception:
+            pass
+    _salesiq_http = None
+
+# -------------------------
+# Caches
+# -------------------------
+class _LruCache:
+    """
+    Small thread-safe LRU with optional per-entry TTL (seconds; None = no expiry).
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            hit = self._data.get(key)
+            if hit is None:
+                return None
+            value, expires = hit
+            if expires and expires <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        expires = time.monotonic() + self.ttl if self.ttl else 0.0
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+_CHAT_CACHE = _LruCache(LLM_CACHE_MAX, LLM_CACHE_TTL)
+_EMBED_CACHE = _LruCache(EMBED_CACHE_MAX)
+
+
+class _SemanticCache:
+    """
+    Ring buffer of (user-turn embedding, response) for fuzzy hits. With numpy the
+    embeddings are L2-normalized and int8-quantized (symmetric, one scale per row) into
+    a single (maxlen, D) matrix: 4x less memory than float32, and a lookup is one
+    int32-accumulated matrix-vector product. Quantization error (~1e-3 in cosine) is
+    far below the hit threshold's margin.
+    """
+
+    def __init__(self, maxlen: int = 256):
+        self.maxlen = maxlen
+        self._vecs = None  # np.ndarray int8 (maxlen, D) when numpy is available
+        self._scales = None  # np.ndarray float32 (maxlen,)
+        self._plain: "deque[Tuple[List[float], str]]" = deque(maxlen=maxlen)
+        self._responses: List[Optional[str]] = [None] * maxlen
+        self._count = 0
+        self._next = 0
+        self._space: Optional[str] = None  # embedding space of the stored vectors
+        self._lock = threading.Lock()
+
+    def add(self, vec: List[float], response: str, space: str) -> None:
+        with self._lock:
+            if space != self._space:
+                # vectors from another provider/model aren't comparable: start over
+                self._plain.clear()
+                self._vecs = None
+                self._space = space
+            if np is None:
+                self._plain.append((vec, response))
+                return
+            row, scale = _quantize(_l2_normalize(vec))
+            if self._vecs is None or self._vecs.shape[1] != row.shape[0]:
+                self._vecs = np.zeros((self.maxlen, row.shape[0]), dtype=np.int8)
+                self._scales = np.zeros(self.maxlen, dtype=np.float32)
+                self._count = self._next = 0
+            self._vecs[self._next] = row
+            self._scales[self._next] = scale
+            self._responses[self._next] = response
+            self._next = (self._next + 1) % self.maxlen
+            self._count = min(self._count + 1, self.maxlen)
+
+    def lookup(self, vec: List[float], threshold: float, space: str) -> Optional[str]:
+        with self._lock:
+            if space != self._space:
+                return None
+            if np is None:
+                best, best_sim = None, threshold
+                for cached_vec, response in self._plain:
+                    sim = cosine_sim(vec, cached_vec)
+                    if sim >= best_sim:
+                        best, best_sim = response, sim
+                return best
+            if not self._count or self._vecs.shape[1] != len(vec):
+                return None
+            q, q_scale = _quantize(_l2_normalize(vec))
+            n = self._count
+            dots = np.einsum("nd,d->n", self._vecs[:n], q, dtype=np.int32)
+            sims = dots * (self._scales[:n] * q_scale)
+            i = int(sims.argmax())
+            return self._responses[i] if sims[i] >= threshold else None
+
+
+_SEMANTIC_CACHE = _SemanticCache(256)
+
+_redis_client = None
+
+
+def _redis():
+    global _redis_client
+    if _redis_client is None and REDIS_URL and aioredis is not None:
+        _redis_client = aioredis.from_url(REDIS_URL)
+    return _redis_client
+
+
+async def _redis_get(key: str) -> Any:
+    client = _redis()
+    if client is None:
+        return None
+    try:
+        raw = await client.get(key)
+        return _loads(raw) if raw is not None else None
+    except Exception:
+        logger.debug("Redis cache get failed for %s", key, exc_info=True)
+        return None
+
+
+async def _redis_set(key: str, value: Any, ttl: Optional[float] = None) -> None:
+    client = _redis()
+    if client is None:
+        return
+    try:
+        await client.set(key, _dumps(value), ex=int(ttl) if ttl else None)
+    except Exception:
+        logger.debug("Redis cache set failed for %s", key, exc_info=True)
+
+
+def _cache_key(prefix: str, *parts: Any) -> str:
+    if orjson is not None:
+        raw = orjson.dumps(parts, option=orjson.OPT_SORT_KEYS, default=str)
+    else:
+        raw = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str).encode("utf-8")
+    return prefix + hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+
+def _prompt_key(system: str, user: str) -> str:
+    """Digest of a locally built system+user prompt (no serialization of the messages list)."""
+    h = hashlib.blake2b(system.encode("utf-8"), digest_size=16)
+    h.update(b"\x00")
+    h.update(user.encode("utf-8"))
+    return h.hexdigest()
+
+
+def _embed_key(space: str, text: str) -> str:
+    return "llm:emb:" + hashlib.blake2b(f"{space}\x00{text}".encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _embed_space(model: Optional[str] = None) -> str:
+    """
+    "<provider>:<model>" that _embed_texts_uncached tries first. Vectors are cached per
+    space, so a provider fallback never serves vectors from a different embedding space.
+    """
+    if SALESIQ_EMBEDDING_URL:
+        return f"salesiq:{model or SALESIQ_MODEL}"
+    return f"openai:{model or OPENAI_EMBEDDING_MODEL}"
+
+
+async def find_uncached_texts(texts: List[str], model: Optional[str] = None) -> Tuple[List[Optional[List[float]]], List[int]]:
+    """
+    Look texts up in the embedding cache (memory, then Redis if configured).
+    Returns (vectors with None for misses, indices of the misses).
+    """
+    space = _embed_space(model)
+    vectors: List[Optional[List[float]]] = []
+    missing: List[int] = []
+    for i, text in enumerate(texts):
+        key = _embed_key(space, text)
+        vec = _EMBED_CACHE.get(key)
+        if vec is None:
+            vec = await _redis_get(key)
+            if vec is not None:
+                _EMBED_CACHE.set(key, vec)
+        vectors.append(vec)
+        if vec is None:
+            missing.append(i)
+    return vectors, missing
+
 
 # -------------------------
 # Embeddings via SalesIQ (optional) or OpenAI fallback
 # -------------------------
 async def embed_texts(texts: List[str], model: Optional[str] = None) -> List[List[float]]:
     """
-    Return embeddings for a list of texts.
+    Return embeddings for a list of texts. Repeated texts are embedded once and
+    scattered back; each distinct text is cached, so only texts not seen before
+    are sent to the provider.
+    """
+    # dict keeps first-seen order; positions map every input back to its unique slot
+    slot_of: Dict[str, int] = {}
+    positions = [slot_of.setdefault(t, len(slot_of)) for t in texts]
+    unique = list(slot_of)
+
+    vectors, _ = await _embed_unique(unique, model)
+    if len(unique) == len(texts):
+        return vectors
+    return [vectors[p] for p in positions]
+
+
+async def _embed_unique(unique: List[str], model: Optional[str] = None) -> Tuple[List[List[float]], str]:
+    """embed_texts for distinct texts, plus the "<provider>:<model>" space all vectors share."""
+    space = _embed_space(model)
+    vectors, missing = await find_uncached_texts(unique, model)
+    if missing:
+        fresh, fresh_space = await _embed_texts_uncached([unique[i] for i in missing], model)
+        if fresh_space != space and len(missing) < len(unique):
+            # the provider fell back: cache hits are from the other space, so embed
+            # everything in one call rather than mix vectors from two models
+            missing = list(range(len(unique)))
+            fresh, fresh_space = await _embed_texts_uncached(unique, model)
+        space = fresh_space
+        for i, vec in zip(missing, fresh):
+            vectors[i] = vec
+            if vec is not None:
+                key = _embed_key(space, unique[i])
+                _EMBED_CACHE.set(key, vec)
+                await _redis_set(key, vec)
+    return vectors, space  # type: ignore[return-value]
+
+
+async def _embed_texts_uncached(texts: List[str], model: Optional[str] = None) -> Tuple[List[List[float]], str]:
+    """
+    Return (embeddings for a list of texts, "<provider>:<model>" that produced them).
     Preference order:
       1. SALESIQ_EMBEDDING_URL (if provided)
       2. OpenAI embeddings (if OPENAI_API_KEY available)
@@ -98,39 +430,209 @@ async def embed_texts(texts: List[str], model: Optional[str] = None) -> List[Lis
     """
     # Try SalesIQ embedding endpoint if configured
     if SALESIQ_EMBEDDING_URL:
+        salesiq_model = model or SALESIQ_MODEL
         payload = {
-            "model": model or SALESIQ_MODEL,
+            "model": salesiq_model,
             "inputs": texts,
         }
         try:
             resp = await _call_salesiq_api(payload, url=SALESIQ_EMBEDDING_URL)
             # Try common response shapes. Adapt this to your provider if needed.
             if isinstance(resp, dict) and resp.get("embeddings"):
-                return resp["embeddings"]
+                return resp["embeddings"], f"salesiq:{salesiq_model}"
             if isinstance(resp, dict) and resp.get("data"):
                 # e.g. {"data": [{"embedding": [...]}, ...]}
-                return [item.get("embedding") or item.get("vector") for item in resp["data"]]
+                return [item.get("embedding") or item.get("vector") for item in resp["data"]], f"salesiq:{salesiq_model}"
         except Exception:
             logger.exception("SalesIQ embedding call failed; falling back to OpenAI if available.")
 
     # Fallback to OpenAI embeddings
     if openai and OPENAI_API_KEY:
+        openai_model = model or OPENAI_EMBEDDING_MODEL
+
         def _sync_openai_embed():
-            out = openai.Embedding.create(model=model or OPENAI_EMBEDDING_MODEL, input=texts)
+            out = openai.Embedding.create(model=openai_model, input=texts)
             return [d["embedding"] for d in out["data"]]
-        return await to_thread(_sync_openai_embed)
+        return await to_thread(_sync_openai_embed), f"openai:{openai_model}"
 
     raise RuntimeError("No embeddings provider configured (set SALESIQ_EMBEDDING_URL or OPENAI_API_KEY)")
 
 # -------------------------
 # Primary chat/call wrapper
 # -------------------------
+async def _semantic_lookup(messages: List[Dict[str, str]]) -> Tuple[Optional[str], Optional[List[float]], Optional[str]]:
+    """
+    Embed the user turn(s) and return (cached response, embedding, embedding space) if a
+    stored one is at least LLM_SEMANTIC_THRESHOLD similar. Any embedding failure disables
+    the lookup.
+    """
+    user_text = "\n".join(m.get("content", "") for m in messages if m.get("role") == "user")
+    if not user_text:
+        return None, None, None
+    try:
+        vectors, space = await _embed_unique([user_text])
+    except Exception:
+        logger.debug("Semantic cache embedding failed", exc_info=True)
+        return None, None, None
+    vec = vectors[0]
+    return _SEMANTIC_CACHE.lookup(vec, LLM_SEMANTIC_THRESHOLD, space), vec, space
+
+
 async def call_chat(
     messages: List[Dict[str, str]],
     model: Optional[str] = None,
     max_tokens: Optional[int] = 512,
     temperature: Optional[float] = None,
     stop: Optional[List[str]] = None,
+    prompt_key: Optional[str] = None,
+) -> str:
+    """
+    Cached front for _call_chat_uncached. Identical requests (model, messages and
+    sampling params) are answered from memory/Redis; with LLM_SEMANTIC_CACHE enabled,
+    near-identical user turns (cosine >= LLM_SEMANTIC_THRESHOLD) reuse a stored reply.
+    Callers that built the prompt themselves can pass prompt_key (see _prompt_key)
+    so the messages list isn't serialized just to hash it.
+    """
+    if prompt_key is not None:
+        key = f"llm:chat:{prompt_key}:{model}:{max_tokens}:{temperature}:{stop}"
+    else:
+        key = _cache_key("llm:chat:", model, messages, max_tokens, temperature, stop)
+    cached = _CHAT_CACHE.get(key)
+    if cached is None:
+        cached = await _redis_get(key)
+    if cached is not None:
+        _CHAT_CACHE.set(key, cached)
+        return cached
+
+    vec = space = None
+    if LLM_SEMANTIC_CACHE:
+        hit, vec, space = await _semantic_lookup(messages)
+        if hit is not None:
+            _CHAT_CACHE.set(key, hit)
+            return hit
+
+    out = await _call_chat_uncached(messages, model, max_tokens, temperature, stop)
+    _CHAT_CACHE.set(key, out)
+    await _redis_set(key, out, LLM_CACHE_TTL)
+    if vec is not None:
+        _SEMANTIC_CACHE.add(vec, out, space)
+    return out
+
+
+def _salesiq_chat_payload(messages: List[Dict[str, str]], model: str, max_tokens: Optional[int], temperature: float, stop: Optional[List[str]]) -> Dict[str, Any]:
+    wire_messages = messages
+    if LLM_PROMPT_CACHE_CONTROL and messages and messages[0].get("role") == "system":
+        wire_messages = [{**messages[0], "cache_control": {"type": "ephemeral"}}] + list(messages[1:])
+    return {
+        "model": model,
+        "messages": wire_messages,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "stop": stop,
+    }
+
+
+def _extract_chat_text(resp: Any, max_tokens: Optional[int] = 512) -> str:
+    # Parse a few common response shapes:
+    # 1) {"output": "text..."}
+    if isinstance(resp, dict):
+        if "output" in resp and isinstance(resp["output"], str):
+            return resp["output"]
+        # 2) {"choices":[{"message":{"content":"..."}}]}
+        choices = resp.get("choices")
+        if isinstance(choices, list) and len(choices) > 0:
+            first = choices[0]
+            # try message.content
+            msg = first.get("message") or first.get("delta") or first
+            if isinstance(msg, dict):
+                # message.content or text
+                if "content" in msg:
+                    return msg["content"]
+                if "text" in msg:
+                    return msg["text"]
+            # fallback to string representation
+            return str(first)
+    # fallback: stringify entire response
+    return json.dumps(resp)[:max_tokens or 512]
+
+
+def _sse_delta(data: str) -> str:
+    """Text carried by one SSE `data:` frame ({"choices":[{"delta":{"content":...}}]} or {"output":...})."""
+    try:
+        frame = json.loads(data)
+    except ValueError:
+        return ""
+    if not isinstance(frame, dict):
+        return ""
+    if isinstance(frame.get("output"), str):
+        return frame["output"]
+    choices = frame.get("choices") or []
+    if choices and isinstance(choices[0], dict):
+        delta = choices[0].get("delta") or choices[0].get("message") or {}
+        if isinstance(delta, dict):
+            return delta.get("content") or delta.get("text") or ""
+    return ""
+
+
+async def stream_chat(
+    messages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    max_tokens: Optional[int] = 512,
+    temperature: Optional[float] = None,
+    stop: Optional[List[str]] = None,
+) -> AsyncIterator[str]:
+    """
+    Yield the assistant reply incrementally. SalesIQ is asked for `"stream": true` and
+    its SSE frames are relayed as they arrive; a non-streaming JSON reply, a failure
+    before the first token, or the OpenAI fallback yield the whole reply at once
+    (via call_chat, so cached replies come back immediately).
+    """
+    if SALESIQ_API_URL and httpx is not None:
+        payload = _salesiq_chat_payload(
+            messages,
+            model or SALESIQ_MODEL,
+            max_tokens,
+            DEFAULT_TEMPERATURE if temperature is None else temperature,
+            stop,
+        )
+        payload["stream"] = True
+        started = False
+        try:
+            final_url, headers = _salesiq_request(None, None)
+            headers["Accept"] = "text/event-stream"
+            async with _ensure_salesiq_http().stream("POST", final_url, content=_dumps(payload), headers=headers) as resp:
+                resp.raise_for_status()
+                if "text/event-stream" not in resp.headers.get("content-type", ""):
+                    body = await resp.aread()
+                    started = True
+                    yield _extract_chat_text(_loads(body), max_tokens)
+                    return
+                async for line in resp.aiter_lines():
+                    if not line.startswith("data:"):
+                        continue
+                    data = line[5:].strip()
+                    if data == "[DONE]":
+                        break
+                    piece = _sse_delta(data)
+                    if piece:
+                        started = True
+                        yield piece
+            if started:
+                return
+        except Exception:
+            if started:
+                raise
+            logger.exception("SalesIQ streaming call failed; falling back to a buffered reply.")
+
+    yield await call_chat(messages, model=model, max_tokens=max_tokens, temperature=temperature, stop=stop)
+
+
+async def _call_chat_uncached(
+    messages: List[Dict[str, str]],
+    model: Optional[str] = None,
+    max_tokens: Optional[int] = 512,
+    temperature: Optional[float] = None,
+    stop: Optional[List[str]] = None,
 ) -> str:
     """
     messages: list of {"role":"system"|"user"|"assistant", "content": "..."}
@@ -144,36 +646,10 @@ async def call_chat(
 
     # Try SalesIQ first
     if SALESIQ_API_URL:
-        payload = {
-            "model": model,
-            "messages": messages,
-            "max_tokens": max_tokens,
-            "temperature": temperature,
-            "stop": stop,
-        }
+        payload = _salesiq_chat_payload(messages, model, max_tokens, temperature, stop)
         try:
             resp = await _call_salesiq_api(payload)
-            # Parse a few common response shapes:
-            # 1) {"output": "text..."}
-            if isinstance(resp, dict):
-                if "output" in resp and isinstance(resp["output"], str):
-                    return resp["output"]
-                # 2) {"choices":[{"message":{"content":"..."}}]}
-                choices = resp.get("choices")
-                if isinstance(choices, list) and len(choices) > 0:
-                    first = choices[0]
-                    # try message.content
-                    msg = first.get("message") or first.get("delta") or first
-                    if isinstance(msg, dict):
-                        # message.content or text
-                        if "content" in msg:
-                            return msg["content"]
-                        if "text" in msg:
-                            return msg["text"]
-                    # fallback to string representation
-                    return str(first)
-            # fallback: stringify entire response
-            return json.dumps(resp)[:max_tokens or 512]
+            return _extract_chat_text(resp, max_tokens)
         except Exception:
             logger.exception("SalesIQ chat call failed; will attempt OpenAI fallback if available.")
 
@@ -198,16 +674,22 @@ async def call_chat(
 # -------------------------
 # High-level helpers
 # -------------------------
-async def generate_bot_suggestions(context: str, n: int = 1) -> List[str]:
-    system = "You are a helpful customer-support assistant. Provide brief, professional reply suggestions."
-    user = f"Context:\n{context}\n\nReturn up to {n} concise suggested replies, each on its own line."
+_SUGGESTION_SYSTEM = "You are a helpful customer-support assistant. Provide brief, professional reply suggestions."
+
 
+def _suggestion_messages(context: str, n: int) -> Tuple[List[Dict[str, str]], str]:
+    user = f"Context:\n{context}\n\nReturn up to {n} concise suggested replies, each on its own line."
     messages = [
-        {"role": "system", "content": system},
+        {"role": "system", "content": _SUGGESTION_SYSTEM},
         {"role": "user", "content": user},
     ]
+    return messages, _prompt_key(_SUGGESTION_SYSTEM, user)
+
+
+async def generate_bot_suggestions(context: str, n: int = 1) -> List[str]:
+    messages, key = _suggestion_messages(context, n)
     try:
-        out = await call_chat(messages, max_tokens=200, temperature=0.15)
+        out = await call_chat(messages, max_tokens=200, temperature=0.15, prompt_key=key)
         lines = [l.strip() for l in out.splitlines() if l.strip()]
         if not lines:
             return ["Thanks — we'll check and get back to you shortly."]
@@ -217,15 +699,50 @@ async def generate_bot_suggestions(context: str, n: int = 1) -> List[str]:
         return ["Thanks — we will investigate and follow up shortly."][:n]
 
 
+async def generate_bot_suggestions_batch(contexts: List[str], n: int = 1) -> List[List[str]]:
+    """
+    Suggestions for several independent messages, in input order. The chat backends take
+    one conversation per call, so identical contexts share a single call and the distinct
+    ones run concurrently (at most LLM_CONCURRENCY in flight).
+    """
+    distinct = list(dict.fromkeys(contexts))
+    sem = asyncio.Semaphore(max(1, LLM_CONCURRENCY))
+
+    async def _one(context: str) -> List[str]:
+        async with sem:
+            return await generate_bot_suggestions(context, n)
+
+    by_context = dict(zip(distinct, await asyncio.gather(*(_one(c) for c in distinct))))
+    return [by_context[c] for c in contexts]
+
+
+_SUMMARY_SYSTEM_TMPL = (
+    "You are an assistant that summarizes customer-agent chat histories into short, high-level "
+    "theoretical sentences. Produce exactly {n} independent sentences. Each sentence should be "
+    "concise (10-25 words), abstract, and actionable — focusing on causes, effects, risks, or "
+    "recommendations rather than chat details. Do NOT include quotes or personal identifiers. "
+    "Use present-tense, professional tone. After the sentences, output a JSON object on its own "
+    "line with keys: topics (list of strings), sentiment (one of positive/neutral/negative/mixed)."
+)
+
+
+@functools.lru_cache(maxsize=16)
+def _sys_prompt(n: int) -> str:
+    # Byte-identical per n, so providers' prompt-prefix caches can reuse the prefill
+    return _SUMMARY_SYSTEM_TMPL.replace("{n}", str(n))
+
+
+async def stream_bot_reply(context: str) -> AsyncIterator[str]:
+    """
+    Stream a single suggested reply token-by-token (same prompt as generate_bot_suggestions).
+    """
+    messages, _ = _suggestion_messages(context, 1)
+    async for piece in stream_chat(messages, max_tokens=200, temperature=0.15):
+        yield piece
+
+
 async def summarize_short_sentences(text: str, n: int = 3) -> Tuple[List[str], Dict[str, Any]]:
-    system = (
-        "You are an assistant that summarizes customer-agent chat histories into short, high-level "
-        "theoretical sentences. Produce exactly {n} independent sentences. Each sentence should be "
-        "concise (10-25 words), abstract, and actionable — focusing on causes, effects, risks, or "
-        "recommendations rather than chat details. Do NOT include quotes or personal identifiers. "
-        "Use present-tense, professional tone. After the sentences, output a JSON object on its own "
-        "line with keys: topics (list of strings), sentiment (one of positive/neutral/negative/mixed)."
-    ).replace("{n}", str(n))
+    system = _sys_prompt(n)
 
     user = f"Conversation:\n{text}\n\nReturn exactly {n} short sentences, each on its own line, followed by the JSON metadata on its own line."
 
@@ -235,7 +752,7 @@ async def summarize_short_sentences(text: str, n: int = 3) -> Tuple[List[str], D
     ]
 
     try:
-        raw = await call_chat(messages, max_tokens=512, temperature=0.15)
+        raw = await call_chat(messages, max_tokens=512, temperature=0.15, prompt_key=_prompt_key(system, user))
         lines = [ln.strip() for ln in raw.strip().splitlines() if ln.strip()]
 
         sentences = lines[:n]
@@ -267,35 +784,55 @@ async def summarize_short_sentences(text: str, n: int = 3) -> Tuple[List[str], D
 # Chunking helpers and reduce
 # -------------------------
 def _chunk_text_by_chars(text: str, max_chars: int = 4000) -> List[str]:
+    """
+    Split text into chunks of at most max_chars, breaking after the last newline that
+    fits (a line longer than max_chars is hard-split). Slices the original string
+    directly instead of building per-line lists.
+    """
     if len(text) <= max_chars:
         return [text]
-    lines = text.splitlines(keepends=True)
     chunks = []
-    cur = []
-    cur_len = 0
-    for ln in lines:
-        ln_len = len(ln)
-        if cur_len + ln_len > max_chars and cur:
-            chunks.append("".join(cur))
-            cur = []
-            cur_len = 0
-        cur.append(ln)
-        cur_len += ln_len
-    if cur:
-        chunks.append("".join(cur))
+    start = 0
+    n = len(text)
+    while start < n:
+        end = min(start + max_chars, n)
+        if end < n:
+            nl = text.rfind("\n", start, end) + 1
+            if nl > start:
+                end = nl
+        chunks.append(text[start:end])
+        start = end
     return chunks
 
 
+# Skip the reduce pass when the map phase already produced this little text
+_MERGE_MAX_CHUNKS = 3
+_MERGE_MAX_CHARS = 2000
+
+
 async def simple_chunk_and_summarize(text: str, sentences_per_chunk: int = 2, final_sentences: int = 3) -> Tuple[List[str], Dict[str, Any]]:
     max_chars = 4000
     chunks = _chunk_text_by_chars(text, max_chars=max_chars)
     chunk_summaries = []
+    chunk_sents: List[List[str]] = []
     topics_acc: List[str] = []
     sentiments = []
 
-    for c in chunks:
-        sents, meta = await summarize_short_sentences(c, n=sentences_per_chunk)
+    # Summarize chunks concurrently (bounded); results keep chunk order
+    sem = asyncio.Semaphore(max(1, LLM_CONCURRENCY))
+
+    async def _bounded(c: str):
+        async with sem:
+            return await summarize_short_sentences(c, n=sentences_per_chunk)
+
+    results = await asyncio.gather(*(_bounded(c) for c in chunks), return_exceptions=True)
+    for res in results:
+        if isinstance(res, BaseException):
+            logger.error("Chunk summary failed", exc_info=res)
+            continue
+        sents, meta = res
         chunk_summaries.append(" ".join(sents))
+        chunk_sents.append(sents)
         if isinstance(meta, dict):
             if meta.get("topics"):
                 topics_acc.extend(meta.get("topics", []))
@@ -303,6 +840,15 @@ async def simple_chunk_and_summarize(text: str, sentences_per_chunk: int = 2, fi
                 sentiments.append(meta.get("sentiment"))
 
     combined_text = "\n".join(chunk_summaries)
+
+    # Few, short chunk summaries: merge them directly instead of a second LLM pass.
+    # Interleave so every chunk contributes before any contributes twice.
+    if len(chunks) <= _MERGE_MAX_CHUNKS and len(combined_text) < _MERGE_MAX_CHARS:
+        merged = [s for row in itertools.zip_longest(*chunk_sents) for s in row if s]
+        if len(merged) >= final_sentences:
+            sentiment = Counter(sentiments).most_common(1)[0][0] if sentiments else "mixed"
+            return merged[:final_sentences], {"topics": list(dict.fromkeys(topics_acc)), "sentiment": sentiment}
+
     final_sents, final_meta = await summarize_short_sentences(combined_text, n=final_sentences)
 
     final_topics = list(dict.fromkeys((final_meta.get("topics") or []) + topics_acc))
@@ -314,15 +860,45 @@ async def simple_chunk_and_summarize(text: str, sentences_per_chunk: int = 2, fi
 # -------------------------
 # Utility: cosine similarity
 # -------------------------
+# math.sumprod is 3.12+; map(operator.mul) keeps the loop in C on older interpreters
+_sumprod = getattr(math, "sumprod", None) or (lambda a, b: sum(map(operator.mul, a, b)))
+
+
 def cosine_sim(a: List[float], b: List[float]) -> float:
-    if not a or not b or len(a) != len(b):
+    if a is None or b is None or len(a) == 0 or len(a) != len(b):
         return 0.0
-    dot = sum(x * y for x, y in zip(a, b))
-    norma = math.sqrt(sum(x * x for x in a))
-    normb = math.sqrt(sum(y * y for y in b))
+    if np is not None:
+        va = np.asarray(a, dtype=np.float32)
+        vb = np.asarray(b, dtype=np.float32)
+        denom = float(np.linalg.norm(va) * np.linalg.norm(vb))
+        return float(va @ vb) / denom if denom else 0.0
+    # no numpy: C-level loops (sumprod / hypot) instead of generator sums
+    norma = math.hypot(*a)
+    normb = math.hypot(*b)
     if norma == 0 or normb == 0:
         return 0.0
-    return dot / (norma * normb)
+    return _sumprod(a, b) / (norma * normb)
+
+
+def _l2_normalize(v: Any) -> "np.ndarray":
+    v = np.asarray(v, dtype=np.float32)
+    norm = float(np.linalg.norm(v))
+    return v / norm if norm else v
+
+
+def _quantize(v: "np.ndarray") -> Tuple["np.ndarray", float]:
+    """Symmetric per-vector int8 quantization: v ~= q * scale."""
+    peak = float(np.abs(v).max()) if v.size else 0.0
+    scale = peak / 127.0 if peak else 1.0
+    return np.round(v / scale).astype(np.int8), scale
+
+
+def cosine_sim_batch(q: List[float], matrix: "np.ndarray") -> "np.ndarray":
+    """
+    Cosine similarity of q against every row of matrix, which must already be
+    L2-normalized (N, D) float32 — one matrix-vector product. Requires numpy.
+    """
+    return matrix @ _l2_normalize(q)
 
 
 # -------------------------
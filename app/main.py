@@ -1,25 +1,26 @@
 # app/main.py
 """
-Flask entrypoint for Service Chatbot backend.
+Quart (ASGI) entrypoint for Service Chatbot backend.
+
+All routers are async Quart blueprints, so requests run directly on the event loop
+(no WSGI thread-per-request, no sync/async bridging per call).
 
 Usage (dev):
   # from project root
-  export FLASK_APP=app.main
+  export QUART_APP=app.main
   export FLASK_ENV=development
-  flask run --host=127.0.0.1 --port=8000
+  quart run --host=127.0.0.1 --port=8000
 
 Or run directly (dev):
   python -m app.main
 
 Production:
-  gunicorn --bind 0.0.0.0:8000 "app.main:create_app()"
+  hypercorn --bind 0.0.0.0:8000 --workers 4 --worker-class uvloop "app.main:app"
 """
 from __future__ import annotations
 
 import os
 import sys
-import threading
-import asyncio
 import logging
 from pathlib import Path
 from dotenv import load_dotenv
@@ -32,20 +33,30 @@ if __name__ == "__main__" and __package__ is None:
 
 load_dotenv()
 
-from flask import Flask, jsonify
-from flask_cors import CORS
+from quart import Quart, jsonify
+from quart.json.provider import DefaultJSONProvider
+from quart_cors import cors
+
+# Faster JSON for responses (optional; stdlib json otherwise)
+try:
+    import orjson  # type: ignore
+except Exception:
+    orjson = None  # type: ignore
 
 logger = logging.getLogger("app.main")
 
 # Import your modules using absolute imports
 # init_db may be async or sync depending on your db layer
 try:
-    from app.db import init_db  # type: ignore
+    from app.db import init_db, dispose_engines  # type: ignore
 except Exception:
     def init_db():
         return None  # fallback no-op
 
-# Routers (these modules should export a Flask Blueprint as `bp` or `router`)
+    async def dispose_engines():
+        return None
+
+# Routers (these modules should export a Quart Blueprint as `bp` or `router`)
 try:
     from app.routers import auth_routes, chat_routes, schedule_routes, summary_routes  # type: ignore
 except Exception as e:
@@ -60,21 +71,65 @@ except Exception:
     salesiq_integration = None
 
 
-def register_blueprint_if_possible(app: Flask, mod, url_prefix: str = ""):
+def register_blueprint_if_possible(app: Quart, mod, url_prefix: str = ""):
     """
-    Register a Flask Blueprint if the module exports `bp`, `router`, or `blueprint`.
+    Register a Quart Blueprint if the module exports `bp`, `router`, or `blueprint`.
     Raise descriptive error if not found.
     """
     if mod is None:
         raise RuntimeError("Module is None; cannot register blueprint.")
     bp = getattr(mod, "bp", None) or getattr(mod, "router", None) or getattr(mod, "blueprint", None)
     if bp is None:
-        raise RuntimeError(f"No blueprint found in module {mod.__name__}. Export a Flask Blueprint as 'bp' or 'router'.")
+        raise RuntimeError(f"No blueprint found in module {mod.__name__}. Export a Quart Blueprint as 'bp' or 'router'.")
     app.register_blueprint(bp, url_prefix=url_prefix)
 
 
-def create_app() -> Flask:
-    app = Flask(__name__, static_folder=None)
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    jsonify/request.get_json via orjson, writing the response body as bytes.
+    Output matches the default provider (sorted keys, RFC 822 datetimes via
+    `default`); anything orjson rejects (e.g. ints beyond 64 bits) falls back to stdlib.
+    """
+
+    def _orjson_option(self, indent: bool = False) -> int:
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return option
+
+    def _dumpb(self, obj, indent: bool = False) -> bytes | None:
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._orjson_option(indent))
+        except (orjson.JSONEncodeError, TypeError):
+            return None
+
+    def dumps(self, obj, **kwargs) -> str:
+        if not kwargs:
+            raw = self._dumpb(obj)
+            if raw is not None:
+                return raw.decode("utf-8")
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        raw = self._dumpb(obj, indent=indent)
+        if raw is None:
+            return super().response(*args, **kwargs)
+        return self._app.response_class(raw + b"\n", mimetype=self.mimetype)
+
+
+def create_app() -> Quart:
+    app = Quart(__name__, static_folder=None)
+    if orjson is not None:
+        app.json = OrjsonProvider(app)
 
     # Basic config
     app.config["ENV"] = os.getenv("FLASK_ENV", "production")
@@ -94,9 +149,9 @@ def create_app() -> Flask:
         "https://service-chatbot-frontend-coral.vercel.app",
         os.getenv("FRONTEND_URL", "")
     ]
-    CORS(app, origins=[o for o in origins if o], supports_credentials=True)
+    app = cors(app, allow_origin=[o for o in origins if o], allow_credentials=True)
 
-    # Register routers (expecting Flask Blueprints exported as `bp`/`router`)
+    # Register routers (expecting Quart Blueprints exported as `bp`/`router`)
     try:
         register_blueprint_if_possible(app, auth_routes, url_prefix="/v1/auth")
     except Exception as e:
@@ -124,99 +179,41 @@ def create_app() -> Flask:
         app.logger.warning("SalesIQ integration blueprint not registered: %s", e)
 
     # -------------------------
-    # DB init on first request (robust and safe)
+    # DB init / shutdown on the serving event loop
     # -------------------------
-    init_lock = threading.Lock()
-
-    def _maybe_init_db_sync():
-        """
-        Prefer a synchronous DB init if available (init_db_sync on app.db).
-        Fallback to calling init_db() (async) inside a fresh event loop.
-        This avoids using asyncio.get_event_loop() inside random worker threads.
-        Also detects the common 'greenlet' missing error and logs actionable advice.
-        """
-        from importlib import import_module
-
-        # Try to prefer a sync initializer if available
-        try:
-            db_mod = import_module("app.db")
-        except Exception:
-            db_mod = None
-
-        if db_mod and hasattr(db_mod, "init_db_sync"):
-            try:
-                app.logger.info("Attempting synchronous DB init via app.db.init_db_sync()")
-                db_mod.init_db_sync()
-                app.logger.info("Database initialized via init_db_sync().")
-                return
-            except Exception as e:
-                app.logger.exception("init_db_sync() failed, will try async init_db(): %s", e)
-
-        # Fallback: attempt async init_db() if provided
+    @app.before_serving
+    async def _init_db():
+        # Runs once per worker before the first request is accepted
         try:
             res = init_db()
-            # If init_db returned an awaitable / coroutine, run it in a fresh loop inside this thread
             if hasattr(res, "__await__"):
-                app.logger.info("Running async init_db() in a fresh event loop (fallback path).")
-                loop = asyncio.new_event_loop()
-                try:
-                    asyncio.set_event_loop(loop)
-                    loop.run_until_complete(res)
-                finally:
-                    # Clean up: unset and close loop
-                    try:
-                        asyncio.set_event_loop(None)
-                    except Exception:
-                        pass
-                    try:
-                        loop.close()
-                    except Exception:
-                        pass
-                app.logger.info("Database initialized (async fallback).")
-            else:
-                app.logger.info("init_db() executed synchronously (no awaitable returned).")
-            return
+                await res
+            app.logger.info("Database initialized.")
         except ValueError as ve:
             # Known case: missing greenlet triggers ValueError mentioning greenlet
-            msg = str(ve).lower()
-            if "greenlet" in msg or "greenlet" in getattr(ve, "args", ("",))[0].lower():
+            if "greenlet" in str(ve).lower():
                 app.logger.exception("DB init failed: greenlet is required by SQLAlchemy async helpers but is not installed.")
                 app.logger.error("Install it in your virtualenv and retry: pip install greenlet")
             else:
                 app.logger.exception("DB init failed with ValueError: %s", ve)
-            return
-        except RuntimeError as re:
-            # Event loop related errors; log and provide hint
-            app.logger.exception("DB init runtime error (event loop problem): %s", re)
-            app.logger.error("If this occurs in a worker thread, prefer init_db_sync() or install greenlet: pip install greenlet")
-            return
         except Exception as e:
-            app.logger.exception("DB initialization (fallback) failed: %s", e)
-            return
-
-    def _maybe_init_db_once():
-        if app.config.get("_db_initialized", False):
-            return
-        with init_lock:
-            if app.config.get("_db_initialized", False):
-                return
-            _maybe_init_db_sync()
-            app.config["_db_initialized"] = True
-
-    @app.before_request
-    def _ensure_db_initialized():
-        # Blocks the first incoming request until DB init completes (safer for demos).
-        # For high-performance production, initialize DB at process start instead.
-        _maybe_init_db_once()
+            app.logger.exception("DB initialization failed: %s", e)
+
+    @app.after_serving
+    async def _dispose_db():
+        try:
+            await dispose_engines()
+        except Exception:
+            app.logger.exception("Engine dispose failed")
 
     # Health route
     @app.route("/healthz", methods=["GET"])
-    def _health():
+    async def _health():
         return jsonify({"status": "ok", "service": "service-chatbot-backend"})
 
     # Root
     @app.route("/", methods=["GET"])
-    def root():
+    async def root():
         return jsonify({
             "status": "ok",
             "service": "Service Chatbot Backend",
@@ -227,7 +224,7 @@ def create_app() -> Flask:
     return app
 
 
-# For flask CLI and WSGI servers
+# For the quart CLI and ASGI servers
 app = create_app()
 
 if __name__ == "__main__":
@@ -2,13 +2,29 @@
 from __future__ import annotations
 from typing import Optional, List, Dict, Any
 from sqlmodel import SQLModel, Field, Column, JSON
+from sqlalchemy import DateTime, func
 from datetime import datetime
 
 
+def _server_now(index: bool = False) -> Column:
+    """
+    tz-aware timestamp filled in by the database (DEFAULT now()) instead of a
+    per-row Python clock call; models set eager_defaults so the value comes back
+    via RETURNING on insert.
+    """
+    return Column(DateTime(timezone=True), server_default=func.now(), nullable=False, index=index)
+
+
+# Fetch server-generated defaults (created_at etc.) in the INSERT ... RETURNING
+_EAGER_DEFAULTS = {"eager_defaults": True}
+
+
 # ---------------------------------------------------------
 # Message Model
 # ---------------------------------------------------------
 class Message(SQLModel, table=True):
+    __mapper_args__ = _EAGER_DEFAULTS
+
     id: Optional[int] = Field(default=None, primary_key=True)
     message_id: str = Field(index=True, unique=True)
 
@@ -22,41 +38,45 @@ class Message(SQLModel, table=True):
         sa_column=Column(JSON), default_factory=dict
     )
 
-    created_at: datetime = Field(
-        default_factory=datetime.utcnow, index=True
-    )
+    created_at: Optional[datetime] = Field(default=None, sa_column=_server_now(index=True))
 
 
 # ---------------------------------------------------------
 # Agent Model
 # ---------------------------------------------------------
 class Agent(SQLModel, table=True):
+    __mapper_args__ = _EAGER_DEFAULTS
+
     agent_id: str = Field(primary_key=True)
     email: str = Field(index=True, unique=True)
 
     name: Optional[str] = None
     password_hash: Optional[str] = None
 
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: Optional[datetime] = Field(default=None, sa_column=_server_now())
 
 
 # ---------------------------------------------------------
 # Customer Model
 # ---------------------------------------------------------
 class Customer(SQLModel, table=True):
+    __mapper_args__ = _EAGER_DEFAULTS
+
     customer_id: str = Field(primary_key=True)
 
     name: Optional[str] = None
     email: Optional[str] = None
     phone: Optional[str] = None
 
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: Optional[datetime] = Field(default=None, sa_column=_server_now())
 
 
 # ---------------------------------------------------------
 # Booking Model (Google Calendar / Any Calendar)
 # ---------------------------------------------------------
 class Booking(SQLModel, table=True):
+    __mapper_args__ = _EAGER_DEFAULTS
+
     id: Optional[int] = Field(default=None, primary_key=True)
     booking_ref: str = Field(index=True, unique=True)
 
@@ -75,7 +95,7 @@ class Booking(SQLModel, table=True):
     status: str                   # confirmed | cancelled | rescheduled | pending
     paid: bool = False
 
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: Optional[datetime] = Field(default=None, sa_column=_server_now())
     updated_at: Optional[datetime] = None
 
 
@@ -83,21 +103,25 @@ class Booking(SQLModel, table=True):
 # OTP Model
 # ---------------------------------------------------------
 class OTP(SQLModel, table=True):
+    __mapper_args__ = _EAGER_DEFAULTS
+
     id: Optional[int] = Field(default=None, primary_key=True)
 
-    phone: str = Field(index=True)
+    phone: str = Field(index=True, unique=True)  # one live OTP per phone (upserted)
     code: str
 
     valid_until: datetime
     used: bool = False
 
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: Optional[datetime] = Field(default=None, sa_column=_server_now())
 
 
 # ---------------------------------------------------------
 # AI Summary Model
 # ---------------------------------------------------------
 class Summary(SQLModel, table=True):
+    __mapper_args__ = _EAGER_DEFAULTS
+
     id: Optional[int] = Field(default=None, primary_key=True)
 
     customer_id: Optional[str] = Field(index=True)
@@ -120,7 +144,7 @@ class Summary(SQLModel, table=True):
         sa_column=Column(JSON), default_factory=dict
     )
 
-    generated_at: datetime = Field(default_factory=datetime.utcnow)
+    generated_at: Optional[datetime] = Field(default=None, sa_column=_server_now())
 
     cache_key: Optional[str] = Field(index=True, unique=True, default=None)
     source_hash: Optional[str] = None
@@ -130,6 +154,8 @@ class Summary(SQLModel, table=True):
 # Conversation Model
 # ---------------------------------------------------------
 class Conversation(SQLModel, table=True):
+    __mapper_args__ = _EAGER_DEFAULTS
+
     id: Optional[int] = Field(default=None, primary_key=True)
 
     customer_id: str = Field(index=True)
@@ -139,5 +165,5 @@ class Conversation(SQLModel, table=True):
     bot_assist: bool = False
     agent_online: bool = False
 
-    created_at: datetime = Field(default_factory=datetime.utcnow)
+    created_at: Optional[datetime] = Field(default=None, sa_column=_server_now())
     updated_at: Optional[datetime] = None
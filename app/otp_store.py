@@ -0,0 +1,74 @@
+# app/otp_store.py
+"""
+Redis-backed OTP codes.
+
+A code is written once on /otp/send and read once on /otp/verify within its TTL, so it
+lives in Redis (SET ... EX, then a compare-and-delete script) rather than in the otp
+table: no SQL statements and no pooled Postgres connection per OTP flow.
+
+Environment variables:
+ - REDIS_URL  (required for this store; without it OTPs stay in Postgres)
+ - OTP_STORE  ("redis" (default) or "db" to force the Postgres otp table)
+"""
+from __future__ import annotations
+import os
+import logging
+
+from dotenv import load_dotenv
+
+load_dotenv()
+logger = logging.getLogger("otp_store")
+
+REDIS_URL = os.getenv("REDIS_URL")
+OTP_STORE = os.getenv("OTP_STORE", "redis").lower()
+OTP_KEY_PREFIX = "otp:"
+
+try:
+    import redis.asyncio as aioredis  # type: ignore
+except Exception:
+    aioredis = None  # type: ignore
+
+_client = None
+
+
+def _redis():
+    global _client
+    if _client is None and REDIS_URL and aioredis is not None:
+        _client = aioredis.from_url(REDIS_URL, decode_responses=True)
+    return _client
+
+
+def enabled() -> bool:
+    """True when OTPs go to Redis; False means use the DB otp table (crud.create_otp / verify_otp_code)."""
+    return OTP_STORE == "redis" and _redis() is not None
+
+
+async def put_code(phone: str, code: str, valid_for_seconds: int = 300) -> None:
+    """Store the code for phone; a re-send replaces the previous code and restarts the TTL."""
+    await _redis().set(OTP_KEY_PREFIX + phone, code, ex=valid_for_seconds)
+
+
+# Compare and delete in one step on the server: a wrong guess leaves the live code alone.
+_CONSUME_IF_MATCH = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+async def consume_code(phone: str, code: str) -> bool:
+    """True (and the code is deleted) only when code matches the stored one."""
+    if not code:
+        return False
+    return bool(await _redis().eval(_CONSUME_IF_MATCH, 1, OTP_KEY_PREFIX + phone, code))
+
+
+async def close() -> None:
+    global _client
+    if _client is not None:
+        try:
+            await _client.aclose()
+        except Exception:
+            logger.debug("Redis OTP client close failed", exc_info=True)
+    _client = None
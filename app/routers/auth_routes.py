@@ -10,65 +10,80 @@ Routes:
  - GET  /me                   -> return subject from Authorization: Bearer <token>
 """
 from __future__ import annotations
+import asyncio
+import re
 import uuid
 from datetime import timedelta
 
 from quart import Blueprint, request, jsonify, current_app
-from marshmallow import ValidationError
 
 from .. import auth as auth_tools
 from .. import crud
+from . import json_body
+from .. import otp_store
 from ..schemas import AgentCreateSchema, OTPRequestSchema, OTPVerifySchema
 from ..db import get_session
+from .. import twilio_client
 from ..twilio_client import send_otp_async, check_otp_async
 from ..utils import generate_otp
 
 bp = Blueprint("auth_routes", __name__)
 
+@bp.before_app_serving
+async def _warm_dummy_hash():
+    # Compute the unknown-account login hash off the loop before the first request
+    await asyncio.get_running_loop().run_in_executor(auth_tools._PWD_POOL, auth_tools.dummy_password_hash)
+
+
+@bp.before_app_serving
+async def _warm_twilio():
+    await twilio_client.warmup()
+
+
+@bp.after_app_serving
+async def _close_clients():
+    await asyncio.gather(otp_store.close(), twilio_client.close_connections())
+
+
+# Schemas are stateless; build them once instead of per request
+_AGENT_SCHEMA = AgentCreateSchema()
+_OTP_REQUEST_SCHEMA = OTPRequestSchema()
+_OTP_VERIFY_SCHEMA = OTPVerifySchema()
+
 # ---------------------------
 # Helper: read Authorization header
 # ---------------------------
+_BEARER_RE = re.compile(r"^\s*bearer\s+(\S+)\s*$", re.IGNORECASE)
+
+
 def _extract_bearer_token(headers) -> str | None:
-    auth = headers.get("Authorization") or headers.get("authorization")
-    if not auth:
-        return None
-    parts = auth.split()
-    if len(parts) == 2 and parts[0].lower() == "bearer":
-        return parts[1]
-    return None
+    # Quart headers are case-insensitive, so one lookup covers "authorization" too
+    m = _BEARER_RE.match(headers.get("Authorization") or "")
+    return m.group(1) if m else None
 
 
 # ---------------------------
 # Create agent
 # ---------------------------
 @bp.route("/create_agent", methods=["POST"])
-async def create_agent():
+@json_body(error="invalid json", schema=_AGENT_SCHEMA)
+async def create_agent(data):
     """
     Create a new agent:
     Body: { email, password, name? }
     Returns: { agent_id, email }
     """
-    try:
-        payload = await request.get_json()
-    except Exception:
-        return jsonify({"error": "invalid json"}), 400
-
-    try:
-        data = AgentCreateSchema().load(payload)
-    except ValidationError as e:
-        return jsonify({"error": "validation", "details": e.messages}), 400
-
     email = data["email"]
     password = data["password"]
     name = data.get("name")
 
-    async for session in get_session():
+    async with get_session() as session:
         existing = await crud.get_agent_by_email(session, email)
         if existing:
             return jsonify({"error": "agent_exists", "email": email}), 409
 
         agent_id = "agent-" + uuid.uuid4().hex[:8]
-        hashed = auth_tools.hash_password(password)
+        hashed = await auth_tools.hash_password_async(password)
         agent = await crud.create_agent(session, agent_id=agent_id, email=email, password_hash=hashed, name=name)
         return jsonify({"agent_id": agent.agent_id, "email": agent.email}), 201
 
@@ -77,27 +92,24 @@ async def create_agent():
 # Agent login
 # ---------------------------
 @bp.route("/login", methods=["POST"])
-async def login_agent():
+@json_body(error="invalid json")
+async def login_agent(payload):
     """
     Agent login with email + password:
     Body: { email, password }
     Returns: { access_token, agent_id }
     """
-    try:
-        payload = await request.get_json()
-    except Exception:
-        return jsonify({"error": "invalid json"}), 400
-
     email = (payload or {}).get("email")
     password = (payload or {}).get("password")
     if not email or not password:
         return jsonify({"error": "email_and_password_required"}), 400
 
-    async for session in get_session():
+    async with get_session() as session:
         agent = await crud.get_agent_by_email(session, email)
-        if not agent:
-            return jsonify({"error": "invalid_credentials"}), 401
-        if not auth_tools.verify_password(password, agent.password_hash or ""):
+        # Always pay for one verify, so response time doesn't reveal whether the email exists
+        target_hash = (agent.password_hash if agent else None) or auth_tools.dummy_password_hash()
+        ok = await auth_tools.verify_password_async(password, target_hash)
+        if not agent or not ok:
             return jsonify({"error": "invalid_credentials"}), 401
 
         token = auth_tools.create_access_token(agent.agent_id)
@@ -108,37 +120,39 @@ async def login_agent():
 # Send OTP (customer)
 # ---------------------------
 @bp.route("/otp/send", methods=["POST"])
-async def otp_send():
+@json_body(error="invalid json", schema=_OTP_REQUEST_SCHEMA)
+async def otp_send(data):
     """
     Send OTP to a phone number.
     Body: { phone }
     Returns: { status, maybe code (dev fallback) }
     """
-    try:
-        payload = await request.get_json()
-    except Exception:
-        return jsonify({"error": "invalid json"}), 400
-
-    try:
-        data = OTPRequestSchema().load(payload)
-    except ValidationError as e:
-        return jsonify({"error": "validation", "details": e.messages}), 400
-
     phone = data["phone"]
 
-    # Generate code and persist via crud; send via Twilio (async)
+    # Generate code and persist it (Redis when configured, else the DB otp table);
+    # send via Twilio (async)
     code = generate_otp(6)
 
-    async for session in get_session():
-        otp_row = await crud.create_otp(session, phone=phone, code=code, valid_for_seconds=300)
-
-    # Send via twilio (async). twilio client may return the code in fallback mode,
-    # so include it in development responses (but avoid returning code in prod).
-    try:
-        twres = await send_otp_async(phone, code_length=6)
-    except Exception as e:
-        current_app.logger.exception("Twilio send failed: %s", e)
-        twres = {"status": "failed", "error": str(e)}
+    async def _store_code():
+        if otp_store.enabled():
+            await otp_store.put_code(phone, code, valid_for_seconds=300)
+        else:
+            async with get_session() as session:
+                await crud.create_otp(session, phone=phone, code=code, valid_for_seconds=300)
+
+    # The store write and the Twilio send are independent: overlap them.
+    # twilio client may return the code in fallback mode, so include it in
+    # development responses (but avoid returning code in prod).
+    otp_row, twres = await asyncio.gather(
+        _store_code(),
+        send_otp_async(phone, code_length=6),
+        return_exceptions=True,
+    )
+    if isinstance(otp_row, BaseException):
+        raise otp_row
+    if isinstance(twres, BaseException):
+        current_app.logger.error("Twilio send failed: %s", twres, exc_info=twres)
+        twres = {"status": "failed", "error": str(twres)}
 
     # In development, include the code when Twilio not configured
     if twres.get("status") in ("no_client", "no_from_number", "no_client"):
@@ -151,39 +165,34 @@ async def otp_send():
 # Verify OTP (customer)
 # ---------------------------
 @bp.route("/otp/verify", methods=["POST"])
-async def otp_verify():
+@json_body(error="invalid json", schema=_OTP_VERIFY_SCHEMA)
+async def otp_verify(data):
     """
     Verify OTP for phone. If valid, create or update Customer record and return a JWT for that customer.
     Body: { phone, code, name? , email? }
     """
-    try:
-        payload = await request.get_json()
-    except Exception:
-        return jsonify({"error": "invalid json"}), 400
-
-    try:
-        data = OTPVerifySchema().load(payload)
-    except ValidationError as e:
-        return jsonify({"error": "validation", "details": e.messages}), 400
-
     phone = data["phone"]
     code = data["code"]
     # optional metadata
-    name = (payload or {}).get("name")
-    email = (payload or {}).get("email")
+    name = data.get("name")
+    email = data.get("email")
 
-    # If Twilio Verify is present, prefer verifying via Twilio; otherwise verify via DB
+    # If Twilio Verify is present, prefer verifying via Twilio; otherwise verify
+    # against the stored code (Redis when configured, else the DB)
     twilio_verified = None
     try:
         twilio_verified = await check_otp_async(phone, code)
     except Exception:
-        current_app.logger.exception("Twilio verify exception (falling back to DB): %s", phone)
+        current_app.logger.exception("Twilio verify exception (falling back to stored code): %s", phone)
 
-    async for session in get_session():
-        verified = False
-        if twilio_verified is True:
-            verified = True
-        else:
+    verified = twilio_verified is True
+    if not verified and otp_store.enabled():
+        verified = await otp_store.consume_code(phone, code)
+        if not verified:
+            return jsonify({"error": "invalid_or_expired_code"}), 400
+
+    async with get_session() as session:
+        if not verified:
             # fallback to DB-stored OTP
             verified = await crud.verify_otp_code(session, phone, code)
 
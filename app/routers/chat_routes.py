@@ -5,49 +5,61 @@ Async chat routes (Quart Blueprint)
 Endpoints:
  - POST /save                     : save one or many messages (body.messages list)
  - POST /incoming                 : single incoming message (customer/agent) -> may trigger bot reply
+ - POST /incoming/stream          : customer message in bot mode -> bot reply streamed as text/plain
  - GET  /history/<customer_id>    : get history for customer (optional agent_id query param)
  - GET  /history/<customer_id>/<agent_id> : get history for that (customer,agent) pair
  - GET  /customers_for_agent/<agent_id>   : list unique customers this agent has interacted with
 """
 from __future__ import annotations
 from typing import Any, Dict, List, Optional
-from datetime import datetime
-import itertools
+from datetime import datetime, timezone
+import json
 
-from quart import Blueprint, request, jsonify, current_app
+from quart import Blueprint, Response, request, jsonify, current_app, stream_with_context
 from marshmallow import ValidationError
 
 from ..db import get_session
 from .. import crud
-from ..services import llm
+from . import json_body
+from ..services import llm, llm_batcher
 from ..schemas import MessageSchema
-from ..utils import export_messages_to_text, to_iso
+from ..utils import parse_iso_strict
+
+# Fast JSON for the streamed history body (optional; stdlib json fallback)
+try:
+    import orjson  # type: ignore
+except Exception:
+    orjson = None  # type: ignore
 
 bp = Blueprint("chat_routes", __name__)
 
 
-def _serialize_model(obj: Any) -> Dict[str, Any]:
-    """
-    Generic lightweight serializer for SQLModel instances used in responses.
-    Avoids depending on pydantic; converts datetimes to ISO strings and JSON-serializable fields.
-    """
-    if not obj:
-        return {}
-    data = {}
-    for k, v in vars(obj).items():
-        if k.startswith("_"):
-            continue
-        # skip SQLAlchemy internal attr
-        if k == "_sa_instance_state":
-            continue
-        val = v
-        if hasattr(val, "isoformat"):
-            try:
-                val = val.isoformat()
-            except Exception:
-                val = str(val)
-        data[k] = val
-    return data
+def _dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+@bp.before_app_serving
+async def _start_llm_batcher():
+    await llm_batcher.start()
+
+
+@bp.after_app_serving
+async def _close_llm_client():
+    await llm_batcher.stop()
+    await llm.close_connections()
+
+
+def _serialize_row(row: Dict[str, Any]) -> Dict[str, Any]:
+    """Message column dict (e.g. from INSERT ... RETURNING) for a JSON response."""
+    created_at = row.get("created_at")
+    if created_at is not None:
+        row = {**row, "created_at": created_at.isoformat()}
+    return row
+
+
+_MESSAGE_LIST_SCHEMA = MessageSchema(many=True)
 
 
 # -----------------------------------------------------------------------
@@ -55,12 +67,8 @@ def _serialize_model(obj: Any) -> Dict[str, Any]:
 # Body: { customer_id, agent_id (nullable), messages: [{ sender, message, message_id?, meta?, created_at? }, ...] }
 # -----------------------------------------------------------------------
 @bp.route("/save", methods=["POST"])
-async def save_messages():
-    try:
-        payload = await request.get_json()
-    except Exception:
-        return jsonify({"error": "invalid_json"}), 400
-
+@json_body()
+async def save_messages(payload):
     customer_id = payload.get("customer_id")
     agent_id = payload.get("agent_id")  # can be None for bot-mode
     messages = payload.get("messages", [])
@@ -68,29 +76,19 @@ async def save_messages():
     if not customer_id or not isinstance(messages, list):
         return jsonify({"error": "customer_id_and_messages_required"}), 400
 
-    saved = []
-    # validate messages lightly with MessageSchema
-    schema = MessageSchema()
-    async for session in get_session():
-        for m in messages:
-            try:
-                mdata = schema.load(m)
-            except ValidationError as e:
-                current_app.logger.debug("Message validation failed: %s", e.messages)
-                return jsonify({"error": "message_validation_failed", "details": e.messages}), 400
-
-            row = await crud.save_message(
-                session=session,
-                customer_id=customer_id,
-                agent_id=agent_id,
-                sender=mdata["sender"],
-                message=mdata["message"],
-                meta=mdata.get("meta", {}),
-                message_id=mdata.get("message_id"),
-                created_at=mdata.get("created_at"),
-            )
-            saved.append(_serialize_model(row))
-    return jsonify({"status": "ok", "saved": saved})
+    # validate the whole batch in one pass; errors come back keyed by list index
+    try:
+        loaded = _MESSAGE_LIST_SCHEMA.load(messages)
+    except ValidationError as e:
+        current_app.logger.debug("Message validation failed: %s", e.messages)
+        return jsonify({"error": "message_validation_failed", "details": e.messages}), 400
+    rows = [{**mdata, "customer_id": customer_id, "agent_id": agent_id} for mdata in loaded]
+
+    # one INSERT ... ON CONFLICT DO NOTHING; resent message_ids are skipped
+    async with get_session() as session:
+        inserted = await crud.ingest_messages(session, rows)
+    saved = [_serialize_row(row) for row in inserted]
+    return jsonify({"status": "ok", "saved": saved, "skipped_duplicates": len(rows) - len(saved)})
 
 
 # -----------------------------------------------------------------------
@@ -99,12 +97,8 @@ async def save_messages():
 # If sender == 'customer' and agent_id is None -> bot mode; generate bot reply and save it.
 # -----------------------------------------------------------------------
 @bp.route("/incoming", methods=["POST"])
-async def incoming():
-    try:
-        payload = await request.get_json()
-    except Exception:
-        return jsonify({"error": "invalid_json"}), 400
-
+@json_body()
+async def incoming(payload):
     customer_id = payload.get("customer_id")
     agent_id = payload.get("agent_id")
     sender = payload.get("sender")
@@ -114,21 +108,71 @@ async def incoming():
     if not customer_id or not sender or message is None:
         return jsonify({"error": "customer_id_sender_message_required"}), 400
 
-    async for session in get_session():
-        saved = await crud.save_message(session, customer_id=customer_id, agent_id=agent_id, sender=sender, message=message, meta=meta)
-        response: Dict[str, Any] = {"status": "ok", "saved": _serialize_model(saved)}
+    # Stamp the incoming message at arrival: it may share a transaction with the
+    # bot reply, and now() is per-transaction, so both rows would tie on created_at.
+    rows = [{
+        "customer_id": customer_id,
+        "agent_id": agent_id,
+        "sender": sender,
+        "message": message,
+        "meta": meta,
+        "created_at": datetime.now(timezone.utc),
+    }]
+
+    # Bot auto-reply behavior (simple): when customer messages without agent, bot suggests reply.
+    # The reply is generated first so both rows go in with one INSERT and one commit.
+    if sender == "customer" and (agent_id is None or agent_id == "" or agent_id == "bot"):
+        # Concurrent requests are coalesced into one batch (see services/llm_batcher).
+        try:
+            reply = await llm_batcher.suggest(message)
+            if reply:
+                rows.append({"customer_id": customer_id, "agent_id": None, "sender": "bot", "message": reply, "meta": {"bot_generated": True}})
+        except Exception as e:
+            current_app.logger.exception("LLM bot reply failed: %s", e)
 
-        # Bot auto-reply behavior (simple): when customer messages without agent, bot suggests reply
-        if sender == "customer" and (agent_id is None or agent_id == "" or agent_id == "bot"):
-            try:
-                suggestions = await llm.generate_bot_suggestions(message, n=1)
-                if suggestions:
-                    bot_text = suggestions[0]
-                    bot_saved = await crud.save_message(session, customer_id=customer_id, agent_id=None, sender="bot", message=bot_text, meta={"bot_generated": True})
-                    response["bot_reply"] = _serialize_model(bot_saved)
-            except Exception as e:
-                current_app.logger.exception("LLM bot reply failed: %s", e)
-        return jsonify(response)
+    async with get_session() as session:
+        inserted = await crud.ingest_messages(session, rows)
+    saved = [_serialize_row(r) for r in inserted]
+    response: Dict[str, Any] = {"status": "ok", "saved": saved[0]}
+    if len(saved) > 1:
+        response["bot_reply"] = saved[1]
+    return jsonify(response)
+
+
+# -----------------------------------------------------------------------
+# Incoming customer message with the bot reply streamed back
+# Body: { customer_id, message, meta? }
+# The reply is flushed to the client as it is generated, then saved as a bot message.
+# -----------------------------------------------------------------------
+@bp.route("/incoming/stream", methods=["POST"])
+@json_body()
+async def incoming_stream(payload):
+    customer_id = payload.get("customer_id")
+    message = payload.get("message")
+    meta = payload.get("meta", {})
+
+    if not customer_id or message is None:
+        return jsonify({"error": "customer_id_message_required"}), 400
+
+    async with get_session() as session:
+        await crud.save_message(session, customer_id=customer_id, agent_id=None, sender="customer", message=message, meta=meta)
+
+    @stream_with_context
+    async def _relay():
+        parts: List[str] = []
+        try:
+            async for piece in llm.stream_bot_reply(message):
+                parts.append(piece)
+                yield piece
+        except Exception as e:
+            current_app.logger.exception("LLM streamed bot reply failed: %s", e)
+        # keep the first suggested line, like /incoming
+        bot_text = next((ln.strip() for ln in "".join(parts).splitlines() if ln.strip()), "")
+        if bot_text:
+            async with get_session() as session:
+                await crud.save_message(session, customer_id=customer_id, agent_id=None, sender="bot", message=bot_text, meta={"bot_generated": True})
+
+    return Response(_relay(), mimetype="text/plain")
 
 
 # -----------------------------------------------------------------------
@@ -150,9 +194,9 @@ async def get_history(customer_id: str, agent_id: Optional[str] = None):
     end_dt = None
     try:
         if start:
-            start_dt = datetime.fromisoformat(start)
+            start_dt = parse_iso_strict(start)
         if end:
-            end_dt = datetime.fromisoformat(end)
+            end_dt = parse_iso_strict(end)
     except Exception:
         return jsonify({"error": "invalid_date_format; use ISO"}), 400
 
@@ -162,10 +206,20 @@ async def get_history(customer_id: str, agent_id: Optional[str] = None):
     except Exception:
         return jsonify({"error": "invalid_limit_offset"}), 400
 
-    async for session in get_session():
-        msgs = await crud.get_messages(session, customer_id=customer_id, agent_id=agent_id, start=start_dt, end=end_dt, limit=lmt, offset=off)
-        serialized = [_serialize_model(m) for m in msgs]
-        return jsonify({"customer_id": customer_id, "agent_id": agent_id, "count": len(serialized), "messages": serialized})
+    # Stream the body row by row off a server-side cursor: memory stays flat and the
+    # first bytes go out before the last row is read. "count" comes last for that reason.
+    head = _dumps({"customer_id": customer_id, "agent_id": agent_id})[:-1] + b',"messages":['
+
+    async def body():
+        yield head
+        count = 0
+        async with get_session() as session:
+            async for row in crud.iter_message_rows(session, customer_id=customer_id, agent_id=agent_id, start=start_dt, end=end_dt, limit=lmt, offset=off):
+                yield (b"," if count else b"") + _dumps(row)
+                count += 1
+        yield b'],"count":' + str(count).encode() + b"}"
+
+    return Response(body(), content_type="application/json")
 
 
 # -----------------------------------------------------------------------
@@ -173,7 +227,7 @@ async def get_history(customer_id: str, agent_id: Optional[str] = None):
 # -----------------------------------------------------------------------
 @bp.route("/customers_for_agent/<string:agent_id>", methods=["GET"])
 async def customers_for_agent(agent_id: str):
-    async for session in get_session():
+    async with get_session() as session:
         try:
             customers = await crud.list_customers_for_agent(session, agent_id)
             return jsonify({"agent_id": agent_id, "customers": customers})
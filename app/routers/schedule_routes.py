@@ -7,12 +7,14 @@ Endpoints:
  - POST /book              : { customer: {...}, calendar_id, start, end, service_id, agent_id?, idempotency_key? } -> booking info
  - POST /reschedule        : { booking_ref, new_start, new_end } -> updated booking
  - POST /cancel            : { booking_ref } -> cancellation confirmation
- - GET  /bookings/<customer_id>  : list bookings for customer
+ - GET  /bookings/<customer_id>  : list bookings for customer (?limit=&cursor= keyset paging)
  - GET  /booking/<booking_ref>   : get booking details
 """
 from __future__ import annotations
 import asyncio
-from typing import Optional, List, Dict, Any
+import base64
+import operator
+from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime
 
 from quart import Blueprint, request, jsonify, current_app
@@ -20,44 +22,37 @@ from marshmallow import ValidationError
 
 from ..db import get_session
 from .. import crud
+from . import json_body
 from ..services import google_calendar
 from .. import email_services as email_svc
 from ..schemas import BookingSchema
+from ..utils import parse_iso_strict
 
 bp = Blueprint("schedule_routes", __name__)
 
 
-# Helper to run sync google_calendar functions without blocking
-async def _freebusy_async(calendar_ids: List[str], time_min: str, time_max: str) -> Dict[str, Any]:
-    return await asyncio.to_thread(google_calendar.freebusy, calendar_ids, time_min, time_max)
+@bp.before_app_serving
+async def _warm_clients():
+    # Pay DNS/TLS (and the Google token mint) before the first booking, on the serving loop
+    email_svc.start_outbox()
+    await asyncio.gather(google_calendar.warmup(), email_svc.warmup())
 
 
-async def _create_event_async(calendar_id: str, event_body: Dict[str, Any]) -> Dict[str, Any]:
-    return await asyncio.to_thread(google_calendar.create_event, calendar_id, event_body)
-
-
-async def _update_event_async(calendar_id: str, event_id: str, event_body: Dict[str, Any]) -> Dict[str, Any]:
-    return await asyncio.to_thread(google_calendar.update_event, calendar_id, event_id, event_body)
-
-
-async def _delete_event_async(calendar_id: str, event_id: str) -> Dict[str, Any]:
-    return await asyncio.to_thread(google_calendar.delete_event, calendar_id, event_id)
+@bp.after_app_serving
+async def _close_clients():
+    await asyncio.gather(google_calendar.close_connections(), email_svc.close_connections())
 
 
 # -----------------------------------------------------------------------
 # Availability
 # -----------------------------------------------------------------------
 @bp.route("/availability", methods=["POST"])
-async def availability():
+@json_body()
+async def availability(payload):
     """
     Request body:
     { "date": "YYYY-MM-DD", "duration": 30, "calendarIds": ["primary"], "work_start":9, "work_end":17 }
     """
-    try:
-        payload = await request.get_json()
-    except Exception:
-        return jsonify({"error": "invalid_json"}), 400
-
     date = payload.get("date")
     duration = int(payload.get("duration", 30))
     calendar_ids = payload.get("calendarIds", ["primary"])
@@ -67,13 +62,10 @@ async def availability():
     if not date:
         return jsonify({"error": "missing date"}), 400
 
-    # Prepare RFC3339 bounds (UTC). The google helper expects RFC3339 strings.
-    # For a day, use Z timezone to indicate UTC day bounds.
-    time_min = f"{date}T00:00:00Z"
-    time_max = f"{date}T23:59:59Z"
-
     try:
-        fb = await _freebusy_async(calendar_ids, time_min, time_max)
+        # UTC day bounds; repeat/concurrent queries for the same calendars and day share
+        # one short-lived freebusy answer, and slots are recomputed per request params
+        fb = await google_calendar.freebusy_for_day(calendar_ids, date)
         slots = google_calendar.compute_free_slots_from_freebusy(fb, date, duration_minutes=duration, work_start=work_start, work_end=work_end)
         return jsonify({"date": date, "slots": slots, "calendarIds": calendar_ids})
     except Exception as e:
@@ -85,7 +77,8 @@ async def availability():
 # Book
 # -----------------------------------------------------------------------
 @bp.route("/book", methods=["POST"])
-async def book():
+@json_body()
+async def book(payload):
     """
     Body (JSON):
     {
@@ -98,11 +91,6 @@ async def book():
       "idempotency_key": "client-provided-key" (optional)
     }
     """
-    try:
-        payload = await request.get_json()
-    except Exception:
-        return jsonify({"error": "invalid_json"}), 400
-
     # Validate basic fields
     customer = payload.get("customer")
     calendar_id = payload.get("calendar_id", "primary")
@@ -117,21 +105,26 @@ async def book():
 
     # Validate times parseable
     try:
-        start_dt = datetime.fromisoformat(start.replace("Z", "+00:00"))
-        end_dt = datetime.fromisoformat(end.replace("Z", "+00:00"))
+        start_dt = parse_iso_strict(start)
+        end_dt = parse_iso_strict(end)
         if end_dt <= start_dt:
             return jsonify({"error": "end_must_be_after_start"}), 400
     except Exception:
         return jsonify({"error": "invalid_datetime_format; use ISO format with timezone (RFC3339)"}), 400
 
     # Idempotency check: if idempotency_key provided, find existing booking
-    async for session in get_session():
+    async with get_session() as session:
         if idempotency_key:
             existing = await crud.get_booking_by_ref(session, idempotency_key)
             # Note: here we treat idempotency_key as booking_ref if client used same; alternatively
             # you can have a dedicated idempotency_key column — we store it in booking.idempotency_key.
             if existing:
-                return jsonify({"status": "ok", "booking": _serialize_booking(existing)})
+                if existing.status != "pending":
+                    return jsonify({"status": "ok", "booking": _serialize_booking(existing)})
+                # a pending row belongs to a request whose calendar insert hasn't finished,
+                # unless it is stale (that request died): then reclaim the ref and book again
+                if not await crud.delete_pending_booking(session, existing.booking_ref, stale_only=True):
+                    return jsonify({"error": "booking_in_progress", "booking_ref": existing.booking_ref}), 409
 
         # Prepare event body for Google Calendar
         event_body = {
@@ -143,48 +136,74 @@ async def book():
             "reminders": {"useDefault": True},
         }
 
-        try:
-            evt = await _create_event_async(calendar_id, event_body)
-        except Exception as e:
-            current_app.logger.exception("Google create_event failed: %s", e)
-            return jsonify({"error": "calendar_create_failed", "details": str(e)}), 500
-
-        # persist booking in DB
-        try:
-            booking = await crud.create_booking(
+        # The Google insert and a tentative ("pending") DB row are independent: overlap
+        # them, then attach the event id with one UPDATE. event_id is NOT NULL, so the
+        # pending row carries "" until then.
+        booking_ref = payload.get("booking_ref") or ("BK-" + str(int(datetime.utcnow().timestamp())))
+        evt, booking = await asyncio.gather(
+            google_calendar.create_event(calendar_id, event_body),
+            crud.create_booking(
                 session=session,
-                booking_ref=payload.get("booking_ref") or ("BK-" + str(int(datetime.utcnow().timestamp()))),
+                booking_ref=booking_ref,
                 customer_id=customer.get("customer_id") or customer.get("phone") or customer.get("email"),
                 agent_id=agent_id,
                 calendar_id=calendar_id,
-                event_id=evt.get("id"),
+                event_id="",
                 service_id=service_id,
                 start=start_dt,
                 end=end_dt,
-                status="confirmed",
+                status="pending",
                 idempotency_key=idempotency_key,
                 paid=bool(payload.get("paid", False)),
-            )
+            ),
+            return_exceptions=True,
+        )
+
+        if isinstance(evt, BaseException):
+            current_app.logger.error("Google create_event failed: %s", evt, exc_info=evt)
+            if not isinstance(booking, BaseException):
+                # drop the tentative row so a retry with the same booking_ref starts clean
+                try:
+                    await crud.delete_pending_booking(session, booking_ref)
+                except Exception:
+                    current_app.logger.exception("Failed to delete pending booking %s after calendar failure", booking_ref)
+            return jsonify({"error": "calendar_create_failed", "details": str(evt)}), 500
+
+        # persist booking in DB
+        created = booking
+        try:
+            if isinstance(booking, BaseException):
+                raise booking
+            booking = await crud.set_booking_event(session, booking_ref, evt.get("id"), "confirmed")
+            if booking is None:
+                raise LookupError(f"pending booking {booking_ref} disappeared before confirmation")
         except Exception as e:
-            current_app.logger.exception("DB create booking failed: %s", e)
+            current_app.logger.error("DB create booking failed: %s", e, exc_info=e)
+            await session.rollback()
+            # Only our own tentative row is removed; a create that lost a booking_ref clash left none
+            if not isinstance(created, BaseException):
+                try:
+                    await crud.delete_pending_booking(session, booking_ref)
+                except Exception:
+                    current_app.logger.exception("Failed to delete pending booking %s after DB failure", booking_ref)
             # Attempt to delete event to avoid ghost event
             try:
-                await _delete_event_async(calendar_id, evt.get("id"))
+                await google_calendar.delete_event(calendar_id, evt.get("id"))
             except Exception:
                 current_app.logger.exception("Failed to rollback calendar event after DB failure")
             return jsonify({"error": "db_create_failed", "details": str(e)}), 500
 
-        # Send confirmation email asynchronously (fire-and-forget)
+        # Send confirmation email via the bounded email outbox (fire-and-forget)
         try:
             # best-effort: don't block response
-            asyncio.create_task(email_svc.send_booking_confirmation_email(customer.get("email"), {
+            email_svc.enqueue(email_svc.send_booking_confirmation_email, customer.get("email"), {
                 "booking_ref": booking.booking_ref,
                 "service_id": booking.service_id,
                 "start": booking.start.isoformat(),
                 "end": booking.end.isoformat(),
                 "calendar_id": booking.calendar_id,
                 "event_id": booking.event_id
-            }, {"name": customer.get("name"), "customer_id": booking.customer_id, "email": customer.get("email")}))
+            }, {"name": customer.get("name"), "customer_id": booking.customer_id, "email": customer.get("email")})
         except Exception:
             current_app.logger.exception("Failed to enqueue confirmation email")
 
@@ -195,16 +214,12 @@ async def book():
 # Reschedule
 # -----------------------------------------------------------------------
 @bp.route("/reschedule", methods=["POST"])
-async def reschedule():
+@json_body()
+async def reschedule(payload):
     """
     Body:
       { "booking_ref": "...", "new_start": "...", "new_end": "..." }
     """
-    try:
-        payload = await request.get_json()
-    except Exception:
-        return jsonify({"error": "invalid_json"}), 400
-
     booking_ref = payload.get("booking_ref")
     new_start = payload.get("new_start")
     new_end = payload.get("new_end")
@@ -213,14 +228,14 @@ async def reschedule():
         return jsonify({"error": "booking_ref_new_start_new_end_required"}), 400
 
     try:
-        new_start_dt = datetime.fromisoformat(new_start.replace("Z", "+00:00"))
-        new_end_dt = datetime.fromisoformat(new_end.replace("Z", "+00:00"))
+        new_start_dt = parse_iso_strict(new_start)
+        new_end_dt = parse_iso_strict(new_end)
         if new_end_dt <= new_start_dt:
             return jsonify({"error": "end_must_be_after_start"}), 400
     except Exception:
         return jsonify({"error": "invalid_datetime_format"}), 400
 
-    async for session in get_session():
+    async with get_session() as session:
         booking = await crud.get_booking_by_ref(session, booking_ref)
         if not booking:
             return jsonify({"error": "booking_not_found"}), 404
@@ -231,7 +246,7 @@ async def reschedule():
                 "start": {"dateTime": new_start, "timeZone": "UTC"},
                 "end": {"dateTime": new_end, "timeZone": "UTC"},
             }
-            await _update_event_async(booking.calendar_id, booking.event_id, event_body)
+            await google_calendar.update_event(booking.calendar_id, booking.event_id, event_body)
         except Exception as e:
             current_app.logger.exception("Google update_event failed: %s", e)
             return jsonify({"error": "calendar_update_failed", "details": str(e)}), 500
@@ -245,7 +260,8 @@ async def reschedule():
 
         # send confirmation email
         try:
-            asyncio.create_task(email_svc.send_booking_confirmation_email(
+            email_svc.enqueue(
+                email_svc.send_booking_confirmation_email,
                 booking.customer_id or "", {
                     "booking_ref": updated.booking_ref,
                     "service_id": updated.service_id,
@@ -255,7 +271,7 @@ async def reschedule():
                     "event_id": updated.event_id
                 },
                 {"name": None, "customer_id": updated.customer_id, "email": booking.customer_id}
-            ))
+            )
         except Exception:
             current_app.logger.exception("Failed to enqueue reschedule email")
 
@@ -266,27 +282,23 @@ async def reschedule():
 # Cancel
 # -----------------------------------------------------------------------
 @bp.route("/cancel", methods=["POST"])
-async def cancel():
+@json_body()
+async def cancel(payload):
     """
     Body: { "booking_ref": "..." }
     """
-    try:
-        payload = await request.get_json()
-    except Exception:
-        return jsonify({"error": "invalid_json"}), 400
-
     booking_ref = payload.get("booking_ref")
     if not booking_ref:
         return jsonify({"error": "booking_ref_required"}), 400
 
-    async for session in get_session():
+    async with get_session() as session:
         booking = await crud.get_booking_by_ref(session, booking_ref)
         if not booking:
             return jsonify({"error": "booking_not_found"}), 404
 
         # Delete or cancel on Google Calendar (we will attempt delete)
         try:
-            await _delete_event_async(booking.calendar_id, booking.event_id)
+            await google_calendar.delete_event(booking.calendar_id, booking.event_id)
         except Exception:
             current_app.logger.exception("Google delete_event failed; attempting to mark cancelled in DB")
 
@@ -299,12 +311,13 @@ async def cancel():
 
         # notify customer
         try:
-            asyncio.create_task(email_svc.send_generic_email(
+            email_svc.enqueue(
+                email_svc.send_generic_email,
                 to_email=booking.customer_id or "",
                 subject=f"Booking Cancelled — {booking.booking_ref}",
                 body_html=f"<p>Your booking {booking.booking_ref} has been cancelled.</p>",
                 body_plain=f"Your booking {booking.booking_ref} has been cancelled."
-            ))
+            )
         except Exception:
             current_app.logger.exception("Failed to enqueue cancellation email")
 
@@ -316,12 +329,28 @@ async def cancel():
 # -----------------------------------------------------------------------
 @bp.route("/bookings/<string:customer_id>", methods=["GET"])
 async def list_bookings(customer_id: str):
+    """
+    Query params: upcoming_only (default true), limit, cursor.
+    With limit, a full page carries next_cursor; pass it back as cursor for the next page.
+    Without limit, every matching booking is returned.
+    """
     upcoming_only = request.args.get("upcoming_only", "true").lower() != "false"
-    async for session in get_session():
+    try:
+        limit = int(request.args["limit"]) if request.args.get("limit") else None
+        after = _decode_booking_cursor(request.args["cursor"]) if request.args.get("cursor") else None
+        if limit is not None and limit < 1:
+            raise ValueError(limit)
+    except Exception:
+        return jsonify({"error": "invalid_limit_or_cursor"}), 400
+
+    async with get_session() as session:
         try:
-            bookings = await crud.list_bookings_for_customer(session, customer_id, upcoming_only=upcoming_only)
+            bookings = await crud.list_bookings_for_customer(session, customer_id, upcoming_only=upcoming_only, limit=limit, after=after)
             results = [_serialize_booking(b) for b in bookings]
-            return jsonify({"customer_id": customer_id, "count": len(results), "bookings": results})
+            response: Dict[str, Any] = {"customer_id": customer_id, "count": len(results), "bookings": results}
+            if limit is not None and len(bookings) == limit:
+                response["next_cursor"] = _encode_booking_cursor(bookings[-1])
+            return jsonify(response)
         except Exception as e:
             current_app.logger.exception("Failed listing bookings for customer %s: %s", customer_id, e)
             return jsonify({"error": "internal_error"}), 500
@@ -332,7 +361,7 @@ async def list_bookings(customer_id: str):
 # -----------------------------------------------------------------------
 @bp.route("/booking/<string:booking_ref>", methods=["GET"])
 async def get_booking(booking_ref: str):
-    async for session in get_session():
+    async with get_session() as session:
         b = await crud.get_booking_by_ref(session, booking_ref)
         if not b:
             return jsonify({"error": "not_found"}), 404
@@ -342,22 +371,36 @@ async def get_booking(booking_ref: str):
 # -----------------------------------------------------------------------
 # Helpers
 # -----------------------------------------------------------------------
+def _iso(v: Any) -> Optional[str]:
+    if v is None:
+        return None
+    return v.isoformat() if isinstance(v, datetime) else str(v)
+
+
+def _encode_booking_cursor(b) -> str:
+    """Opaque, URL-safe keyset cursor: the (start, id) of the last booking on a page."""
+    return base64.urlsafe_b64encode(f"{b.start.isoformat()}|{b.id}".encode()).decode().rstrip("=")
+
+
+def _decode_booking_cursor(cursor: str) -> Tuple[datetime, int]:
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+    start, _, booking_id = raw.rpartition("|")
+    return parse_iso_strict(start), int(booking_id)
+
+
+_BOOKING_FIELDS = (
+    "id", "booking_ref", "idempotency_key", "customer_id", "agent_id", "calendar_id",
+    "event_id", "service_id", "start", "end", "status", "paid", "created_at", "updated_at",
+)
+_booking_values = operator.attrgetter(*_BOOKING_FIELDS)
+
+
 def _serialize_booking(b) -> Dict[str, Any]:
     if not b:
         return {}
-    return {
-        "id": b.id,
-        "booking_ref": b.booking_ref,
-        "idempotency_key": b.idempotency_key,
-        "customer_id": b.customer_id,
-        "agent_id": b.agent_id,
-        "calendar_id": b.calendar_id,
-        "event_id": b.event_id,
-        "service_id": b.service_id,
-        "start": b.start.isoformat() if hasattr(b.start, "isoformat") else str(b.start),
-        "end": b.end.isoformat() if hasattr(b.end, "isoformat") else str(b.end),
-        "status": b.status,
-        "paid": bool(b.paid),
-        "created_at": b.created_at.isoformat() if hasattr(b.created_at, "isoformat") else str(b.created_at),
-        "updated_at": b.updated_at.isoformat() if getattr(b, "updated_at", None) and hasattr(b.updated_at, "isoformat") else (b.updated_at and str(b.updated_at)),
-    }
+    # one C-level attrgetter call per booking instead of a Python attribute load per field
+    row = dict(zip(_BOOKING_FIELDS, _booking_values(b)))
+    for key in ("start", "end", "created_at", "updated_at"):
+        row[key] = _iso(row[key])
+    row["paid"] = bool(row["paid"])
+    return row
@@ -23,7 +23,10 @@ Routes:
      (alias to the above with agent_id path param)
 """
 from __future__ import annotations
+import os
 import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime, timedelta, timezone
 
@@ -32,6 +35,12 @@ from quart import Blueprint, request, jsonify, current_app
 from ..db import get_session
 from .. import crud, llm, utils
 
+# SIMD tree hash for transcripts (optional; hashlib.blake2b otherwise)
+try:
+    import blake3  # type: ignore
+except Exception:
+    blake3 = None  # type: ignore
+
 bp = Blueprint("summary_routes", __name__, url_prefix="/v1/summary")
 
 
@@ -42,7 +51,7 @@ def _parse_iso_or_none(s: Optional[str]) -> Optional[datetime]:
     if not s:
         return None
     try:
-        return datetime.fromisoformat(s.replace("Z", "+00:00"))
+        return utils.parse_iso_strict(s)
     except Exception:
         return None
 
@@ -60,41 +69,12 @@ def _preset_to_range(preset: Optional[str]) -> Optional[tuple]:
     return None
 
 
-def _serialize_msg_for_cache(m: Any) -> Dict[str, Any]:
-    """
-    Convert Message model or dict to lightweight dict for hashing/caching/LLM.
-    """
-    if m is None:
-        return {}
-    # If SQLModel object or similar
-    try:
-        data = {}
-        for k, v in vars(m).items():
-            if k.startswith("_") or k == "_sa_instance_state":
-                continue
-            if hasattr(v, "isoformat"):
-                try:
-                    data[k] = v.isoformat()
-                except Exception:
-                    data[k] = str(v)
-            else:
-                data[k] = v
-        return data
-    except Exception:
-        # assume dict-like
-        try:
-            return {k: (v.isoformat() if hasattr(v, "isoformat") else v) for k, v in m.items()}
-        except Exception:
-            return {"message": str(m)}
-
-
-async def _generate_summary_for_messages(messages: List[Dict[str, Any]], n_sentences: int = 3) -> Tuple[List[str], Dict[str, Any]]:
+async def _generate_summary_for_messages(convo_text: str, n_sentences: int = 3) -> Tuple[List[str], Dict[str, Any]]:
     """
-    Use the llm adapter to summarize a list of message dicts into n_sentences.
+    Use the llm adapter to summarize a conversation transcript into n_sentences.
     Handles chunking for very long conversations.
     Returns (sentences, meta).
     """
-    convo_text = utils.export_messages_to_text(messages)
     # If very long, use chunked path
     try:
         if len(convo_text) > 12000:
@@ -116,6 +96,115 @@ async def _generate_summary_for_messages(messages: List[Dict[str, Any]], n_sente
         return fallback, {"topics": [], "sentiment": "mixed"}
 
 
+def _summary_model() -> str:
+    """Model the llm adapter will use (part of the cache key, so upgrades invalidate)."""
+    if llm.SALESIQ_API_URL:
+        return llm.SALESIQ_MODEL
+    return llm.OPENAI_CHAT_MODEL if getattr(llm, "OPENAI_API_KEY", None) else "none"
+
+
+def _conv_hash(text: str) -> str:
+    """128-bit hex digest used for Summary.source_hash / cache_key."""
+    data = text.encode("utf-8")
+    if blake3 is not None:
+        return blake3.blake3(data).digest(length=16).hex()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+# Large transcripts (long ranges) are hashed off the event loop. hashlib/blake3
+# release the GIL while hashing, so threads run in parallel without the pickling
+# cost a process pool would add for the text.
+_HASH_POOL = ThreadPoolExecutor(max_workers=os.cpu_count() or 4, thread_name_prefix="hash")
+_HASH_OFFLOAD_MIN_CHARS = 256 * 1024
+
+
+async def _conv_hash_async(text: str) -> str:
+    if len(text) < _HASH_OFFLOAD_MIN_CHARS:
+        return _conv_hash(text)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_HASH_POOL, _conv_hash, text)
+
+
+def _summary_cache_key(customer_id: str, agent_id: Optional[str], source_hash: str, n_sentences: int) -> str:
+    return "sum:" + _conv_hash(f"{customer_id}\x00{agent_id or ''}\x00{_summary_model()}\x00{n_sentences}\x00{source_hash}")
+
+
+async def get_or_create_summary(
+    session,
+    customer_id: str,
+    agent_id: Optional[str],
+    messages: List[Dict[str, Any]],
+    n_sentences: int = 3,
+    range_start: Optional[datetime] = None,
+    range_end: Optional[datetime] = None,
+    force: bool = False,
+) -> Dict[str, Any]:
+    """
+    Return the summary for `messages`, reusing a stored Summary when the same transcript
+    was already summarized (same customer/agent, model and sentence count) — the LLM is
+    only called on a miss or when `force` is set. Range bounds don't enter the key, so
+    overlapping ranges that select the same messages share one row.
+    """
+    convo_text = utils.export_messages_to_text(messages)
+    source_hash = await _conv_hash_async(convo_text)
+    cache_key = _summary_cache_key(customer_id, agent_id, source_hash, n_sentences)
+
+    if not force:
+        try:
+            cached = await crud.get_summary_by_cache_key(session, cache_key)
+        except Exception as e:
+            current_app.logger.debug("Summary cache lookup error: %s", e)
+            cached = None
+        if cached is not None:
+            return {
+                "message_count": cached.message_count or len(messages),
+                "sentences": cached.sentences or [],
+                "meta": {"topics": cached.topics or [], "sentiment": cached.sentiment or "neutral", "model_meta": cached.model_meta or {}},
+                "cached": True,
+                "cache_key": cached.cache_key,
+                "generated_at": cached.generated_at.isoformat() if hasattr(cached, "generated_at") else None,
+            }
+
+    sentences_list, meta = await _generate_summary_for_messages(convo_text, n_sentences=n_sentences)
+
+    # Best-effort persist summary
+    try:
+        saved = await crud.save_summary(
+            session=session,
+            customer_id=customer_id,
+            agent_id=agent_id,
+            range_start=range_start,
+            range_end=range_end,
+            sentences=sentences_list,
+            topics=meta.get("topics") if isinstance(meta, dict) else [],
+            sentiment=meta.get("sentiment") if isinstance(meta, dict) else None,
+            message_count=len(messages),
+            model_meta={"provider": "salesiq" if (llm.SALESIQ_API_URL) else ("openai" if getattr(llm, "OPENAI_API_KEY", None) else "none"), "model": _summary_model(), "notes": "generated_via_api"},
+            cache_key=cache_key,
+            source_hash=source_hash,
+        )
+        cache_key_out = saved.cache_key
+        generated_at = saved.generated_at.isoformat() if hasattr(saved, "generated_at") else datetime.now(timezone.utc).isoformat()
+    except Exception as e:
+        # e.g. unique cache_key clash on a forced regeneration
+        current_app.logger.exception("Failed to persist summary (non-fatal): %s", e)
+        try:
+            await session.rollback()
+        except Exception:
+            pass
+        cache_key_out = cache_key
+        generated_at = datetime.now(timezone.utc).isoformat()
+
+    return {
+        "message_count": len(messages),
+        "sentences": sentences_list,
+        "meta": meta or {},
+        "cached": False,
+        "cache_key": cache_key_out,
+        "generated_at": generated_at,
+    }
+
+
 # -------------------------
 # Main endpoint
 # -------------------------
@@ -150,14 +239,17 @@ async def get_summary(customer_id: str, agent_id: Optional[str] = None):
         start_dt = end_dt - timedelta(days=30)
 
     # fetch messages for range
-    async for session in get_session():
+    async with get_session() as session:
         try:
-            msgs = await crud.get_messages(session, customer_id=customer_id, agent_id=agent_id, start=start_dt, end=end_dt)
+            # plain transcript rows (created_at already ISO) straight from the cursor
+            serial_msgs = [
+                m async for m in crud.stream_message_rows(session, customer_id=customer_id, agent_id=agent_id, start=start_dt, end=end_dt)
+            ]
         except Exception as e:
             current_app.logger.exception("Failed to fetch messages for summary: %s", e)
             return jsonify({"error": "failed_fetch_messages", "details": str(e)}), 500
 
-        if not msgs:
+        if not serial_msgs:
             return jsonify({
                 "customer_id": customer_id,
                 "agent_id": agent_id,
@@ -167,72 +259,14 @@ async def get_summary(customer_id: str, agent_id: Optional[str] = None):
                 "cached": False,
             })
 
-        # Prepare serializable messages and cache key
-        serial_msgs = [_serialize_msg_for_cache(m) for m in msgs]
-        cache_payload = serial_msgs + [{"range_start": start_dt.isoformat(), "range_end": end_dt.isoformat(), "agent_id": agent_id}]
-        cache_key = utils.cache_key_from_messages(cache_payload)
-
-        # derive source_hash (concatenate message ids if present)
-        try:
-            ids_concat = "|".join([str(m.get("message_id") or m.get("id") or "") for m in serial_msgs])
-            source_hash = utils.sha256(f"{ids_concat}|{start_dt.isoformat()}|{end_dt.isoformat()}|{agent_id or ''}")
-        except Exception:
-            source_hash = utils.sha256(cache_key)
-
-        # Check cache unless forced
-        cached_summary = None
-        if not force_flag:
-            try:
-                cached_summary = await crud.get_summary_by_cache_key(session, cache_key)
-            except Exception as e:
-                current_app.logger.debug("Summary cache lookup error: %s", e)
-                cached_summary = None
-
-        if cached_summary and not force_flag:
-            return jsonify({
-                "customer_id": customer_id,
-                "agent_id": agent_id,
-                "message_count": cached_summary.message_count or len(serial_msgs),
-                "sentences": cached_summary.sentences or [],
-                "meta": {"topics": cached_summary.topics or [], "sentiment": cached_summary.sentiment or "neutral", "model_meta": cached_summary.model_meta or {}},
-                "cached": True,
-                "cache_key": cached_summary.cache_key,
-                "generated_at": cached_summary.generated_at.isoformat() if hasattr(cached_summary, "generated_at") else None,
-            })
-
-        # Generate new summary
-        sentences_list, meta = await _generate_summary_for_messages(serial_msgs, n_sentences=sentences)
-
-        # Best-effort persist summary
-        try:
-            saved = await crud.save_summary(
-                session=session,
-                customer_id=customer_id,
-                agent_id=agent_id,
-                range_start=start_dt,
-                range_end=end_dt,
-                sentences=sentences_list,
-                topics=meta.get("topics") if isinstance(meta, dict) else [],
-                sentiment=meta.get("sentiment") if isinstance(meta, dict) else None,
-                message_count=len(serial_msgs),
-                model_meta={"provider": "salesiq" if (llm.SALESIQ_API_URL) else ("openai" if getattr(llm, "OPENAI_API_KEY", None) else "none"), "notes": "generated_via_api"},
-                cache_key=cache_key,
-                source_hash=source_hash,
-            )
-            cache_key_out = saved.cache_key
-            generated_at = saved.generated_at.isoformat() if hasattr(saved, "generated_at") else datetime.now(timezone.utc).isoformat()
-        except Exception as e:
-            current_app.logger.exception("Failed to persist summary (non-fatal): %s", e)
-            cache_key_out = cache_key
-            generated_at = datetime.now(timezone.utc).isoformat()
-
-        return jsonify({
-            "customer_id": customer_id,
-            "agent_id": agent_id,
-            "message_count": len(serial_msgs),
-            "sentences": sentences_list,
-            "meta": meta or {},
-            "cached": False,
-            "cache_key": cache_key_out,
-            "generated_at": generated_at,
-        })
+        result = await get_or_create_summary(
+            session,
+            customer_id,
+            agent_id,
+            serial_msgs,
+            n_sentences=sentences,
+            range_start=start_dt,
+            range_end=end_dt,
+            force=force_flag,
+        )
+        return jsonify({"customer_id": customer_id, "agent_id": agent_id, **result})
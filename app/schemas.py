@@ -12,6 +12,8 @@ from typing import Any, Dict, Optional
 
 from marshmallow import Schema, fields, ValidationError, pre_load, post_load
 
+from .utils import parse_iso_strict
+
 
 EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
 PHONE_RE = re.compile(r"^\+?[0-9]{7,15}$")
@@ -21,8 +23,8 @@ def _parse_iso_datetime(value: Optional[str]) -> Optional[datetime]:
     if not value:
         return None
     try:
-        # accept trailing Z
-        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+        # accept trailing Z (ciso8601 when installed)
+        return parse_iso_strict(value)
     except Exception:
         # fallback naive parse
         try:
@@ -120,6 +122,8 @@ class OTPVerifySchema(Schema):
         phone = data.get("phone")
         if not phone or not PHONE_RE.match(phone):
             raise ValidationError("Invalid phone number format", field_name="phone")
+        if not data.get("code"):
+            raise ValidationError("Code required", field_name="code")
         # If email provided, validate it loosely
         em = data.get("email")
         if em and not EMAIL_RE.match(em):
@@ -0,0 +1,109 @@
+# app/services/llm_batcher.py
+"""
+Micro-batching front for bot reply suggestions.
+
+Concurrent /incoming requests enqueue their message and await a future. A single worker
+collects whatever arrives within LLM_BATCH_MAX_WAIT seconds of the first message (up to
+LLM_BATCH_MAX items), answers the batch with llm.generate_bot_suggestions_batch and
+resolves each future with its own reply. Batches are dispatched as tasks, so a slow LLM
+call never holds up collection of the next batch.
+
+Environment variables:
+ - LLM_BATCH_MAX       (default 16)
+ - LLM_BATCH_MAX_WAIT  (seconds, default 0.01)
+"""
+from __future__ import annotations
+import os
+import asyncio
+import logging
+from typing import List, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+
+from ..services import llm
+
+load_dotenv()
+logger = logging.getLogger("llm_batcher")
+
+MAX_BATCH = int(os.getenv("LLM_BATCH_MAX", "16"))
+MAX_WAIT = float(os.getenv("LLM_BATCH_MAX_WAIT", "0.01"))
+
+_queue: Optional[asyncio.Queue] = None
+_worker: Optional[asyncio.Task] = None
+_inflight: Set[asyncio.Task] = set()
+
+
+async def start() -> None:
+    """Start the batching worker on the running loop (idempotent)."""
+    global _queue, _worker
+    # keep an existing queue: requests already waiting on it must reach the new worker
+    if _queue is None:
+        _queue = asyncio.Queue()
+    if _worker is None or _worker.done():
+        _worker = asyncio.create_task(_run())
+
+
+async def stop() -> None:
+    """Stop collecting, fail requests not yet batched and let dispatched batches finish."""
+    global _worker
+    if _worker is not None:
+        _worker.cancel()
+        try:
+            await _worker
+        except asyncio.CancelledError:
+            pass
+        _worker = None
+    if _queue is not None:
+        leftover = []
+        while not _queue.empty():
+            leftover.append(_queue.get_nowait())
+        _fail(leftover, RuntimeError("LLM batcher stopped"))
+    if _inflight:
+        await asyncio.gather(*_inflight, return_exceptions=True)
+
+
+async def suggest(message: str) -> Optional[str]:
+    """One suggested bot reply for message (None if the model returned nothing)."""
+    if _worker is None or _worker.done():
+        await start()
+    fut = asyncio.get_running_loop().create_future()
+    _queue.put_nowait((message, fut))
+    return await fut
+
+
+async def _run() -> None:
+    batch: List[Tuple[str, asyncio.Future]] = []
+    try:
+        while True:
+            batch = [await _queue.get()]
+            # Give concurrent requests one window to join, then take what arrived
+            await asyncio.sleep(MAX_WAIT)
+            while len(batch) < MAX_BATCH and not _queue.empty():
+                batch.append(_queue.get_nowait())
+            task = asyncio.create_task(_dispatch(batch))
+            _inflight.add(task)
+            task.add_done_callback(_inflight.discard)
+            batch = []
+    except asyncio.CancelledError:
+        # cancelled mid-window: the batch being collected was never dispatched
+        _fail(batch, RuntimeError("LLM batcher stopped"))
+        raise
+
+
+def _fail(batch: List[Tuple[str, asyncio.Future]], exc: BaseException) -> None:
+    for _, fut in batch:
+        if not fut.done():
+            fut.set_exception(exc)
+
+
+async def _dispatch(batch: List[Tuple[str, asyncio.Future]]) -> None:
+    try:
+        results = await llm.generate_bot_suggestions_batch([message for message, _ in batch], n=1)
+    except Exception as e:
+        logger.exception("Batched bot suggestions failed (%d messages)", len(batch))
+        _fail(batch, e)
+        return
+    for (_, fut), suggestions in zip(batch, results):
+        # a request that went away cancels its future; skip it
+        if not fut.done():
+            fut.set_result(suggestions[0] if suggestions else None)
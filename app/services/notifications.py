@@ -191,16 +191,18 @@ async def notify_new_message(
         tasks = []
         payload = {"event": "new_message", "customer_id": customer_id, "agent_id": agent_id, "message_id": message_id, "message_text": message_text, "meta": extra}
         if "inapp" in channels:
-            # create an in-app notification persisted in DB
-            async for session in get_session():
-                tasks.append(asyncio.create_task(create_in_app_notification(session, recipient_id=agent_id, title=title, body=body, meta=extra)))
-                break  # get_session yields one session per async for
+            # create an in-app notification persisted in DB (the task owns its session,
+            # so it isn't closed underneath it when this block exits)
+            async def _persist_inapp():
+                async with get_session() as session:
+                    return await create_in_app_notification(session, recipient_id=agent_id, title=title, body=body, meta=extra)
+            tasks.append(asyncio.create_task(_persist_inapp()))
         if "ws" in channels:
             tasks.append(asyncio.create_task(_send_ws_push(agent_id, payload)))
         if "slack" in channels and SLACK_WEBHOOK:
             tasks.append(asyncio.create_task(_send_slack_async(body, title)))
         # SMS/email/fcm typically need agent contact info — lookup agent record
-        async for session in get_session():
+        async with get_session() as session:
             agent = await crud.get_agent_by_id(session, agent_id)
             if "email" in channels and agent and agent.email:
                 tasks.append(asyncio.create_task(_send_email_async(f"{title} — {customer_id}", agent.email, f"<p>{body}</p>")))
@@ -208,7 +210,6 @@ async def notify_new_message(
                 tasks.append(asyncio.create_task(_send_sms_async(agent.phone, body)))
             # If agent has fcm token in meta or DB, you can call _send_fcm_async here
             # e.g. if agent.meta.get('fcm_token')
-            break
 
         # await all tasks and return results
         if tasks:
@@ -250,9 +251,8 @@ async def notify_booking_event(
     body = f"{title}: {booking.get('booking_ref')} — {booking.get('service_id')} on {booking.get('start')}"
 
     # 1) persist in-app for customer
-    async for session in get_session():
+    async with get_session() as session:
         await create_in_app_notification(session, recipient_id=customer_id, title=title, body=body, meta={"booking_ref": booking.get("booking_ref"), "event": event_type})
-        break
 
     # 2) email customer
     if notify_customer_email and booking.get("customer_email"):
@@ -16,7 +16,8 @@ Behavior:
  - The handler will:
      - Extract customer identifier (phone -> email -> visitorId)
      - Map agentId if present
-     - Save the incoming message to DB via crud.save_message
+     - Save the incoming message to DB via crud.ingest_messages (redelivered webhooks
+       with the same SalesIQ message id are dropped by the database)
      - If the message came from a visitor and no agent was assigned, optionally generate a bot reply (via llm.generate_bot_suggestions)
      - Reply with 200 and a small JSON acknowledging reception
 
@@ -28,10 +29,11 @@ Notes:
 from __future__ import annotations
 import asyncio
 from typing import Any, Dict, Optional
-from quart import Blueprint, request, jsonify, current_app
+from quart import Blueprint, jsonify, current_app
 
 from ..db import get_session
 from .. import crud
+from ..routers import json_body
 from ..services import llm
 from ..utils import generate_id
 
@@ -75,16 +77,12 @@ async def _maybe_generate_bot_reply(session, customer_id: str, agent_id: Optiona
 
 
 @bp.route("/v1/salesiq/webhook", methods=["POST"])
-async def salesiq_webhook():
+@json_body()
+async def salesiq_webhook(payload):
     """Primary webhook receiver for SalesIQ / Zobot events.
 
     Expected JSON payloads vary; we try to support multiple shapes.
     """
-    try:
-        payload = await request.get_json()
-    except Exception:
-        return jsonify({"error": "invalid_json"}), 400
-
     # Common SalesIQ fields may include: visitorId / visitor / contact / message / text / from / agentId / user
     # We'll attempt to extract the most useful bits with fallbacks.
     # 1) Identify visitor / customer
@@ -136,7 +134,10 @@ async def salesiq_webhook():
 
     # Some payloads include a top-level message or text
     text = _extract_field(payload, "message", "text", "msg", "content")
+    # SalesIQ message id (when present) makes redelivery idempotent
+    source_msg_id = _extract_field(payload, "messageId", "message_id", "msgId", "msgid")
     if isinstance(text, dict):
+        source_msg_id = source_msg_id or _extract_field(text, "id", "messageId", "msgid")
         # message object -> try to get .content or .text
         text = text.get("content") or text.get("text") or text.get("body")
 
@@ -144,24 +145,29 @@ async def salesiq_webhook():
         return jsonify({"error": "no_message_text_found", "received_keys": list(payload.keys())}), 400
 
     # 4) Persist incoming message
-    async for session in get_session():
+    async with get_session() as session:
+        message_id = f"salesiq-{source_msg_id}" if source_msg_id else None
         try:
-            saved = await crud.save_message(
-                session=session,
-                customer_id=customer_id,
-                agent_id=agent_id,
-                sender=("agent" if sender == "agent" else ("bot" if sender == "bot" else "customer")),
-                message=str(text),
-                meta={
+            inserted = await crud.ingest_messages(session, [{
+                "message_id": message_id,
+                "customer_id": customer_id,
+                "agent_id": agent_id,
+                "sender": sender,
+                "message": str(text),
+                "meta": {
                     "raw_payload": payload,
                     "salesiq_visitor": visitor,
                 },
-            )
+            }])
         except Exception as e:
             current_app.logger.exception("Failed saving SalesIQ webhook message: %s", e)
             return jsonify({"error": "db_error", "details": str(e)}), 500
 
-        response_payload: Dict[str, Any] = {"status": "saved", "message_id": saved.message_id, "customer_id": customer_id}
+        if not inserted:
+            # Redelivery of a message we already stored (and already replied to)
+            return jsonify({"status": "duplicate", "message_id": message_id, "customer_id": customer_id})
+
+        response_payload: Dict[str, Any] = {"status": "saved", "message_id": inserted[0]["message_id"], "customer_id": customer_id}
 
         # 5) If visitor sent message and no agent assigned, optionally create a bot reply
         if sender == "customer" and not agent_id:
@@ -7,8 +7,9 @@ This module supports two modes:
 2. Fallback: send a plain SMS containing a numeric OTP using Twilio Messages API.
 
 It exposes both synchronous functions (send_otp, check_otp, send_sms) and
-async wrappers (send_otp_async, check_otp_async, send_sms_async) which use
-asyncio.to_thread to avoid blocking an async event loop.
+async versions (send_otp_async, check_otp_async, send_sms_async). The async ones POST
+the Twilio REST API over a shared HTTP/2 keep-alive httpx client, so OTP sends and
+checks reuse one TLS session; without httpx they run the sync functions in a thread.
 
 Environment variables:
  - TWILIO_ACCOUNT_SID
@@ -32,6 +33,15 @@ TW_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
 TW_VERIFY_SID = os.getenv("TWILIO_VERIFY_SERVICE_SID")
 TW_FROM_NUMBER = os.getenv("TWILIO_FROM_NUMBER")  # e.g. "+12345556789"
 
+TWILIO_API_BASE = "https://api.twilio.com/2010-04-01"
+TWILIO_VERIFY_API_BASE = "https://verify.twilio.com/v2"
+
+# Async HTTP client for the REST API (optional)
+try:
+    import httpx  # type: ignore
+except Exception:
+    httpx = None  # type: ignore
+
 # Lazy import Twilio client only when needed to avoid hard dependency on import time
 _client = None
 
@@ -151,18 +161,118 @@ def send_sms(to: str, body: str) -> dict:
 
 
 # -------------------------
-# Async wrappers
+# Async API (shared keep-alive REST client)
 # -------------------------
+_tw_http = None
+_tw_http_loop = None
+
+
+def _ensure_tw_http():
+    """
+    Shared keep-alive client for the Twilio REST and Verify hosts, rebuilt if the
+    event loop changed.
+    """
+    global _tw_http, _tw_http_loop
+    loop = asyncio.get_running_loop()
+    if _tw_http is None or _tw_http.is_closed or _tw_http_loop is not loop:
+        _tw_http = httpx.AsyncClient(
+            auth=(TW_ACCOUNT, TW_TOKEN),
+            timeout=15,
+            # retries cover connect-time failures only (DNS/TCP), never a sent request
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                retries=2,
+                limits=httpx.Limits(max_keepalive_connections=50),
+            ),
+        )
+        _tw_http_loop = loop
+    return _tw_http
+
+
+def _use_http() -> bool:
+    return httpx is not None and bool(TW_ACCOUNT and TW_TOKEN)
+
+
+async def _post(url: str, data: dict) -> dict:
+    resp = await _ensure_tw_http().post(url, data=data)
+    resp.raise_for_status()
+    return resp.json()
+
+
+async def _send_message_async(to: str, body: str) -> dict:
+    return await _post(f"{TWILIO_API_BASE}/Accounts/{TW_ACCOUNT}/Messages.json", {"To": to, "From": TW_FROM_NUMBER, "Body": body})
+
+
 async def send_otp_async(phone: str, code_length: int = 6) -> dict:
-    return await asyncio.to_thread(send_otp, phone, code_length)
+    """Async send_otp (same return shapes)."""
+    if not _use_http():
+        return await asyncio.to_thread(send_otp, phone, code_length)
+
+    if TW_VERIFY_SID:
+        try:
+            ver = await _post(f"{TWILIO_VERIFY_API_BASE}/Services/{TW_VERIFY_SID}/Verifications", {"To": phone, "Channel": "sms"})
+            return {"status": ver.get("status", "pending"), "sid": ver.get("sid")}
+        except Exception as e:
+            logger.exception("Twilio Verify failed: %s", e)
+            # fallback to SMS below
+    code = _generate_numeric_code(code_length)
+    if not TW_FROM_NUMBER:
+        logger.error("TWILIO_FROM_NUMBER is not set; cannot send SMS. Returning code to caller.")
+        return {"status": "no_from_number", "code": code}
+    try:
+        msg = await _send_message_async(phone, f"Your verification code is: {code}")
+        return {"status": msg.get("status", "sent"), "sid": msg.get("sid"), "code": code}
+    except Exception as e:
+        logger.exception("Twilio Messages API failed: %s", e)
+        return {"status": "failed", "error": str(e)}
 
 
 async def check_otp_async(phone: str, code: str) -> bool:
-    return await asyncio.to_thread(check_otp, phone, code)
+    """Async check_otp."""
+    if not _use_http() or not TW_VERIFY_SID:
+        return await asyncio.to_thread(check_otp, phone, code)
+    try:
+        chk = await _post(f"{TWILIO_VERIFY_API_BASE}/Services/{TW_VERIFY_SID}/VerificationCheck", {"To": phone, "Code": code})
+        return chk.get("status", "") == "approved"
+    except Exception as e:
+        logger.exception("Twilio Verify check failed: %s", e)
+        return False
 
 
 async def send_sms_async(to: str, body: str) -> dict:
-    return await asyncio.to_thread(send_sms, to, body)
+    """Async send_sms."""
+    if not _use_http() or not TW_FROM_NUMBER:
+        return await asyncio.to_thread(send_sms, to, body)
+    try:
+        msg = await _send_message_async(to, body)
+        return {"status": msg.get("status", "sent"), "sid": msg.get("sid")}
+    except Exception as e:
+        logger.exception("Twilio send_sms failed: %s", e)
+        return {"status": "failed", "error": str(e)}
+
+
+async def warmup() -> None:
+    """
+    Open the connection (DNS + TCP + TLS) to the host OTP sends use, ahead of the
+    first request. Call once the serving event loop is running; failures are ignored.
+    """
+    if not _use_http():
+        return
+    try:
+        await _ensure_tw_http().head(TWILIO_VERIFY_API_BASE if TW_VERIFY_SID else TWILIO_API_BASE)
+    except Exception as e:
+        logger.debug("Twilio warmup failed: %s", e)
+
+
+async def close_connections() -> None:
+    """Close the shared Twilio client (useful on shutdown)."""
+    global _tw_http
+    if _tw_http is not None and not _tw_http.is_closed:
+        try:
+            await _tw_http.aclose()
+        except Exception:
+            pass
+    _tw_http = None
 
 
 # -------------------------
@@ -23,6 +23,12 @@ import secrets
 from datetime import datetime, timezone
 from typing import Any, Dict, List, Optional
 
+# C ISO-8601 parser (optional; datetime.fromisoformat otherwise)
+try:
+    from ciso8601 import parse_datetime as _ciso_parse  # type: ignore
+except Exception:
+    _ciso_parse = None  # type: ignore
+
 
 # -------------------------------------------------------------
 # TIME HELPERS
@@ -39,10 +45,17 @@ def to_iso(dt: datetime) -> str:
     return dt.isoformat()
 
 
+def parse_iso_strict(s: str) -> datetime:
+    """Parse ISO8601 string to datetime; raises ValueError if it isn't one."""
+    if _ciso_parse is not None:
+        return _ciso_parse(s)
+    return datetime.fromisoformat(s.replace("Z", "+00:00"))
+
+
 def parse_iso(s: str) -> datetime:
-    """Parse ISO8601 string to datetime."""
+    """Parse ISO8601 string to datetime (now, if it can't be parsed)."""
     try:
-        return datetime.fromisoformat(s.replace("Z", "+00:00"))
+        return parse_iso_strict(s)
     except Exception:
         return utcnow()
 
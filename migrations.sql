@@ -10,6 +10,7 @@ CREATE TABLE IF NOT EXISTS messages (
   created_at timestamptz NOT NULL DEFAULT now()
 );
 CREATE INDEX IF NOT EXISTS idx_messages_customer_agent_time ON messages(customer_id, agent_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_messages_customer_time ON messages(customer_id, created_at DESC);
 
 -- agents
 CREATE TABLE IF NOT EXISTS agents (
@@ -19,6 +20,7 @@ CREATE TABLE IF NOT EXISTS agents (
   password_hash TEXT,
   created_at timestamptz DEFAULT now()
 );
+CREATE INDEX IF NOT EXISTS idx_agents_email_lower ON agents(lower(email));
 
 -- customers
 CREATE TABLE IF NOT EXISTS customers (
@@ -28,6 +30,7 @@ CREATE TABLE IF NOT EXISTS customers (
   phone TEXT,
   created_at timestamptz DEFAULT now()
 );
+CREATE INDEX IF NOT EXISTS idx_customers_email_lower ON customers(lower(email));
 
 -- bookings
 CREATE TABLE IF NOT EXISTS bookings (
@@ -47,11 +50,12 @@ CREATE TABLE IF NOT EXISTS bookings (
   updated_at timestamptz DEFAULT now()
 );
 CREATE INDEX IF NOT EXISTS idx_bookings_customer ON bookings(customer_id);
+CREATE INDEX IF NOT EXISTS idx_bookings_customer_end ON bookings(customer_id, "end") WHERE status <> 'cancelled';
 
 -- otps
 CREATE TABLE IF NOT EXISTS otps (
   id BIGSERIAL PRIMARY KEY,
-  phone TEXT NOT NULL,
+  phone TEXT NOT NULL UNIQUE,
   code TEXT NOT NULL,
   valid_until timestamptz NOT NULL,
   used BOOLEAN DEFAULT FALSE,
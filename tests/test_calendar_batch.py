@@ -0,0 +1,150 @@
+# tests/test_calendar_batch.py
+"""
+batch_calendar's hand-written multipart/mixed request body and response parser,
+exercised against a fake batch endpoint (no network, no Google credentials).
+"""
+import asyncio
+import json
+import re
+
+import httpx
+import pytest
+
+from app import google_calendar as gc
+from app.google_calendar import CalOp, CalendarBatchError
+
+
+def _response_part(boundary, item, status, reason, body):
+    payload = json.dumps(body) if body is not None else ""
+    return "\r\n".join([
+        f"--{boundary}",
+        "Content-Type: application/http",
+        f"Content-ID: <response-item{item}>",
+        "",
+        f"HTTP/1.1 {status} {reason}",
+        "Content-Type: application/json; charset=UTF-8",
+        "",
+        payload,
+    ])
+
+
+class FakeBatchEndpoint:
+    """
+    Answers each sub-request with {"echo": <its request line>}, parts in reverse order,
+    except the op paths listed in `failures`, which get that (status, body) instead.
+    """
+
+    def __init__(self, failures=None):
+        self.failures = failures or {}
+        self.posts = []
+
+    async def post(self, url, content=None, headers=None):
+        self.posts.append(content)
+        boundary = headers["Content-Type"].split("boundary=", 1)[1]
+        parts = []
+        for raw in content.decode().split(f"--{boundary}")[1:-1]:
+            item = int(re.search(r"Content-ID: <item(\d+)>", raw).group(1))
+            request_line = re.search(r"^((GET|POST|PATCH|PUT|DELETE) (\S+) HTTP/1.1)\r?$", raw, re.M)
+            path = request_line.group(3)
+            if path in self.failures:
+                status, body = self.failures[path]
+                parts.append(_response_part("resp", item, status, "Error", body))
+            else:
+                parts.append(_response_part("resp", item, 200, "OK", {"echo": request_line.group(1)}))
+        text = "\r\n".join(reversed(parts)) + "\r\n--resp--\r\n"
+        return httpx.Response(
+            200,
+            headers={"content-type": "multipart/mixed; boundary=resp"},
+            content=text.encode(),
+            request=httpx.Request("POST", url),
+        )
+
+
+@pytest.fixture
+def endpoint(monkeypatch):
+    fake = FakeBatchEndpoint()
+
+    async def no_auth(impersonate=None):
+        return {"Authorization": "Bearer test"}
+
+    monkeypatch.setattr(gc, "_auth_headers", no_auth)
+    monkeypatch.setattr(gc, "_ensure_cal_http", lambda: fake)
+    return fake
+
+
+def test_results_follow_request_order_by_content_id(endpoint):
+    ops = [CalOp("GET", f"/calendars/c{i}/events") for i in range(5)]
+    results = asyncio.run(gc.batch_calendar(ops))
+    # the fake answers in reverse; Content-ID puts every result back in its slot
+    assert [r["echo"] for r in results] == [f"GET /calendar/v3/calendars/c{i}/events HTTP/1.1" for i in range(5)]
+
+
+def test_request_body_carries_params_and_json(endpoint):
+    op = CalOp("POST", "/calendars/primary/events", params={"sendUpdates": "none", "skip": None}, body={"summary": "x"})
+    asyncio.run(gc.batch_calendar([op]))
+    body = endpoint.posts[0].decode()
+    assert "POST /calendar/v3/calendars/primary/events?sendUpdates=none HTTP/1.1" in body
+    assert "skip" not in body
+    assert '{"summary": "x"}' in body
+
+
+def test_failed_part_becomes_calendar_batch_error(endpoint):
+    endpoint.failures = {
+        "/calendar/v3/calendars/gone/events": (404, {"error": {"code": 404, "message": "Not Found"}}),
+        "/calendar/v3/calendars/empty/events": (500, None),
+    }
+    ops = [
+        CalOp("GET", "/calendars/ok/events"),
+        CalOp("GET", "/calendars/gone/events"),
+        CalOp("GET", "/calendars/empty/events"),
+    ]
+    ok, gone, empty = asyncio.run(gc.batch_calendar(ops))
+    assert ok["echo"].startswith("GET /calendar/v3/calendars/ok/events")
+    assert isinstance(gone, CalendarBatchError)
+    assert gone.status == 404
+    assert gone.body["error"]["message"] == "Not Found"
+    assert isinstance(empty, CalendarBatchError)
+    assert empty.status == 500
+
+
+def test_part_missing_from_response_is_an_error():
+    resp = httpx.Response(
+        200,
+        headers={"content-type": 'multipart/mixed; boundary="resp"'},
+        content=(_response_part("resp", 1, 200, "OK", {"id": "b"}) + "\r\n--resp--\r\n").encode(),
+    )
+    first, second = gc._parse_batch_response(resp, 2)
+    assert isinstance(first, CalendarBatchError)
+    assert first.status == 0
+    assert second == {"id": "b"}
+
+
+def test_chunks_at_batch_max(endpoint):
+    count = gc.CALENDAR_BATCH_MAX * 2 + 1
+    ops = [CalOp("GET", f"/calendars/c{i}/events") for i in range(count)]
+    results = asyncio.run(gc.batch_calendar(ops))
+    sizes = [post.decode().count("Content-Type: application/http") for post in endpoint.posts]
+    assert sizes == [gc.CALENDAR_BATCH_MAX, gc.CALENDAR_BATCH_MAX, 1]
+    assert len(results) == count
+    # Content-IDs restart per chunk, results still line up with the ops
+    assert results[-1]["echo"] == f"GET /calendar/v3/calendars/c{count - 1}/events HTTP/1.1"
+    assert results[gc.CALENDAR_BATCH_MAX]["echo"] == f"GET /calendar/v3/calendars/c{gc.CALENDAR_BATCH_MAX}/events HTTP/1.1"
+
+
+def test_batcher_close_fails_calls_still_waiting():
+    async def scenario():
+        batcher = gc.CalendarBatcher(window=10)
+        collecting = asyncio.create_task(batcher.submit("freebusy", CalOp("POST", "/freeBusy", body={})))
+        await asyncio.sleep(0)  # the worker picks it up and sleeps out the window
+        await asyncio.sleep(0)
+        # queued behind the collecting worker, never taken off the queue
+        queued = asyncio.create_task(batcher.submit("freebusy", CalOp("POST", "/freeBusy", body={})))
+        await asyncio.sleep(0)
+        await batcher.close()
+        return await asyncio.wait_for(
+            asyncio.gather(collecting, queued, return_exceptions=True), timeout=1
+        )
+
+    collecting, queued = asyncio.run(scenario())
+    assert isinstance(collecting, RuntimeError)
+    assert isinstance(queued, RuntimeError)
@@ -0,0 +1,117 @@
+# tests/test_calendar_slots.py
+"""
+Free-slot computation: the integer bitmask kernel (_slots_from_ints) and the
+compute_free_slots_from_freebusy wrapper around it.
+"""
+import calendar
+import random
+import time
+
+from app.google_calendar import _slots_from_ints, compute_free_slots_from_freebusy
+
+DAY = "2025-12-01"
+START = calendar.timegm((2025, 12, 1, 9, 0, 0))
+END = calendar.timegm((2025, 12, 1, 17, 0, 0))
+STEP = 30 * 60
+
+
+def at(hhmm):
+    h, m = hhmm.split(":")
+    return calendar.timegm((2025, 12, 1, int(h), int(m), 0))
+
+
+def hm(ts):
+    return time.strftime("%H:%M", time.gmtime(ts))
+
+
+def free(busy, start=START, end=END, step=STEP):
+    return [hm(t) for t in _slots_from_ints(busy, start, end, step)]
+
+
+def brute_force(busy, start, end, step):
+    """Reference: a slot is free when no busy interval overlaps [slot, slot + step)."""
+    out = []
+    t = start
+    while t + step <= end:
+        if not any(bs < t + step and be > t for bs, be in busy):
+            out.append(t)
+        t += step
+    return out
+
+
+def test_no_busy_gives_the_whole_grid():
+    slots = free([])
+    assert len(slots) == 16
+    assert slots[0] == "09:00" and slots[-1] == "16:30"
+
+
+def test_overlapping_and_unordered_intervals_merge():
+    busy = [(at("10:30"), at("11:30")), (at("10:00"), at("11:00")), (at("10:15"), at("10:45"))]
+    slots = free(busy)
+    assert "10:00" not in slots and "10:30" not in slots and "11:00" not in slots
+    assert "09:30" in slots and "11:30" in slots
+    assert len(slots) == 13
+
+
+def test_intervals_outside_the_window_are_ignored():
+    busy = [(at("06:00"), at("08:00")), (at("18:00"), at("19:00")), (at("08:00"), at("09:00")), (at("17:00"), at("18:00"))]
+    assert len(free(busy)) == 16
+
+
+def test_intervals_straddling_the_window_are_clipped():
+    busy = [(at("08:00"), at("09:15")), (at("16:45"), at("20:00"))]
+    slots = free(busy)
+    assert slots[0] == "09:30"
+    assert slots[-1] == "16:00"
+    assert len(slots) == 14
+
+
+def test_off_grid_busy_blocks_every_slot_it_touches():
+    assert "10:00" not in free([(at("10:10"), at("10:20"))])
+    slots = free([(at("10:29"), at("10:31"))])
+    assert "10:00" not in slots and "10:30" not in slots
+
+
+def test_busy_touching_a_slot_edge_does_not_block_it():
+    slots = free([(at("10:00"), at("11:00"))])
+    assert "09:30" in slots and "11:00" in slots
+    assert "10:00" not in slots and "10:30" not in slots
+
+
+def test_window_not_a_multiple_of_step_drops_the_partial_slot():
+    step = 45 * 60
+    slots = free([], step=step)
+    assert len(slots) == 10
+    assert slots[-1] == "15:45"
+
+
+def test_matches_brute_force_on_random_busy_sets():
+    rng = random.Random(1234)
+    for _ in range(200):
+        step = rng.choice([15, 20, 30, 45, 60]) * 60
+        busy = []
+        for _ in range(rng.randint(0, 8)):
+            bs = START + rng.randint(-3 * 3600, 9 * 3600)
+            busy.append((bs, bs + rng.randint(1, 3 * 3600)))
+        assert _slots_from_ints(busy, START, END, step) == brute_force(busy, START, END, step)
+
+
+def test_compute_free_slots_from_freebusy_unions_calendars():
+    resp = {
+        "calendars": {
+            "a": {"busy": [{"start": f"{DAY}T09:00:00Z", "end": f"{DAY}T10:00:00Z"}]},
+            "b": {"busy": [
+                {"start": f"{DAY}T09:30:00+00:00", "end": f"{DAY}T10:30:00+00:00"},
+                {"start": "not-a-time", "end": f"{DAY}T12:00:00Z"},
+                {"start": f"{DAY}T11:00:00Z"},
+            ]},
+        }
+    }
+    slots = compute_free_slots_from_freebusy(resp, DAY, duration_minutes=30)
+    assert slots[0] == {"start": f"{DAY}T10:30:00Z", "end": f"{DAY}T11:00:00Z"}
+    assert len(slots) == 13
+    assert slots[-1] == {"start": f"{DAY}T16:30:00Z", "end": f"{DAY}T17:00:00Z"}
+
+
+def test_compute_free_slots_rejects_non_positive_duration():
+    assert compute_free_slots_from_freebusy({}, DAY, duration_minutes=0) == []